@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+hop2 benchmark suite.
+
+Generates synthetic databases (10, 1k, 100k and 1M aliases by default) in
+throwaway HOME directories and times hop2 end to end: process startup, alias
+resolution and completion both cold (a fresh process per run, as from the
+shell) and warm (repeated calls in one process), list, find, backup/restore
+and hops from N parallel processes. Everything runs offline with the
+standard library.
+
+    python3 benchmarks/bench.py --out results.json
+    python3 benchmarks/bench.py --sizes 10,1000 --compare results.json
+
+--compare exits with status 1 when a timing's p50 regressed by more than
+--threshold against the baseline report.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HOP2 = os.path.join(HERE, os.pardir, "hop2.py")
+
+# Timings whose p50 moves less than this (ms) are never flagged as regressions
+NOISE_FLOOR_MS = 0.5
+# Bare interpreter startup: shows how noisy the machine is, never a regression
+REFERENCE_TIMINGS = {"startup_python"}
+
+
+def percentiles(samples):
+    """p50/p95/p99 (nearest rank), mean and max of *samples*, in milliseconds."""
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+    return {
+        "runs": len(ordered),
+        "p50": round(rank(50), 3),
+        "p95": round(rank(95), 3),
+        "p99": round(rank(99), 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def launcher(hop2, *args):
+    """argv running hop2 the way install.sh's launcher does: imported, so
+    its bytecode is cached rather than the script being recompiled."""
+    code = (f"import sys; sys.path.insert(0, {os.path.dirname(hop2)!r}); "
+            "from hop2 import main; main()")
+    return [sys.executable, "-c", code, *args]
+
+
+def generate(home, hop2, size, seed=0):
+    """A hop2 database in *home* with *size* aliases, 80% directories."""
+    env = dict(os.environ, HOME=home)
+    # Let hop2 create and migrate the schema itself
+    subprocess.run(launcher(hop2, "list", "--limit", "0"), env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    rng = random.Random(seed)
+    now = int(time.time())
+    target = os.path.join(home, "work")
+    os.makedirs(target, exist_ok=True)
+    n_dirs = max(1, size * 4 // 5)
+    conn = sqlite3.connect(os.path.join(home, ".hop2", "hop2.db"))
+    with conn:
+        conn.executemany(
+            "INSERT INTO directories (alias, path, created_at, uses, last_used) VALUES (?, ?, ?, ?, ?)",
+            ((f"d{i}", target if i == 0 else f"/srv/project{i % 997}/module{i}", None,
+              rng.randint(0, 500), now - rng.randint(0, 30 * 86400)) for i in range(n_dirs)))
+        conn.executemany(
+            "INSERT INTO commands (alias, command, created_at, uses, last_used) VALUES (?, ?, ?, ?, ?)",
+            ((f"c{i}", f"echo command {i}", None, rng.randint(0, 500), now - rng.randint(0, 30 * 86400))
+             for i in range(size - n_dirs)))
+    conn.close()
+    # Adding one more alias regenerates the shell table and completion cache
+    subprocess.run(launcher(hop2, "add", "bench", target), env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    return n_dirs
+
+
+def time_process(argv, env, runs):
+    """Wall time of *runs* fresh processes, in milliseconds."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def time_parallel(argv_for, env, procs, rounds):
+    """Per-process wall time when *procs* hops start at once, *rounds* times."""
+    samples = []
+    for r in range(rounds):
+        started = time.perf_counter()
+        running = [subprocess.Popen(argv_for(r * procs + i), env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                   for i in range(procs)]
+        for p in running:
+            p.wait()
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def worker(args):
+    """`bench.py --worker`: time hop2 functions in-process for one HOME.
+
+    Runs in its own process because hop2 reads HOME when it is imported.
+    """
+    import contextlib
+    import io
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.hop2)))
+    import hop2
+
+    rng = random.Random(1)
+    n_dirs = args.dirs
+    devnull = io.StringIO()
+    results = {}
+
+    def run(name, func, runs):
+        samples = []
+        for _ in range(runs):
+            devnull.seek(0)
+            devnull.truncate()
+            with contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                func()
+                samples.append((time.perf_counter() - started) * 1000)
+        results[name] = samples
+
+    os.environ["HOP2_SHELL"] = "1"
+    run("hop_warm", lambda: hop2.resolve_alias(f"d{rng.randrange(n_dirs)}", []), args.runs)
+    run("complete_warm", lambda: hop2.complete([f"d{rng.randrange(n_dirs)}"[:3]]), args.runs)
+    run("list", hop2.list_all, args.heavy_runs)
+    run("list_top", lambda: hop2.list_all(top=20), args.runs)
+    run("find", lambda: hop2.find_shortcuts(f"module{rng.randrange(n_dirs)}"), args.runs)
+
+    backup = os.path.join(os.environ["HOME"], "bench.ndjson")
+    run("backup", lambda: hop2.backup_data(backup, "ndjson"), args.heavy_runs)
+    run("restore", lambda: hop2.restore_data(backup, assume_yes=True), args.heavy_runs)
+    json.dump(results, sys.stdout)
+    return 0
+
+
+def bench_size(hop2, size, runs, procs):
+    """All timings for one database size, as {name: percentiles}."""
+    home = tempfile.mkdtemp(prefix=f"hop2-bench-{size}-")
+    try:
+        started = time.perf_counter()
+        n_dirs = generate(home, hop2, size)
+        print(f"  generated {size} aliases in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        env = dict(os.environ, HOME=home, HOP2_SHELL="1")
+        # Full listings and backup/restore scale with the table size
+        heavy = max(3, runs // max(1, size // 1000))
+        rng = random.Random(2)
+        samples = {
+            "startup_python": time_process([sys.executable, "-c", "pass"], env, runs),
+            "startup": time_process(launcher(hop2, "--help"), env, runs),
+            "hop_cold": time_process(launcher(hop2, f"d{rng.randrange(n_dirs)}"), env, runs),
+            "hop_cold_cmd": time_process(launcher(hop2, "c0"), env, runs) if size > n_dirs else None,
+            "complete_cold": time_process(launcher(hop2, "__complete", "d1"), env, runs),
+            "hop_parallel": time_parallel(lambda i: launcher(hop2, f"d{(i * 7919) % n_dirs}"),
+                                          env, procs, max(3, runs // 4)),
+        }
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--hop2", hop2, "--dirs", str(n_dirs),
+             "--runs", str(runs), "--heavy-runs", str(heavy)],
+            env=env, stdout=subprocess.PIPE, check=True).stdout
+        samples.update(json.loads(out))
+        return {name: percentiles(s) for name, s in samples.items() if s}
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def compare(report, baseline, threshold):
+    """Print p50 changes against *baseline*. Returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'size':>8}  {'timing':<16} {'base p50':>10} {'now p50':>10} {'change':>8}")
+    print("─" * 58)
+    for size, timings in report["results"].items():
+        for name, now in timings.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            change = (now["p50"] - base["p50"]) / base["p50"] if base["p50"] else 0.0
+            flag = ""
+            if name in REFERENCE_TIMINGS:
+                flag = "  (reference)"
+            elif change > threshold and now["p50"] - base["p50"] > NOISE_FLOOR_MS:
+                regressions += 1
+                flag = "  ❌ regression"
+            elif change < -threshold and base["p50"] - now["p50"] > NOISE_FLOOR_MS:
+                flag = "  ✅ faster"
+            print(f"{size:>8}  {name:<16} {base['p50']:>10.2f} {now['p50']:>10.2f} {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hop2 at several database sizes.")
+    parser.add_argument("--sizes", default="10,1000,100000,1000000",
+                        help="comma-separated alias counts (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=30, help="samples per timing (default: %(default)s)")
+    parser.add_argument("--procs", type=int, default=8, help="parallel hops (default: %(default)s)")
+    parser.add_argument("--hop2", default=DEFAULT_HOP2, help="hop2.py to benchmark")
+    parser.add_argument("--out", metavar="FILE", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved report")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative p50 slowdown counted as a regression (default: %(default)s)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--dirs", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--heavy-runs", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.hop2 = os.path.abspath(args.hop2)
+
+    if args.worker:
+        return worker(args)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "unit": "ms",
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"⏱  {size} aliases", file=sys.stderr)
+        report["results"][str(size)] = bench_size(args.hop2, size, args.runs, args.procs)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"✅ Report saved to: {args.out}", file=sys.stderr)
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {regressions} regression{'s' if regressions != 1 else ''} "
+                  f"(p50 more than {args.threshold:.0%} slower)")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+hop2 contention stress test.
+
+Fires hundreds of hop2 processes at once against one database in a
+throwaway HOME: hops, `add`, `cmd` and `list` mixed together, starting on
+a database that does not exist yet so the migrations race as well. Fails
+(exit status 1) if any process fails, mentions "database is locked", or if
+an add or a hop went missing.
+
+    python3 benchmarks/stress.py
+    python3 benchmarks/stress.py --procs 500 --parallel 200
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from bench import DEFAULT_HOP2, launcher  # noqa: E402
+
+
+def plan(procs, root, seed=0):
+    """[(kind, argv tail)] for *procs* processes, about a third each of
+    adds (of directories below *root*), cmds and hops, plus an occasional list."""
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(procs):
+        roll = rng.random()
+        if roll < 0.3:
+            jobs.append(("add", ["add", f"d{i}", os.path.join(root, f"d{i}")]))
+        elif roll < 0.6:
+            jobs.append(("cmd", ["cmd", f"c{i}", "echo", str(i)]))
+        elif roll < 0.95:
+            jobs.append(("hop", [rng.choice(["base", "cbase"])]))
+        else:
+            jobs.append(("list", ["list", "--limit", "1"]))
+    return jobs
+
+
+def run(hop2, jobs, parallel, env):
+    """Run *jobs*, at most *parallel* at a time. Returns [(kind, argv, exit
+    code, stderr and stdout)] of the failed ones."""
+    failures = []
+    running = []
+    pending = list(jobs)
+    while pending or running:
+        while pending and len(running) < parallel:
+            kind, args = pending.pop(0)
+            proc = subprocess.Popen(launcher(hop2, *args), env=env, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            running.append((kind, args, proc))
+        kind, args, proc = running.pop(0)
+        out = proc.communicate()[0].decode("utf-8", "replace")
+        if proc.returncode != 0 or "locked" in out or "Traceback" in out:
+            failures.append((kind, args, proc.returncode, out))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer one hop2 database from many processes.")
+    parser.add_argument("--procs", type=int, default=400, help="processes in all (default: %(default)s)")
+    parser.add_argument("--parallel", type=int, default=120,
+                        help="processes running at once (default: %(default)s)")
+    parser.add_argument("--hop2", default=DEFAULT_HOP2, help="hop2.py to test")
+    args = parser.parse_args()
+    hop2 = os.path.abspath(args.hop2)
+
+    home = tempfile.mkdtemp(prefix="hop2-stress-")
+    try:
+        env = dict(os.environ, HOME=home, HOP2_SHELL="1")
+        env.pop("HOP2_PROFILE", None)
+        # Shells opening a database that does not exist yet race to create it
+        failures = run(hop2, [("list", ["list", "--limit", "1"])] * 50, 50, env)
+        # The hops need their targets; they race the adds of everything else
+        setup = [("add", ["add", "base", "/tmp"]), ("cmd", ["cmd", "cbase", "true"])]
+        failures += run(hop2, setup, len(setup), env)
+        jobs = plan(args.procs, home)
+        for kind, a in jobs:
+            if kind == "add":
+                os.mkdir(a[2])
+        print(f"⏱  {len(jobs)} processes, {args.parallel} at a time, in {home}", file=sys.stderr)
+        started = time.perf_counter()
+        failures += run(hop2, jobs, args.parallel, env)
+        elapsed = time.perf_counter() - started
+
+        # A last list folds usage.log, so every hop is counted
+        failures += run(hop2, [("list", ["list", "--limit", "1"])], 1, env)
+        conn = sqlite3.connect(os.path.join(home, ".hop2", "hop2.db"))
+        try:
+            dirs = {r[0] for r in conn.execute("SELECT alias FROM directories")}
+            cmds = {r[0] for r in conn.execute("SELECT alias FROM commands")}
+            uses = conn.execute("SELECT (SELECT uses FROM directories WHERE alias = 'base') + "
+                                "(SELECT uses FROM commands WHERE alias = 'cbase')").fetchone()[0]
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    problems = [f"{' '.join(a)}: exit {code}\n    {out.strip()[-300:]}" for _, a, code, out in failures]
+    want_dirs = {a[1] for kind, a in setup + jobs if kind == "add"}
+    want_cmds = {a[1] for kind, a in setup + jobs if kind == "cmd"}
+    hops = sum(1 for kind, _ in jobs if kind == "hop")
+    if want_dirs - dirs:
+        problems.append(f"{len(want_dirs - dirs)} directory aliases missing")
+    if want_cmds - cmds:
+        problems.append(f"{len(want_cmds - cmds)} command aliases missing")
+    if uses != hops:
+        problems.append(f"{hops} hops but {uses} uses counted")
+
+    print(f"{len(jobs)} processes in {elapsed:.1f}s: {len(dirs)} dirs, {len(cmds)} cmds, "
+          f"{uses} of {hops} hops counted")
+    if problems:
+        for p in problems:
+            print(f"❌ {p}")
+        return 1
+    print("✅ No failures")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
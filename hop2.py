@@ -2,27 +2,50 @@
 """
 hop2 - Quick directory and command aliasing for the terminal
 """
+# Only the modules needed to resolve an alias are imported here; everything
+# else is imported inside the function that needs it so `hop2 <alias>` stays
+# close to bare interpreter startup.
 import os
 import sys
+
+# HOP2_PROFILE=1 (or a trace file path) records phase timestamps; see _mark().
+# Taken before the sqlite3 import so that import is part of the first phase.
+_PROFILE = os.environ.get("HOP2_PROFILE") or None
+_PROFILE_MARKS = []
+if _PROFILE:
+    from time import perf_counter as _perf_counter, time as _wall_time
+    _PROFILE_MARKS.append(("start", _perf_counter(), _wall_time()))
+
 import sqlite3
-import subprocess
-import argparse
-from datetime import datetime, timezone
-from contextlib import contextmanager
-from pathlib import Path
-import urllib.request
-import tempfile
-import shutil
-import json
+from datetime import datetime, timezone  # already loaded by sqlite3
 
 # Config
 DB_PATH = os.path.expanduser("~/.hop2/hop2.db")
 DB_DIR = os.path.dirname(DB_PATH)
+DAEMON_SOCK = os.path.join(DB_DIR, "hop2.sock")
+SHELL_TABLE = os.path.join(DB_DIR, "aliases.sh")
+USAGE_LOG = os.path.join(DB_DIR, "usage.log")
+RUNS_LOG = os.path.join(DB_DIR, "runs.log")
+COMPLETION_CACHE = os.path.join(DB_DIR, "completions")
+SNAPSHOT_DIR = os.path.join(DB_DIR, "snapshots")
+VISITS_DIR = os.path.join(DB_DIR, "visits.d")
+PROFILE_LOG = os.path.join(DB_DIR, "profile.jsonl")
+USAGE_FOLD_BYTES = 64 * 1024  # fold usage.log into the database past this size
 
 # Reserved words
 RESERVED_ALIASES = [
-    'add', 'cmd', 'list', 'rm', 'go',
-    'help', '--help', '-h'
+    'add', 'cmd', 'list', 'rm', 'go', 'find', 'doctor', 'suggest', 'profile',
+    'import', 'snapshot', 'sync', 'each', 'stats', 'allow', 'deny', 'help', '--help', '-h'
+]
+
+# Sub-commands handled by argparse; any other first argument is an alias
+SUBCOMMANDS = {'add', 'cmd', 'list', 'ls', 'rm', 'find', 'doctor', 'suggest', 'profile', 'import',
+               'snapshot', 'sync', 'each', 'stats', 'allow', 'deny'}
+
+# First-word completions besides the aliases themselves
+COMPLETION_WORDS = [
+    'add', 'cmd', 'list', 'ls', 'rm', 'go', 'find', 'doctor', 'suggest', 'profile',
+    'import', 'snapshot', 'sync', 'each', 'stats', 'allow', 'deny', '--profile', '--fresh', '--backup', '--restore', '--batch', '--daemon', '--update', '--uninstall', '--help'
 ]
 
 
@@ -36,379 +59,4126 @@ def print_help():
     print("─" * 50)
     print(f"{'  add <alias> [path]':<25} Add directory shortcut")
     print(f"{'  cmd <alias> <command>':<25} Add command shortcut")
+    print(f"{'    --cache TTL':<25} Reuse its output for TTL (30s, 5m, 1h)")
+    print(f"{'    --watch FILE':<25} ... unless FILE changed")
+    print(f"{'  cmd <alias> --step S ...':<25} Run command aliases as a graph (S:DEP,...)")
     print(f"{'  list, ls':<25} List all shortcuts")
+    print(f"{'    --dirs / --cmds':<25} Only one kind")
+    print(f"{'    --under <path>':<25} Only directories below path")
+    print(f"{'    --top N':<25} N most used")
+    print(f"{'    --limit/--offset N':<25} Page through the list")
+    print(f"{'    --json / --tsv':<25} Machine-readable output")
+    print(f"{'  find <text>':<25} Search aliases, paths and commands")
+    print(f"{'  doctor [--fix|--prune]':<25} Check that saved directories exist")
+    print(f"{'  suggest':<25} Aliases for often visited dirs (HOP2_LEARN=1)")
+    print(f"{'  profile [report|clear]':<25} Phase timings from --profile runs")
+    print(f"{'  stats [alias]':<25} Run times and failures of command aliases")
+    print(f"{'    --days N':<25} Over the last N days (default: 30)")
     print(f"{'  rm <alias>':<25} Remove a shortcut")
-    print(f"{'  --backup [file]':<25} Backup shortcuts to JSON")
-    print(f"{'  --restore <file>':<25} Restore from JSON backup")
+    print(f"{'  allow/deny [file]':<25} Trust a project's .hop2.toml/.json, or not")
+    print(f"{'  each <cmd> <dirs...>':<25} Run a command in many dirs in parallel")
+    print(f"{'    --under <path>':<25} Every directory below path")
+    print(f"{'    -j N':<25} N at a time (default: CPU count)")
+    print(f"{'    --buffer/--fail-fast':<25} Whole output per dir / stop at first failure")
+    print(f"{'  import --from F <file>':<25} Import from zoxide/autojump/z/aliases")
+    print(f"{'  snapshot [list|restore]':<25} Compressed database snapshots")
+    print(f"{'  sync [dir]':<25} Merge with other devices via a shared dir")
+    print(f"{'  --backup [file]':<25} Backup shortcuts (.json, or .ndjson)")
+    print(f"{'  --restore <file> [-y]':<25} Restore from JSON/NDJSON backup")
+    print(f"{'  --batch [file|-]':<25} Apply add/cmd/rm lines in one transaction")
+    print(f"{'    --dry-run':<25} Only check and report")
+    print(f"{'  --profile <args>':<25} Time each phase of one run")
+    print(f"{'  --fresh <alias>':<25} Ignore a cached command result")
     print(f"{'  --update':<25} Update hop2 to latest")
+    print(f"{'  --daemon [stop|status]':<25} Run the background resolver")
     print(f"{'  --uninstall':<25} Remove hop2 completely")
     print("\nExamples:")
     print("  hop2 add work          # Save current dir as 'work'")
     print("  hop2 work              # Jump to work directory")
     print("  hop2 cmd gs 'git status'")
     print("  hop2 gs                # Run git status")
+    print("  hop2 find api          # Shortcuts mentioning 'api'")
     print("  hop2 --backup          # Backup to timestamped file")
     print("  hop2 --restore backup.json  # Restore from backup")
     print()
     sys.exit(0)
 
 
-@contextmanager
+# Each entry upgrades the schema by one version (tracked in PRAGMA
+# user_version). Never edit a released entry; append a new one instead.
+# A step is an SQL string or a callable taking the connection.
+MIGRATIONS = [
+    # 1: the original tables (IF NOT EXISTS adopts pre-versioning databases)
+    [
+        """CREATE TABLE IF NOT EXISTS directories
+           (
+               alias      TEXT PRIMARY KEY,
+               path       TEXT NOT NULL,
+               created_at TEXT,
+               uses       INTEGER DEFAULT 0
+           )""",
+        """CREATE TABLE IF NOT EXISTS commands
+           (
+               alias      TEXT PRIMARY KEY,
+               command    TEXT NOT NULL,
+               created_at TEXT,
+               uses       INTEGER DEFAULT 0
+           )""",
+    ],
+    # 2: last hop time (epoch seconds) for frecency ranking
+    [
+        "ALTER TABLE directories ADD COLUMN last_used INTEGER",
+        "ALTER TABLE commands ADD COLUMN last_used INTEGER",
+    ],
+    # 3: indexes for `list --under/--top` and the `find` search index
+    [
+        "CREATE INDEX IF NOT EXISTS directories_path ON directories(path)",
+        "CREATE INDEX IF NOT EXISTS directories_uses ON directories(uses)",
+        "CREATE INDEX IF NOT EXISTS commands_uses ON commands(uses)",
+        lambda conn: _create_search_index(conn),
+    ],
+    # 4: directories learned from cd (HOP2_LEARN), scored like zoxide
+    [
+        """CREATE TABLE IF NOT EXISTS visits
+           (
+               path       TEXT PRIMARY KEY,
+               score      REAL NOT NULL DEFAULT 0,
+               last_visit INTEGER
+           )""",
+        "CREATE INDEX IF NOT EXISTS visits_score ON visits(score)",
+    ],
+    # 5: operation log and merge state for `hop2 sync`
+    [
+        """CREATE TABLE IF NOT EXISTS sync_ops
+           (
+               seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+               ts    INTEGER NOT NULL,
+               op    TEXT NOT NULL,
+               kind  TEXT NOT NULL,
+               alias TEXT NOT NULL,
+               value TEXT,
+               n     INTEGER
+           )""",
+        """CREATE TABLE IF NOT EXISTS sync_clock
+           (
+               kind   TEXT NOT NULL,
+               alias  TEXT NOT NULL,
+               ts     INTEGER NOT NULL,
+               device TEXT NOT NULL,
+               PRIMARY KEY (kind, alias)
+           )""",
+        """CREATE TABLE IF NOT EXISTS sync_dirs
+           (
+               dir  TEXT PRIMARY KEY,
+               sent INTEGER NOT NULL,
+               size INTEGER NOT NULL
+           )""",
+        """CREATE TABLE IF NOT EXISTS sync_peers
+           (
+               dir     TEXT NOT NULL,
+               device  TEXT NOT NULL,
+               file_id TEXT NOT NULL,
+               pos     INTEGER NOT NULL,
+               PRIMARY KEY (dir, device)
+           )""",
+        lambda conn: _create_sync_triggers(conn),
+    ],
+    # 6: result caching for command aliases (`hop2 cmd --cache TTL --watch FILE`)
+    [
+        "ALTER TABLE commands ADD COLUMN cache_ttl INTEGER",
+        "ALTER TABLE commands ADD COLUMN cache_watch TEXT",
+    ],
+    # 7: subdirectory index for `hop2 alias/sub/path` and its completion
+    [
+        """CREATE TABLE IF NOT EXISTS subdirs
+           (
+               root  TEXT NOT NULL,
+               rel   TEXT NOT NULL,
+               mtime INTEGER NOT NULL,
+               PRIMARY KEY (root, rel)
+           ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS subdir_roots
+           (
+               root       TEXT PRIMARY KEY,
+               indexed_at INTEGER NOT NULL
+           )""",
+    ],
+    # 8: composite command aliases (`hop2 cmd ci --step lint --step build:lint`)
+    [
+        "ALTER TABLE commands ADD COLUMN steps TEXT",
+    ],
+    # 9: run history of command aliases for `hop2 stats` (times in epoch ms)
+    [
+        """CREATE TABLE IF NOT EXISTS runs
+           (
+               alias    TEXT NOT NULL,
+               started  INTEGER NOT NULL,
+               duration INTEGER NOT NULL,
+               code     INTEGER NOT NULL,
+               cwd      TEXT,
+               n        INTEGER NOT NULL DEFAULT 1
+           )""",
+        "CREATE INDEX IF NOT EXISTS runs_alias ON runs(alias, started)",
+        "CREATE INDEX IF NOT EXISTS runs_started ON runs(started)",
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# How long a connection waits on another shell's write lock before failing
+BUSY_TIMEOUT = 10.0
+
+
+def _connect():
+    """Open a read/write connection whose writes take the lock up front."""
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    # BEGIN IMMEDIATE waits in the busy handler instead of failing when a
+    # deferred read transaction later needs to become a write.
+    conn.isolation_level = "IMMEDIATE"
+    conn.execute("PRAGMA synchronous = NORMAL")  # safe with WAL, skips an fsync per commit
+    _mark("connect")
+    return conn
+
+
+class _Conn:
+    """Connection context manager (a class so contextlib stays off the hop path)."""
+
+    def __enter__(self):
+        os.makedirs(DB_DIR, exist_ok=True)
+        self.conn = _connect()
+        self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.commit()
+        self.conn.close()
+        _mark("commit")
+        return False
+
+
 def get_conn():
+    return _Conn()
+
+
+def _retry_locked(func, attempts=5):
+    """Call func(), retrying with backoff while the database stays locked."""
+    import time
+    for attempt in range(attempts):
+        try:
+            return func()
+        except sqlite3.OperationalError as e:
+            if ("locked" not in str(e) and "busy" not in str(e)) or attempt == attempts - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def init_db():
+    """Create or migrate the database. Costs a single PRAGMA read once current."""
     os.makedirs(DB_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        def migrate():
+            # WAL lets every shell read while one of them writes
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for steps in MIGRATIONS[version:]:
+                    for statement in steps:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        _retry_locked(migrate)
+    finally:
+        conn.close()
+        _mark("init_db")
+
+
+def _create_search_index(conn):
+    """Build the `search` FTS5 trigram index, kept in sync by triggers.
+
+    Its rowid is the source rowid * 2, plus 1 for commands. Without FTS5 or
+    the trigram tokenizer (SQLite < 3.34) nothing is created and `find`
+    falls back to LIKE scans.
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE search USING fts5(alias, target, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return
+    for table, column, tag in (("directories", "path", 0), ("commands", "command", 1)):
+        key = f"rowid * 2 + {tag}"
+        # The DELETE clears any entry left under a reused rowid: rows that
+        # INSERT OR REPLACE removes skip the delete trigger
+        conn.execute(f"""CREATE TRIGGER {table}_search_ai AFTER INSERT ON {table} BEGIN
+                           DELETE FROM search WHERE rowid = new.{key};
+                           INSERT INTO search(rowid, alias, target) VALUES (new.{key}, new.alias, new.{column});
+                         END""")
+        conn.execute(f"""CREATE TRIGGER {table}_search_au AFTER UPDATE OF alias, {column} ON {table}
+                         WHEN old.alias IS NOT new.alias OR old.{column} IS NOT new.{column} BEGIN
+                           UPDATE search SET alias = new.alias, target = new.{column} WHERE rowid = new.{key};
+                         END""")
+        conn.execute(f"""CREATE TRIGGER {table}_search_ad AFTER DELETE ON {table} BEGIN
+                           DELETE FROM search WHERE rowid = old.{key};
+                         END""")
+        conn.execute(f"INSERT INTO search(rowid, alias, target) SELECT {key}, alias, {column} FROM {table}")
+
+
+def _on_db_change():
+    """Called after every write to the alias tables."""
+    _write_alias_files()
+    _schedule_reindex(force=True)
+    _daemon_request("invalidate")
+    _auto_snapshot()
+    _mark("on_db_change")
+
+
+def _sh_quote(value):
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def _write_atomic(path, text):
+    """Replace *path* with *text* (str or bytes) so readers never see a half-written file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with (open(tmp, "wb") if isinstance(text, bytes) else open(tmp, "w", encoding="utf-8")) as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _write_alias_files():
+    """Regenerate the files the shell integration reads instead of starting Python.
+
+    aliases.sh is the alias table init.sh resolves hops from; its first line
+    carries a generation stamp and init.sh re-sources it whenever the stamp
+    changes. completions is the sorted list of every alias, one per line.
+    """
+    import time
+
+    conn = _connect_ro()
+    try:
+        dirs = conn.execute("SELECT alias, path FROM directories ORDER BY alias").fetchall()
+        cmds = conn.execute("SELECT alias, command FROM commands ORDER BY alias").fetchall()
+        # Cacheable and composite commands need hop2 itself, with its output going straight to the terminal
+        direct = [r[0] for r in conn.execute(
+            "SELECT alias FROM commands WHERE cache_ttl OR steps IS NOT NULL ORDER BY alias")]
+    finally:
+        conn.close()
+
+    aliases = sorted({a for a, _ in dirs} | {a for a, _ in cmds})
+    _write_atomic(COMPLETION_CACHE, "".join(f"{a}\n" for a in aliases))
+    if sys.platform == 'win32':
+        return
+
+    # Sub-command names always go to hop2 itself
+    dirs = [(a, p) for a, p in dirs if a not in SUBCOMMANDS]
+    skip = SUBCOMMANDS.union(direct)
+    cmds = [(a, c) for a, c in cmds if a not in skip]
+    q = _sh_quote
+    lines = [
+        f"# hop2 alias table {time.time_ns()}",
+        "# Generated by hop2 whenever shortcuts change; do not edit.",
+        'if [ -n "$ZSH_VERSION" ]; then',
+        "    typeset -gA __HOP2_DIRS __HOP2_CMDS __HOP2_DIRECT",
+        "    __HOP2_DIRS=(",
+        *(f"        {q(a)} {q(p)}" for a, p in dirs),
+        "    )",
+        "    __HOP2_CMDS=(",
+        *(f"        {q(a)} {q(c)}" for a, c in cmds),
+        "    )",
+        "    __HOP2_DIRECT=(",
+        *(f"        {q(a)} 1" for a in direct),
+        "    )",
+        "else",
+        "    declare -gA __HOP2_DIRS=(",
+        *(f"        [{q(a)}]={q(p)}" for a, p in dirs),
+        "    )",
+        "    declare -gA __HOP2_CMDS=(",
+        *(f"        [{q(a)}]={q(c)}" for a, c in cmds),
+        "    )",
+        "    declare -gA __HOP2_DIRECT=(",
+        *(f"        [{q(a)}]=1" for a in direct),
+        "    )",
+        "fi",
+    ]
+    _write_atomic(SHELL_TABLE, "\n".join(lines) + "\n")
+
+
+def _append_log(path, text):
+    """Append *text* to the log at *path*. Returns the log's size after.
+
+    Appends hold a lock on the log, and _drain_log takes it before its last
+    read: a writer that opened the log just before a fold renamed it either
+    finishes first or finds it unlinked and starts a new one.
+    """
+    while True:
+        with open(path, "a", encoding="utf-8") as f:
+            if hasattr(os, "lockf"):  # not on Windows
+                os.lockf(f.fileno(), os.F_LOCK, 0)
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    continue  # folded already
+            f.write(text)
+            f.flush()  # before close() drops the lock
+            return f.tell()
+
+
+def _drain_log(pending):
+    """Yield batches of lines from a log renamed to *pending*, then unlink it.
+
+    The unlink happens under the lock, before the caller commits, so no
+    other fold reads the file again and no write to it goes missing.
+    """
+    with open(pending, "r+", encoding="utf-8", errors="replace") as f:
+        if hasattr(os, "lockf"):
+            os.lockf(f.fileno(), os.F_LOCK, 0)
+        lines = f.readlines()
+        while lines:
+            yield lines
+            # init.sh appends without the lock: take its late lines too
+            lines = f.readlines()
+        os.unlink(pending)
+
+
+def _fold_usage(conn):
+    """Fold hops appended to usage.log (by init.sh or _record_use) into the database.
+
+    Each line is "d|c<TAB>alias<TAB>epoch-seconds"; the counts go to uses and
+    the newest time to last_used. The log is renamed before it is read so
+    shells can keep appending while we fold.
+    """
+    pending = USAGE_LOG + ".folding"
+    if not os.path.exists(USAGE_LOG) and not os.path.exists(pending):
+        return
+    # Folds take turns under the write lock; two at once would both count
+    # the same .folding file
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    if not os.path.exists(pending):
+        try:
+            os.replace(USAGE_LOG, pending)
+        except OSError:
+            conn.commit()
+            return
+    c = conn.cursor()
+    for lines in _drain_log(pending):
+        counts = {}
+        for line in lines:
+            kind, _, rest = line.rstrip("\n").partition("\t")
+            alias, _, stamp = rest.partition("\t")
+            if not alias or kind not in ("d", "c"):
+                continue
+            n, last = counts.get((kind, alias), (0, 0))
+            counts[kind, alias] = (n + 1, max(last, int(stamp) if stamp.isdigit() else 0))
+        c.executemany("UPDATE directories SET uses = uses + ?, last_used = MAX(COALESCE(last_used, 0), ?) "
+                      "WHERE alias = ?", [(n, t, a) for (k, a), (n, t) in counts.items() if k == "d"])
+        c.executemany("UPDATE commands SET uses = uses + ?, last_used = MAX(COALESCE(last_used, 0), ?) "
+                      "WHERE alias = ?", [(n, t, a) for (k, a), (n, t) in counts.items() if k == "c"])
+    conn.commit()
+    _mark("fold_usage")
+
+
+def _save_directory(c, alias, path=None):
+    """Validate and save a directory shortcut on cursor *c*.
+
+    Returns the status line; raises ValueError with the error message.
+    """
+    if alias in RESERVED_ALIASES:
+        raise ValueError(f"'{alias}' is a reserved keyword and cannot be used.")
+
+    if path is None:
+        path = os.getcwd()
+    else:
+        path = os.path.abspath(os.path.expanduser(path))
+
+    if not os.path.exists(path):
+        raise ValueError(f"Path does not exist: {path}")
+
+    created = datetime.now(timezone.utc).isoformat()
+    try:
+        c.execute(
+            "INSERT INTO directories (alias, path, created_at) VALUES (?, ?, ?)",
+            (alias, path, created)
+        )
+        return f"Created: {alias} → {path}"
+    except sqlite3.IntegrityError:
+        c.execute(
+            "UPDATE directories SET path = ? WHERE alias = ?", (path, alias)
+        )
+        return f"Updated: {alias} → {path}"
+
+
+def _save_command(c, alias, command, cache=None, watch=(), steps=()):
+    """Validate and save a command shortcut on cursor *c*, like _save_directory.
+
+    With *steps* (NAME[:DEP,...] specs) the alias is composite and *command*
+    must be empty; a serial equivalent is stored as its command.
+    """
+    if alias in RESERVED_ALIASES:
+        raise ValueError(f"'{alias}' is a reserved keyword and cannot be used.")
+    cache_ttl = None
+    if cache:
+        try:
+            cache_ttl = _parse_ttl(cache)
+        except ValueError:
+            raise ValueError(f"Invalid cache TTL '{cache}'. Use seconds or e.g. 30s, 5m, 2h, 1d.") from None
+    elif watch:
+        raise ValueError("--watch needs --cache TTL.")
+    cache_watch = "\n".join(watch) or None
+
+    steps_text = None
+    if steps:
+        if command:
+            raise ValueError("Give either a command or --step options, not both.")
+        if cache_ttl:
+            raise ValueError("--cache does not apply to composite aliases; cache their steps instead.")
+        graph = _parse_steps(steps)
+        _check_steps(c, alias, graph)
+        steps_text = _format_steps(graph)
+        # What an older hop2, or a synced device, runs instead: one step after another
+        command = " && ".join(f"hop2 {_sh_quote(name)}" for name in _step_order(graph))
+    elif not command:
+        raise ValueError("Missing command. Usage: hop2 cmd <alias> <command> (or --step NAME[:DEP,...])")
+
+    shown, label = (_describe_steps(graph), "composite command") if steps else (command, "command")
+    created = datetime.now(timezone.utc).isoformat()
+    try:
+        c.execute(
+            "INSERT INTO commands (alias, command, created_at, cache_ttl, cache_watch, steps) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (alias, command, created, cache_ttl, cache_watch, steps_text)
+        )
+        message = f"Created {label}: {alias} → {shown}"
+    except sqlite3.IntegrityError:
+        c.execute(
+            "UPDATE commands SET command = ?, cache_ttl = ?, cache_watch = ?, steps = ? WHERE alias = ?",
+            (command, cache_ttl, cache_watch, steps_text, alias)
+        )
+        message = f"Updated {label}: {alias} → {shown}"
+    if cache_ttl:
+        watching = f", or when {', '.join(watch)} change{'s' if len(watch) == 1 else ''}" if watch else ""
+        message += f"\n   ⚡ Results cached for {_format_ttl(cache_ttl)}{watching}"
+    return message
+
+
+def _delete_shortcut(c, alias):
+    """Remove a directory or command shortcut on cursor *c*, like _save_directory."""
+    # Try to delete from directories
+    c.execute("DELETE FROM directories WHERE alias = ?", (alias,))
+    if c.rowcount:
+        return f"Removed directory shortcut: {alias}"
+    # If not found, try to delete from commands
+    c.execute("DELETE FROM commands WHERE alias = ?", (alias,))
+    if c.rowcount:
+        return f"Removed command shortcut: {alias}"
+    raise ValueError(f"No shortcut found with the alias: {alias}")
+
+
+def _apply_one(save, *args):
+    """Run one cursor-level helper in its own transaction. Returns an exit code."""
+    try:
+        with get_conn() as conn:
+            message = save(conn.cursor(), *args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {message}")
+    _on_db_change()
+    return 0
+
+
+def add_directory(alias, path=None):
+    """Add a directory shortcut"""
+    return _apply_one(_save_directory, alias, path)
+
+
+def add_command(alias, cmd_parts, cache=None, watch=(), steps=()):
+    """Add a command shortcut, cacheable for *cache* (a TTL such as "5m") if given,
+    or composite if *steps* are given"""
+    return _apply_one(_save_command, alias, ' '.join(cmd_parts), cache, watch, steps)
+
+
+def _connect_ro():
+    """Open the database read-only, so lookups never take a write lock."""
+    path = os.path.abspath(DB_PATH).replace("\\", "/")
+    if not path.startswith("/"):
+        path = "/" + path  # Windows drive letter
+    path = path.replace("%", "%25").replace("?", "%3f").replace("#", "%23")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    _mark("connect")
+    return conn
+
+
+def _record_use(kind, alias):
+    """Append a hop to usage.log ("d" or "c" + alias); it is folded into uses later."""
+    from time import time
+    try:
+        size = _append_log(USAGE_LOG, f"{kind}\t{alias}\t{int(time())}\n")
+    except OSError:
+        return
+    _mark("record_use")
+    if size >= USAGE_FOLD_BYTES:
+        try:
+            with get_conn() as conn:
+                _fold_usage(conn)
+        except (sqlite3.Error, OSError):
+            pass  # Another process holds the lock; the log is folded next time
+
+
+def get_directory(alias):
+    conn = _connect_ro()
+    try:
+        row = conn.execute("SELECT path FROM directories WHERE alias = ?", (alias,)).fetchone()
+    finally:
+        conn.close()
+    _mark("query")
+    if row:
+        _record_use("d", alias)
+        return row[0]
+    return None
+
+
+def get_command(alias):
+    row = _get_command_row(alias)
+    return row[0] if row else None
+
+
+def _get_command_row(alias, migrated=False):
+    """(command, cache_ttl, cache_watch, steps) for a command alias, or None.
+
+    Counts a use, except for a cached or composite command under init.sh
+    (HOP2_SHELL=1): that run only prints __HOP2_DIRECT, and the shell's
+    rerun of hop2 is the one that counts.
+    """
+    conn = _connect_ro()
+    try:
+        row = conn.execute("SELECT command, cache_ttl, cache_watch, steps FROM commands WHERE alias = ?",
+                           (alias,)).fetchone()
+    except sqlite3.OperationalError:
+        if migrated:
+            raise
+        # Hops skip init_db, so this may be the first run after an upgrade
+        conn.close()
+        init_db()
+        return _get_command_row(alias, migrated=True)
+    finally:
+        conn.close()
+    _mark("query")
+    if row and not ((row[1] or row[3]) and os.environ.get("HOP2_SHELL") == "1"):
+        _record_use("c", alias)
+    return row
+
+
+def _under_clause(under):
+    """SQL condition (and parameters) for paths at or below *under*."""
+    base = os.path.abspath(os.path.expanduser(under)).rstrip(os.sep) or os.sep
+    if base == os.sep:
+        return "1", []
+    # A range over the path index: every "<base>/..." sorts between
+    # "<base>/" and "<base>" + the character after the separator
+    return ("(path = ? OR (path >= ? AND path < ?))",
+            [base, base + os.sep, base + chr(ord(os.sep) + 1)])
+
+
+def _write_rows(rows, fmt):
+    """Stream (kind, alias, target, uses, last_used[, source]) rows as JSON or TSV.
+
+    source is the project file an alias comes from; "global" when absent.
+    """
+    if fmt == "tsv":
+        for kind, alias, target, uses, last_used, *source in rows:
+            sys.stdout.write(f"{alias}\t{'dir' if kind == 'd' else 'cmd'}\t{target}\t"
+                             f"{uses}\t{last_used or ''}\t{source[0] if source else 'global'}\n")
+        return
+    import json
+    sys.stdout.write("[")
+    for i, (kind, alias, target, uses, last_used, *source) in enumerate(rows):
+        record = ({"type": "directory", "alias": alias, "path": target} if kind == "d"
+                  else {"type": "command", "alias": alias, "command": target})
+        record.update(uses=uses, last_used=last_used, source=source[0] if source else "global")
+        sys.stdout.write(("," if i else "") + "\n  " + json.dumps(record))
+    sys.stdout.write("\n]\n")
+
+
+def list_all(kind=None, under=None, top=None, limit=None, offset=0, fmt="human"):
+    """Lists shortcuts, visualizing directory paths from a common root.
+
+    kind ("d"/"c"), under, top and limit/offset are applied in SQL, so only
+    the rows shown are fetched. fmt "json" or "tsv" prints them for scripts.
+    Aliases from project files come first, on the first page only.
+    """
+    if under is not None:
+        if kind == "c":
+            print("❌ --under filters directories by path; it can't be combined with --cmds")
+            return 1
+        kind = "d"  # commands have no path to filter on
+    if top is not None:
+        limit = top
+    where, params = _under_clause(under) if under is not None else ("1", [])
+    # One page over both kinds: each side's first offset+limit rows, in its
+    # own index order, then the page of the two merged
+    if top is not None:
+        dir_order = cmd_order = order = "uses DESC, alias"
+    else:
+        dir_order, cmd_order = "path, alias", "uses DESC, alias"
+        order = "kind DESC, CASE WHEN kind = 'd' THEN target END, CASE WHEN kind = 'c' THEN uses END DESC, alias"
+    first = "" if limit is None else f" LIMIT {int(limit) + int(offset)}"
+    parts = []
+    if kind in (None, "d"):
+        parts.append(f"SELECT * FROM (SELECT 'd' AS kind, alias, path AS target, uses, last_used FROM directories "
+                     f"WHERE {where} ORDER BY {dir_order}{first})")
+    if kind in (None, "c"):
+        parts.append(f"SELECT * FROM (SELECT 'c' AS kind, alias, command AS target, uses, last_used FROM commands "
+                     f"ORDER BY {cmd_order}{first})")
+    query = f"SELECT * FROM ({' UNION ALL '.join(parts)}) ORDER BY {order}"
+    if limit is not None:
+        query += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+
+    with get_conn() as conn:
+        _fold_usage(conn)
+        conn.row_factory = sqlite3.Row  # Make sure we can access columns by name
+        c = conn.cursor()
+        rows = c.execute(query, params).fetchall()
+        dirs = [r for r in rows if r['kind'] == "d"]
+        cmds = [r for r in rows if r['kind'] == "c"]
+        cached = dict(c.execute("SELECT alias, cache_ttl FROM commands WHERE cache_ttl")) if cmds else {}
+        composite = dict(c.execute("SELECT alias, steps FROM commands WHERE steps IS NOT NULL")) if cmds else {}
+
+    project, skipped = ({}, []) if offset or top is not None else _project_aliases()
+    if under is not None:
+        base = os.path.abspath(os.path.expanduser(under)).rstrip(os.sep) + os.sep
+        project = {a: v for a, v in project.items() if (v[1] + os.sep).startswith(base)}
+    local = [(k, a, target, 0, None, source) for a, (k, target, source) in sorted(project.items())
+             if kind in (None, k)]
+
+    if fmt != "human":
+        _write_rows(local + rows, fmt)
+        return 0
+    filtered = kind is not None or limit is not None or offset
+
+    if local:
+        print("\n📦 Project Shortcuts")
+        print("─" * 70)
+        for k, alias, target, _, _, source in local:
+            shown = target if len(target) <= 45 else f"{target[:42]}..."
+            print(f"  {'📁' if k == 'd' else '⚡'} {alias:<13} → {shown:<45} ({os.path.relpath(source)})")
+    for path, reason, _ in skipped:
+        if reason == "toml":
+            print(f"⚠️  Skipped {path}: reading TOML needs Python 3.11+ (or use .hop2.json)")
+        else:
+            print(f"⚠️  Skipped {path}: not allowed, or changed since (review it, then 'hop2 allow')")
+
+    def shadowed(alias):
+        return "  ⤴ overridden by project" if alias in project else ""
+
+    if dirs:
+        print("\n📁 Directory Shortcuts (Hopper is ready to jump!)")
+        print("─" * 70)
+
+        dir_paths = [d['target'] for d in dirs]
+        # Find the longest common starting path
+        # os.path.commonpath raises ValueError on Windows when paths span drives
+        try:
+            common_base = os.path.commonpath(dir_paths) if len(dir_paths) > 1 else os.path.dirname(dir_paths[0])
+        except ValueError:
+            common_base = None
+
+        home_dir = os.path.expanduser("~")
+
+        if common_base:
+            # Use normcase for case-insensitive comparison on Windows
+            if os.path.normcase(common_base).startswith(os.path.normcase(home_dir)):
+                display_base = f"~{common_base[len(home_dir):]}"
+            else:
+                display_base = common_base
+            print(f"🌲 Common Root: {display_base}/\n")
+
+            for d in dirs:
+                relative_path = os.path.relpath(d['target'], common_base)
+                print(f"  {d['alias']:<15} → ./{relative_path:<40} ({d['uses']} uses){shadowed(d['alias'])}")
+        else:
+            # Paths span multiple drives — show full paths
+            print()
+            for d in dirs:
+                print(f"  {d['alias']:<15} → {d['target']:<45} ({d['uses']} uses){shadowed(d['alias'])}")
+
+        if not filtered:
+            # The 'r' before the """ fixes the SyntaxWarning
+            print(r"""
+                     .--.
+                    |o_o |
+                    |:_/ |
+                   //   \ \
+                  (|     | )
+                 /'\_   _/`\
+                 \___)=(___/
+        """)
+
+    if cmds:
+        print("\n⚡ Command Shortcuts")
+        print("─" * 70)
+        for _, alias, command, uses, _ in cmds:
+            if alias in composite:
+                command = "⛓ " + _describe_steps(_parse_steps(composite[alias].split("\n")))
+            display_cmd = command if len(command) <= 45 else f"{command[:42]}..."
+            cache = f"  ⏱ {_format_ttl(cached[alias])}" if alias in cached else ""
+            print(f"  {alias:<15} → {display_cmd:<45} ({uses} uses){cache}{shadowed(alias)}")
+
+    if not dirs and not cmds and not local:
+        if filtered or under is not None:
+            print("No shortcuts match.")
+        else:
+            print("No shortcuts yet. Go add some! `hop2 add <alias>`")
+    return 0
+
+
+def find_shortcuts(text, limit=20, fmt="human"):
+    """`hop2 find TEXT`: substring search over aliases, paths and commands.
+
+    Uses the trigram index when it exists and TEXT has at least three
+    characters (a trigram's length); otherwise scans with LIKE.
+    """
+    conn = _connect_ro()
+    try:
+        has_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search'").fetchone()
+        if has_index and len(text) >= 3:
+            rows = conn.execute("""
+                WITH hits AS MATERIALIZED (SELECT rowid FROM search WHERE search MATCH :q)
+                SELECT 'd', d.alias, d.path, d.uses, d.last_used
+                  FROM hits JOIN directories d ON d.rowid = hits.rowid / 2 WHERE hits.rowid % 2 = 0
+                UNION ALL
+                SELECT 'c', c.alias, c.command, c.uses, c.last_used
+                  FROM hits JOIN commands c ON c.rowid = hits.rowid / 2 WHERE hits.rowid % 2 = 1
+                ORDER BY 4 DESC, 2 LIMIT :n""",
+                {"q": '"' + text.replace('"', '""') + '"', "n": limit}).fetchall()
+        else:
+            like = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            rows = conn.execute("""
+                SELECT 'd', alias, path, uses, last_used FROM directories
+                 WHERE alias LIKE :q ESCAPE '\\' OR path LIKE :q ESCAPE '\\'
+                UNION ALL
+                SELECT 'c', alias, command, uses, last_used FROM commands
+                 WHERE alias LIKE :q ESCAPE '\\' OR command LIKE :q ESCAPE '\\'
+                ORDER BY 4 DESC, 2 LIMIT :n""", {"q": like, "n": limit}).fetchall()
+    finally:
+        conn.close()
+
+    if fmt != "human":
+        _write_rows(rows, fmt)
+        return 0 if rows else 1
+    if not rows:
+        print(f"No shortcuts match '{text}'.")
+        return 1
+    for kind, alias, target, uses, _ in rows:
+        icon = "📁" if kind == "d" else "⚡"
+        shown = target if len(target) <= 50 else f"{target[:47]}..."
+        print(f"  {icon} {alias:<15} → {shown:<50} ({uses} uses)")
+    return 0
+
+
+def remove_shortcut(alias):
+    """Remove a directory or command shortcut."""
+    return _apply_one(_delete_shortcut, alias)
+
+
+def generate_cd_command(alias):
+    path = get_directory(alias)
+    if path:
+        print(f"__HOP2_CD:{path}")
+        return True
+    return False
+
+
+# Characters that need a real shell to interpret a command alias
+SHELL_METACHARACTERS = set('|&;<>()$`\\"\'*?[]#~=%{}!\n')
+
+
+def run_command(alias, extra_args=None):
+    """Run a command alias. Returns None if *alias* is not one, else an exit code."""
+    row = _get_command_row(alias)
+    if not row:
+        return None
+    cmd, cache_ttl, cache_watch, steps = row
+    if steps:
+        return _run_steps(alias, steps, extra_args)
+    if cache_ttl:
+        return _run_cached(cmd, extra_args, cache_ttl, cache_watch.split("\n") if cache_watch else [], alias)
+    return _run_command_line(cmd, extra_args, alias)
+
+
+def _run_command_line(cmd, extra_args=None, alias=None):
+    """Run *cmd* plus *extra_args*. Returns an exit code.
+
+    Called from init.sh (HOP2_SHELL=1), it only prints __HOP2_EXEC:<command>
+    and the shell runs it. Otherwise hop2 replaces itself with the command,
+    via os.execvp when it is a plain word list or /bin/sh -c when it needs
+    shell syntax, so no Python process lingers while it runs. With
+    HOP2_RUNS=1 it waits for the command instead, to record the run of
+    *alias* (see Run history).
+    """
+    full = f"{cmd} {' '.join(extra_args)}" if extra_args else cmd
+    if os.environ.get("HOP2_SHELL") == "1":
+        print(f"__HOP2_EXEC:{full}")
+        return 0
+
+    print(f"→ Running: {full}")
+    sys.stdout.flush()
+    _profile_flush()  # exec skips atexit
+    if sys.platform == 'win32':
+        import subprocess
+        from time import time
+        started = time()
+        code = subprocess.run(full, shell=True).returncode
+        if alias:
+            _record_runs([(alias, started, time(), code, os.getcwd())])
+        return code
+    argv = None
+    if SHELL_METACHARACTERS.isdisjoint(full):
+        import shlex
+        argv = shlex.split(full)
+        if not argv:
+            return 0
+    # exec leaves no process behind to record the run, so only an explicit
+    # HOP2_RUNS=1 keeps hop2 waiting; the shell integration records its own
+    if alias and os.environ.get("HOP2_RUNS") == "1" and hasattr(os, "posix_spawnp"):
+        return _run_recorded(alias, argv, full)
+    if argv:
+        try:
+            os.execvp(argv[0], argv)
+        except FileNotFoundError:
+            pass  # Probably a shell builtin such as `exit` or `export`
+        except OSError as e:
+            # Found but not runnable (no execute bit, a directory...): 126, like sh
+            print(f"❌ Could not run '{full}': {e}")
+            return 126
+    try:
+        os.execv('/bin/sh', ['sh', '-c', full])
+    except OSError as e:
+        print(f"❌ Could not run '{full}': {e}")
+        return 127
+
+
+# ---------------------------------------------------------------------------
+# Profiling
+#
+# HOP2_PROFILE=1 (or --profile) marks the end of each phase of a run with
+# _mark(); _profile_flush() writes the phase timings to PROFILE_LOG, and
+# `hop2 profile` summarises that trace. The first mark is taken at the top
+# of the file, before sqlite3 is imported.
+# ---------------------------------------------------------------------------
+
+# Histogram buckets for `hop2 profile report` (upper bounds, milliseconds)
+PROFILE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)
+
+
+def _mark(phase):
+    """End *phase* at this instant when profiling; a single test otherwise.
+
+    Phases are the gaps between consecutive marks, so each mark names the
+    work done since the previous one.
+    """
+    if _PROFILE:
+        from time import perf_counter
+        _PROFILE_MARKS.append((phase, perf_counter(), None))
+
+
+def _profile_flush():
+    """Write this run's phases: to stderr and PROFILE_LOG for HOP2_PROFILE=1,
+    or only to the file HOP2_PROFILE names. Runs at exit and before exec."""
+    global _PROFILE
+    if not _PROFILE or not _PROFILE_MARKS:
+        return
+    _mark("exit")
+    import json
+    from time import time
+
+    phases = {}
+    # The shell wrapper passes HOP2_T0=$EPOCHREALTIME: fork, exec and
+    # interpreter startup then show up as a phase of their own
+    t0 = os.environ.get("HOP2_T0", "").replace(",", ".")
+    wall = _PROFILE_MARKS[0][2]
+    if t0 and wall:
+        try:
+            phases["startup"] = round((wall - float(t0)) * 1000, 3)
+        except ValueError:
+            pass
+    for (_, before, _), (phase, after, _) in zip(_PROFILE_MARKS, _PROFILE_MARKS[1:]):
+        phases[phase] = round(phases.get(phase, 0) + (after - before) * 1000, 3)
+    total = round(sum(phases.values()), 3)
+    record = {"ts": round(time(), 3), "cmd": sys.argv[1:2], "total": total, "phases": phases}
+    target = PROFILE_LOG if _PROFILE == "1" else os.path.expanduser(_PROFILE)
+    if _PROFILE == "1":
+        detail = " · ".join(f"{k} {v:.2f}ms" for k, v in phases.items())
+        print(f"⏱  {' '.join(sys.argv[1:2]) or 'hop2'}: {detail} · total {total:.2f}ms", file=sys.stderr)
+    _PROFILE = None  # once per process
+    try:
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        with open(target, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError:
+        pass
+
+
+def profile_report(action="report", filename=None):
+    """`hop2 profile [report|clear]`: per-phase latency histograms of a trace."""
+    import bisect
+
+    path = os.path.expanduser(filename) if filename else PROFILE_LOG
+    if action == "clear":
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        print(f"🗑️  Cleared {path}")
+        return 0
+
+    import json
+    samples = {}
+    position = {}  # phase -> summed index within its runs, to order the rows
+    runs = 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    phases = dict(record["phases"], total=record["total"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                runs += 1
+                for i, (phase, ms) in enumerate(phases.items()):
+                    samples.setdefault(phase, []).append(ms)
+                    position[phase] = position.get(phase, 0) + i
+    except FileNotFoundError:
+        print(f"No profile trace at {path}. Run 'hop2 --profile <alias>' or set HOP2_PROFILE=1.")
+        return 1
+
+    bars = " ▁▂▃▄▅▆▇█"
+    print(f"\n⏱  {runs} profiled run{'s' if runs != 1 else ''} from {path}")
+    print("─" * 70)
+    legend = " ".join(f"{b:g}" for b in PROFILE_BUCKETS)
+    print(f"{'phase':<14}{'runs':>6}{'p50':>9}{'p95':>9}{'max':>9}   ms: ≤{legend} >")
+    for phase, values in sorted(samples.items(), key=lambda kv: (kv[0] == "total", position[kv[0]] / len(kv[1]))):
+        values.sort()
+        counts = [0] * (len(PROFILE_BUCKETS) + 1)
+        for ms in values:
+            counts[bisect.bisect_left(PROFILE_BUCKETS, ms)] += 1
+        peak = max(counts)
+        hist = "".join(bars[-(-c * (len(bars) - 1) // peak)] if c else "·" for c in counts)
+        p50 = values[(len(values) - 1) // 2]
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{phase:<14}{len(values):>6}{p50:>9.2f}{p95:>9.2f}{values[-1]:>9.2f}   {hist}")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Alias index
+#
+# hop2.idx is a read-only copy of the alias tables that a hop reads through
+# mmap instead of opening SQLite. A background `hop2 __reindex` rewrites it
+# after every change (_on_db_change). Layout, all little-endian:
+#
+#     header   INDEX_HEADER: magic, format, n aliases, r buckets, stamp
+#     buckets  r x int32: displacement d, or -(slot + 1) for a single alias
+#     slots    n x uint32: file offset of each slot's record
+#     records  kind (1 byte), key length, value length (uint32), key, value
+#
+# Buckets and slots form a minimal perfect hash (hash and displace): an
+# alias with hash h (_index_hash) sits in bucket h % r, and a bucket with
+# displacement d puts its aliases in slot _index_mix(h, d) % n. An unknown
+# alias lands in some slot too, so the stored key is compared. A lookup
+# reads three places in the file however many aliases there are.
+#
+# The stamp is the inode, mtime and size of hop2.db and its WAL when the
+# index was read from them. Any write since (a change not yet reindexed,
+# folded usage counts) makes the index stale: hops then go to SQLite, and
+# the first one schedules a rebuild.
+# ---------------------------------------------------------------------------
+
+INDEX_PATH = os.path.join(DB_DIR, "hop2.idx")
+INDEX_MAGIC = b"HOP2IDX\0"
+INDEX_FORMAT = 1
+INDEX_HEADER = "<8sIII5q"
+INDEX_REBUILD_SECONDS = 60  # between background rebuilds of a stale index
+
+_MASK64 = 0xffffffffffffffff
+INDEX_MAX_DISPLACEMENT = 1 << 20  # give up (and keep using SQLite) past this
+
+
+def _index_hash(key):
+    """64-bit hash of *key* (bytes): CRC-32 and Adler-32, both computed in C."""
+    import zlib
+    return zlib.crc32(key) << 32 | zlib.adler32(key)
+
+
+def _index_mix(h, d):
+    """Rehash *h* for displacement *d* (a splitmix64 round)."""
+    h = ((h ^ (d * 0x9e3779b97f4a7c15)) * 0xbf58476d1ce4e5b9) & _MASK64
+    return h ^ (h >> 31)
+
+
+def _index_stamp():
+    """(inode, mtime, size) of hop2.db plus (mtime, size) of its WAL, or None."""
+    try:
+        st = os.stat(DB_PATH)
+    except OSError:
+        return None
+    try:
+        wal = os.stat(DB_PATH + "-wal")
+        # Readers may leave an empty WAL behind; it holds no changes
+        wal = (wal.st_mtime_ns, wal.st_size) if wal.st_size else (0, 0)
+    except OSError:
+        wal = (0, 0)
+    return (st.st_ino, st.st_mtime_ns, st.st_size) + wal
+
+
+def _build_index(entries, stamp):
+    """hop2.idx contents for *entries*, a {alias: (kind, value)} dict, or None
+    if no perfect hash was found (only possible if two aliases hash alike)."""
+    import struct
+    import zlib
+
+    keys = [alias.encode() for alias in entries]
+    n = len(keys)
+    r = max(1, n)
+    hashes = [zlib.crc32(k) << 32 | zlib.adler32(k) for k in keys]  # _index_hash, inlined
+    buckets = [[] for _ in range(r)]
+    for i, h in enumerate(hashes):
+        buckets[h % r].append(i)
+
+    # Biggest buckets first, while most slots are free
+    displacement = [0] * r
+    owner = [-1] * n
+    singles = []
+    for b in sorted(range(r), key=lambda b: -len(buckets[b])):
+        members = buckets[b]
+        if len(members) < 2:
+            if not members:
+                break
+            singles.append(b)
+            continue
+        for d in range(1, INDEX_MAX_DISPLACEMENT):
+            slots = {_index_mix(hashes[i], d) % n for i in members}
+            if len(slots) == len(members) and all(owner[s] < 0 for s in slots):
+                break
+        else:
+            return None
+        for i in members:
+            owner[_index_mix(hashes[i], d) % n] = i
+        displacement[b] = d
+    free = (s for s in range(n) if owner[s] < 0)
+    for b in singles:
+        s = next(free)
+        owner[s] = buckets[b][0]
+        displacement[b] = -s - 1
+
+    values = list(entries.values())
+    pack = struct.Struct("<cII").pack
+    base = struct.calcsize(INDEX_HEADER) + 4 * r + 4 * n
+    offsets, records = [], []
+    for i in owner:
+        key = keys[i]
+        kind, value = values[i]
+        value = value.encode()
+        offsets.append(base)
+        base += 9 + len(key) + len(value)
+        records += (pack(kind.encode(), len(key), len(value)), key, value)
+    return b"".join((struct.pack(INDEX_HEADER, INDEX_MAGIC, INDEX_FORMAT, n, r, *stamp),
+                     struct.pack(f"<{r}i", *displacement),
+                     struct.pack(f"<{n}I", *offsets),
+                     *records))
+
+
+def _write_index():
+    """Rewrite hop2.idx from the database."""
+    for _ in range(3):
+        stamp = _index_stamp()
+        if stamp is None:
+            return
+        conn = _connect_ro()
+        try:
+            # Cached and composite commands ("x") need SQLite for their TTL or steps
+            cmds = conn.execute("SELECT alias, CASE WHEN cache_ttl OR steps IS NOT NULL THEN 'x' ELSE 'c' END, command "
+                                "FROM commands").fetchall()
+            dirs = conn.execute("SELECT alias, 'd', path FROM directories").fetchall()
+        except sqlite3.OperationalError:
+            return  # not migrated yet
+        finally:
+            conn.close()
+        # Only write an index whose stamp matches what was read
+        if _index_stamp() == stamp:
+            # A directory wins over a command of the same name, as in resolve_alias
+            entries = {alias: (kind, value) for alias, kind, value in cmds + dirs}
+            data = _build_index(entries, stamp)
+            if data:
+                _write_atomic(INDEX_PATH, data)
+                _mark("index")
+                return
+            break
+    # Kept changing under us, or no perfect hash: better no index than a stale one
+    if os.path.exists(INDEX_PATH):
+        os.unlink(INDEX_PATH)
+
+
+def _schedule_reindex(force=False):
+    """Rebuild hop2.idx in a background process.
+
+    A stale index is rebuilt at most once per INDEX_REBUILD_SECONDS; *force*
+    (after a change) starts a rebuild even if one is already running.
+    """
+    import time
+    marker = INDEX_PATH + ".pending"
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+    except FileExistsError:
+        try:
+            if not force and time.time() - os.stat(marker).st_mtime < INDEX_REBUILD_SECONDS:
+                return
+            os.utime(marker)  # the last rebuild never finished; try again
+        except OSError:
+            return
+    except OSError:
+        return
+    import subprocess
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "__reindex"],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        pass
+
+
+def reindex():
+    """`hop2 __reindex`: rebuild hop2.idx (spawned when a hop finds it stale)."""
+    init_db()
+    try:
+        _write_index()
+    finally:
+        try:
+            os.unlink(INDEX_PATH + ".pending")
+        except OSError:
+            pass
+    return 0
+
+
+def _index_lookup(alias):
+    """Look *alias* up in hop2.idx without touching SQLite.
+
+    Returns ("d", path) or ("c", command); ("x", None) for a cached or composite command,
+    which only SQLite can run; ("", None) when there is no such alias; and
+    None when the index is missing, stale or damaged.
+    """
+    import mmap
+    import struct
+    try:
+        with open(INDEX_PATH, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        if os.path.exists(DB_PATH):
+            _schedule_reindex()
+        return None
+    try:
+        magic, version, n, r, *stamp = struct.unpack_from(INDEX_HEADER, m)
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT or tuple(stamp) != _index_stamp():
+            _schedule_reindex()
+            return None
+        if not n:
+            return "", None
+        key = alias.encode()
+        h = _index_hash(key)
+        base = struct.calcsize(INDEX_HEADER)
+        d, = struct.unpack_from("<i", m, base + 4 * (h % r))
+        slot = -d - 1 if d < 0 else _index_mix(h, d) % n
+        offset, = struct.unpack_from("<I", m, base + 4 * r + 4 * slot)
+        kind, key_len, value_len = struct.unpack_from("<cII", m, offset)
+        start = offset + 9
+        if m[start:start + key_len] != key:
+            return "", None
+        if kind == b"x":
+            return "x", None
+        return kind.decode(), m[start + key_len:start + key_len + value_len].decode()
+    except (struct.error, ValueError):
+        return None  # truncated or damaged; the next change rewrites it
+    finally:
+        m.close()
+        _mark("index")
+
+
+# ---------------------------------------------------------------------------
+# Command result cache
+#
+# `hop2 cmd <alias> <command> --cache TTL [--watch FILE ...]` makes a command
+# alias cacheable: its stdout and exit code are stored in CACHE_DIR, keyed
+# by the command line, the working directory and the watched files' mtimes
+# and sizes, and replayed by runs within TTL. A hit bumps the entry's mtime,
+# so the oldest mtime is the least recently used when the cache is trimmed
+# to CACHE_MAX_BYTES / CACHE_MAX_ENTRIES.
+# ---------------------------------------------------------------------------
+
+CACHE_DIR = os.path.join(DB_DIR, "cache")
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+CACHE_MAX_ENTRIES = 1000
+TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_FRESH = False  # `hop2 --fresh <alias>`: run even when a cached result is valid
+
+
+def _parse_ttl(text):
+    """Seconds in "90", "30s", "5m", "2h" or "1d"."""
+    text = text.strip().lower()
+    unit = TTL_UNITS.get(text[-1:], None)
+    number = text[:-1] if unit else text
+    seconds = int(float(number) * (unit or 1))
+    if seconds <= 0:
+        raise ValueError(text)
+    return seconds
+
+
+def _format_ttl(seconds):
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def _cache_key(full, watch):
+    import hashlib
+
+    cwd = os.getcwd()
+    h = hashlib.sha256(f"{full}\0{cwd}\0".encode("utf-8", "surrogateescape"))
+    for name in watch:
+        try:
+            st = os.stat(os.path.join(cwd, os.path.expanduser(name)))
+            stamp = f"{st.st_mtime_ns}:{st.st_size}"
+        except OSError:
+            stamp = "missing"
+        h.update(f"{name}\0{stamp}\0".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()[:32]
+
+
+def _cache_trim():
+    """Evict least recently used entries until the cache fits its bounds."""
+    entries = []
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    entries.sort()
+    while entries and (total > CACHE_MAX_BYTES or len(entries) > CACHE_MAX_ENTRIES):
+        _, size, path = entries.pop(0)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def _run_cached(cmd, extra_args, ttl, watch, alias=None):
+    """Run a cacheable command, or replay its cached stdout and exit code.
+
+    Messages go to stderr so stdout is exactly the command's, cached or not.
+    Only actual runs are recorded under *alias*, not replays.
+    """
+    import time
+
+    full = f"{cmd} {' '.join(extra_args)}" if extra_args else cmd
+    if os.environ.get("HOP2_SHELL") == "1":
+        # The shell captures our stdout; have it run us directly instead
+        print("__HOP2_DIRECT")
+        return 0
+
+    entry = os.path.join(CACHE_DIR, _cache_key(full, watch))
+    if not _FRESH:
+        try:
+            with open(entry, "rb") as f:
+                code, created_ms = (int(x) for x in f.readline().split())
+                age = time.time() - created_ms / 1000
+                if age < ttl:
+                    output = f.read()
+                    os.utime(entry)  # most recently used
+                    print(f"⚡ Cached ({age:.0f}s old): {full}", file=sys.stderr)
+                    sys.stdout.buffer.write(output)
+                    sys.stdout.flush()
+                    _mark("cache")
+                    return code
+        except (OSError, ValueError):
+            pass
+
+    import subprocess
+
+    print(f"→ Running: {full}", file=sys.stderr)
+    sys.stderr.flush()
+    _profile_flush()
+    started = time.time()
+    chunks = []
+    try:
+        proc = subprocess.Popen(full, shell=True, stdout=subprocess.PIPE)
+        # Stream the output while keeping a copy
+        for chunk in iter(lambda: proc.stdout.read1(65536), b""):
+            sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
+            chunks.append(chunk)
+        code = proc.wait()
+    except KeyboardInterrupt:
+        return 130
+    except OSError as e:
+        print(f"❌ Could not run '{full}': {e}", file=sys.stderr)
+        return 127
+    if alias:
+        _record_runs([(alias, started, time.time(), code if code >= 0 else 128 - code, os.getcwd())])
+
+    output = b"".join(chunks)
+    if code >= 0 and len(output) <= CACHE_MAX_BYTES // 4:  # not killed by a signal
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _write_atomic(entry, f"{code} {int(started * 1000)}\n".encode() + output)
+        _cache_trim()
+    return code
+
+
+# Rows per executemany() when restoring
+RESTORE_BATCH = 1000
+
+
+def backup_data(filename=None, fmt=None):
+    """Backup hop2 data to a JSON file, or NDJSON when fmt is "ndjson".
+
+    The NDJSON format (version 3.0) is a header line with the row counts
+    followed by one {"type": "directory"|"command", ...} object per line,
+    streamed straight from the database.
+    """
+    import json
+
+    if fmt is None:
+        fmt = "ndjson" if filename and filename.endswith((".ndjson", ".jsonl")) else "json"
+    if filename is None:
+        # Default filename with timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"hop2_backup_{timestamp}.{fmt}"
+
+    if fmt == "ndjson":
+        with get_conn() as conn:
+            _fold_usage(conn)
+            c = conn.cursor()
+            c.execute("BEGIN")  # one consistent snapshot for the counts and the rows
+            total_dirs = c.execute("SELECT COUNT(*) FROM directories").fetchone()[0]
+            total_cmds = c.execute("SELECT COUNT(*) FROM commands").fetchone()[0]
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    "version": "3.0",
+                    "format": "ndjson",
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "directories": total_dirs,
+                    "commands": total_cmds,
+                }) + "\n")
+                for alias, path, created_at, uses, last_used in c.execute(
+                        "SELECT alias, path, created_at, uses, last_used FROM directories"):
+                    f.write(json.dumps({"type": "directory", "alias": alias, "path": path,
+                                        "created_at": created_at, "uses": uses,
+                                        "last_used": last_used}) + "\n")
+                for alias, command, created_at, uses, last_used, cache_ttl, cache_watch, steps in c.execute(
+                        "SELECT alias, command, created_at, uses, last_used, cache_ttl, cache_watch, steps "
+                        "FROM commands"):
+                    rec = {"type": "command", "alias": alias, "command": command,
+                           "created_at": created_at, "uses": uses, "last_used": last_used}
+                    if cache_ttl:
+                        rec.update(cache_ttl=cache_ttl, cache_watch=cache_watch.split("\n") if cache_watch else [])
+                    if steps:
+                        rec["steps"] = steps.split("\n")
+                    f.write(json.dumps(rec) + "\n")
+        print(f"✅ Backup saved to: {filename}")
+        print(f"   • {total_dirs} directories")
+        print(f"   • {total_cmds} commands")
+        return 0
+
+    backup_data = {
+        "version": "2.0",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "database": {
+            "directories": [],
+            "commands": []
+        }
+    }
+
+    with get_conn() as conn:
+        _fold_usage(conn)
+        c = conn.cursor()
+
+        # Get directories
+        c.execute("SELECT alias, path, created_at, uses FROM directories")
+        for row in c.fetchall():
+            backup_data["database"]["directories"].append({
+                "alias": row[0],
+                "path": row[1],
+                "created_at": row[2],
+                "uses": row[3]
+            })
+
+        # Get commands
+        c.execute("SELECT alias, command, created_at, uses FROM commands")
+        for row in c.fetchall():
+            backup_data["database"]["commands"].append({
+                "alias": row[0],
+                "command": row[1],
+                "created_at": row[2],
+                "uses": row[3]
+            })
+
+    # Write to file
+    with open(filename, 'w') as f:
+        json.dump(backup_data, f, indent=2)
+
+    total_dirs = len(backup_data["database"]["directories"])
+    total_cmds = len(backup_data["database"]["commands"])
+
+    print(f"✅ Backup saved to: {filename}")
+    print(f"   • {total_dirs} directories")
+    print(f"   • {total_cmds} commands")
+    return 0
+
+
+def _read_backup(f):
+    """Identify a backup file's format. Returns (version, n_dirs, n_cmds, records).
+
+    NDJSON backups are streamed line by line; the v1.0 and v2.0 JSON
+    documents are loaded whole. Records are dicts with a "type" key.
+    """
+    import json
+
+    first = f.readline()
+    try:
+        header = json.loads(first)
+    except ValueError:
+        header = None
+
+    if isinstance(header, dict) and header.get("format") == "ndjson":
+        def records():
+            for lineno, line in enumerate(f, start=2):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    print(f"⚠️  Skipped line {lineno}: {e}")
+        return header.get("version", "3.0"), header.get("directories"), header.get("commands"), records()
+
+    f.seek(0)
+    backup_data = json.load(f)
+    # Handle both v1.0 (flat) and v2.0 (database) backup formats
+    version = backup_data.get("version", "1.0")
+    if version == "2.0" and "database" in backup_data:
+        # New format with database structure
+        directories = backup_data["database"].get("directories", [])
+        commands = backup_data["database"].get("commands", [])
+    else:
+        # Old format (v1.0) - flat structure
+        directories = backup_data.get("directories", [])
+        commands = backup_data.get("commands", [])
+
+    def records():
+        for d in directories:
+            yield dict(d, type="directory")
+        for cmd in commands:
+            yield dict(cmd, type="command")
+    return version, len(directories), len(commands), records()
+
+
+def restore_data(filename, assume_yes=False):
+    """Restore hop2 data from a JSON or NDJSON backup in a single transaction"""
+    if not os.path.exists(filename):
+        print(f"❌ Backup file not found: {filename}")
+        return 1
+
+    try:
+        f = open(filename, 'r', encoding='utf-8')
+        version, n_dirs, n_cmds, records = _read_backup(f)
+    except Exception as e:
+        print(f"❌ Error reading backup file: {e}")
+        return 1
+
+    # Initialize database if it doesn't exist
+    init_db()
+
+    # Ask for confirmation
+    print(f"\n📦 Restore from: {filename}")
+    print(f"   • Format version: {version}")
+    print(f"   • {n_dirs if n_dirs is not None else '?'} directories")
+    print(f"   • {n_cmds if n_cmds is not None else '?'} commands")
+    print("\n⚠️  This will merge with existing shortcuts.")
+    if not assume_yes:
+        try:
+            ans = input("Continue? [y/N]: ")
+        except EOFError:
+            ans = ""
+            print("\n(no input; pass --yes to restore non-interactively)")
+        if ans.lower() != 'y':
+            f.close()
+            print("❌ Restore cancelled.")
+            return 1
+
+    total = (n_dirs or 0) + (n_cmds or 0)
+    show_progress = total > RESTORE_BATCH and sys.stderr.isatty()
+    restored = {"dirs": 0, "cmds": 0}
+    dir_rows, cmd_rows = [], []
+
+    def flush(c):
+        # An upsert rather than INSERT OR REPLACE keeps the rowid, so an
+        # unchanged path or command never touches the search index
+        c.executemany("""
+            INSERT INTO directories (alias, path, created_at, uses, last_used)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(alias) DO UPDATE SET path = excluded.path, created_at = excluded.created_at,
+                                             uses = excluded.uses, last_used = excluded.last_used
+        """, dir_rows)
+        c.executemany("""
+            INSERT INTO commands (alias, command, created_at, uses, last_used, cache_ttl, cache_watch, steps)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(alias) DO UPDATE SET command = excluded.command, created_at = excluded.created_at,
+                                             uses = excluded.uses, last_used = excluded.last_used,
+                                             cache_ttl = excluded.cache_ttl, cache_watch = excluded.cache_watch,
+                                             steps = excluded.steps
+        """, cmd_rows)
+        restored["dirs"] += len(dir_rows)
+        restored["cmds"] += len(cmd_rows)
+        dir_rows.clear()
+        cmd_rows.clear()
+        if show_progress:
+            done = restored["dirs"] + restored["cmds"]
+            print(f"\r   … {done}/{total} shortcuts", end="", file=sys.stderr, flush=True)
+
+    with f, get_conn() as conn:
+        c = conn.cursor()
+        for rec in records:
+            try:
+                if rec.get("type") == "command":
+                    cmd_rows.append((str(rec['alias']), str(rec['command']), rec.get('created_at'),
+                                     int(rec.get('uses') or 0), rec.get('last_used'),
+                                     int(rec['cache_ttl']) if rec.get('cache_ttl') else None,
+                                     "\n".join(map(str, rec.get('cache_watch') or [])) or None,
+                                     "\n".join(map(str, rec.get('steps') or [])) or None))
+                else:
+                    dir_rows.append((str(rec['alias']), str(rec['path']), rec.get('created_at'),
+                                     int(rec.get('uses') or 0), rec.get('last_used')))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                label = rec.get('alias', '?') if isinstance(rec, dict) else '?'
+                print(f"⚠️  Skipped {label}: {e!r}")
+                continue
+            if len(dir_rows) + len(cmd_rows) >= RESTORE_BATCH:
+                flush(c)
+        flush(c)
+    if show_progress:
+        print(file=sys.stderr)
+
+    _on_db_change()
+    print(f"\n✅ Restore complete!")
+    print(f"   • Restored {restored['dirs']} directories")
+    print(f"   • Restored {restored['cmds']} commands")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Batch mode
+#
+# `hop2 --batch [FILE|-]` applies many add/cmd/rm operations in one process
+# and one transaction, through the same _save_directory/_save_command/
+# _delete_shortcut helpers as the single commands. One operation per line,
+# either as typed after `hop2` or as NDJSON:
+#
+#     add api ~/code/api                {"op": "add", "alias": "api", "path": "~/code/api"}
+#     cmd t "pytest -q" --cache 5m      {"op": "cmd", "alias": "t", "command": "pytest -q", "cache": "5m"}
+#     cmd ci --step t --step b:t        {"op": "cmd", "alias": "ci", "steps": ["t", "b:t"]}
+#     rm old                            {"op": "rm", "alias": "old"}
+#
+# Blank lines and lines starting with # are skipped. If any line fails,
+# the whole batch is rolled back; --dry-run always rolls back.
+# ---------------------------------------------------------------------------
+
+BATCH_USAGE = {
+    "add": "add <alias> [path]",
+    "cmd": "cmd <alias> <command> [--cache TTL] [--watch FILE] | cmd <alias> --step NAME[:DEP,...] ...",
+    "rm": "rm <alias>",
+}
+BATCH_OPS = {"add": _save_directory, "cmd": _save_command, "rm": _delete_shortcut}
+
+
+def _parse_batch_json(line):
+    """(op, alias, args) from an NDJSON batch line."""
+    import json
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e.msg}") from None
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object")
+    op, alias = record.get("op"), record.get("alias")
+    if op not in BATCH_OPS:
+        raise ValueError(f"Unknown op {op!r} (expected add, cmd or rm)")
+    if not isinstance(alias, str) or not alias:
+        raise ValueError('Missing "alias"')
+    if op == "add":
+        path = record.get("path")
+        if path is not None and not isinstance(path, str):
+            raise ValueError('"path" must be a string')
+        return op, alias, (path,)
+    if op == "rm":
+        return op, alias, ()
+    command, cache = record.get("command") or "", record.get("cache")
+    if not isinstance(command, str):
+        raise ValueError('"command" must be a string')
+    if isinstance(cache, (int, float)) and not isinstance(cache, bool):
+        cache = str(cache)  # seconds, like `--cache 90`
+    elif cache is not None and not isinstance(cache, str):
+        raise ValueError('"cache" must be a TTL string such as "5m", or seconds')
+    lists = []
+    for key in ("watch", "steps"):
+        value = record.get(key) or []
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError(f'"{key}" must be a string or a list of strings')
+        lists.append(tuple(value))
+    return op, alias, (command, cache, *lists)
+
+
+def _parse_batch_line(line):
+    """(op, alias, args) from a batch line; raises ValueError."""
+    if line.startswith("{"):
+        return _parse_batch_json(line)
+    import shlex
+    try:
+        words = shlex.split(line)
+    except ValueError as e:
+        raise ValueError(f"Cannot parse line: {e}") from None
+    op, args = words[0], words[1:]
+    if op not in BATCH_OPS:
+        raise ValueError(f"Unknown operation '{op}' (expected add, cmd or rm)")
+    usage = ValueError(f"Usage: {BATCH_USAGE[op]}")
+    if not args:
+        raise usage
+    alias, args = args[0], args[1:]
+    if op == "add":
+        if len(args) > 1:
+            raise usage
+        return op, alias, (args[0] if args else None,)
+    if op == "rm":
+        if args:
+            raise usage
+        return op, alias, ()
+
+    cache, watch, steps, parts = None, [], [], []
+    words = iter(args)
+    for word in words:
+        flag, eq, value = word.partition("=")
+        if flag not in ("--cache", "--watch", "--step"):
+            parts.append(word)
+            continue
+        if not eq:
+            value = next(words, None)
+            if value is None:
+                raise ValueError(f"{flag} needs a value")
+        if flag == "--cache":
+            cache = value
+        else:
+            (watch if flag == "--watch" else steps).append(value)
+    if not parts and not steps:
+        raise usage
+    return op, alias, (" ".join(parts), cache, tuple(watch), tuple(steps))
+
+
+def run_batch(filename="-", dry_run=False):
+    """`hop2 --batch [FILE|-] [--dry-run]`: apply add/cmd/rm lines all or nothing."""
+    import time
+
+    started = time.perf_counter()
+    if filename == "-":
+        f = sys.stdin
+    else:
+        try:
+            f = open(os.path.expanduser(filename), encoding="utf-8")
+        except OSError as e:
+            print(f"❌ Cannot read {filename}: {e}")
+            return 1
+
+    init_db()
+    counts = dict.fromkeys(BATCH_OPS, 0)
+    errors = []
+    conn = _connect()
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                op, alias, args = _parse_batch_line(line)
+                message = BATCH_OPS[op](c, alias, *args)
+            except ValueError as e:
+                errors.append((number, str(e)))
+                continue
+            counts[op] += 1
+            if dry_run:
+                print(f"   line {number}: {message}")
+        if errors or dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    finally:
+        conn.close()
+        if f is not sys.stdin:
+            f.close()
+
+    total = sum(counts.values())
+    if errors:
+        print(f"❌ {len(errors)} of {total + len(errors)} operations failed; nothing was changed:")
+        for number, error in errors:
+            print(f"   line {number}: {error}")
+        return 1
+    if dry_run:
+        print(f"🔍 Dry run: {total} operations would apply; nothing was changed.")
+        return 0
+    if total:
+        _on_db_change()
+    print(f"✅ Applied {total} operations in {time.perf_counter() - started:.2f}s")
+    print(f"   • {counts['add']} directories added or updated")
+    print(f"   • {counts['cmd']} commands added or updated")
+    print(f"   • {counts['rm']} removed")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Snapshots
+#
+# Compressed copies of hop2.db taken with the SQLite online backup API, named
+# hop2-<UTC time>-<content hash>.db.<xz|gz>. A snapshot whose content matches
+# the newest one is not written. Beyond the SNAPSHOT_KEEP_RECENT newest, old
+# ones are thinned out to one per hour for SNAPSHOT_KEEP_HOURLY hours plus one
+# per day for SNAPSHOT_KEEP_DAILY days.
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_KEEP_RECENT = 5
+SNAPSHOT_KEEP_HOURLY = 24
+SNAPSHOT_KEEP_DAILY = 14
+SNAPSHOT_INTERVAL = 3600  # seconds between automatic snapshots
+
+
+def _snapshot_codec():
+    """(suffix, compress): lzma when available, else gzip."""
+    try:
+        import lzma
+        return ".xz", lambda data: lzma.compress(data, preset=1)
+    except ImportError:
+        import gzip
+        return ".gz", gzip.compress
+
+
+def _list_snapshots():
+    """Snapshot file names, newest first."""
+    try:
+        names = [n for n in os.listdir(SNAPSHOT_DIR) if n.startswith("hop2-") and ".db." in n]
+    except OSError:
+        return []
+    return sorted(names, reverse=True)
+
+
+def _auto_snapshot():
+    """Take a background snapshot after a change if the newest is over an hour old."""
+    if os.environ.get("HOP2_AUTO_SNAPSHOT") == "0":
+        return
+    snapshots = _list_snapshots()
+    if snapshots:
+        import time
+        try:
+            if time.time() - os.path.getmtime(os.path.join(SNAPSHOT_DIR, snapshots[0])) < SNAPSHOT_INTERVAL:
+                return
+        except OSError:
+            pass
+    import subprocess
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "snapshot", "create", "--quiet"],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        pass
+
+
+def _prune_snapshots():
+    """Apply the hourly/daily retention policy. Returns the number removed."""
+    snapshots = _list_snapshots()
+    keep, hours, days = set(snapshots[:SNAPSHOT_KEEP_RECENT]), set(), set()
+    for name in snapshots:
+        stamp = name.split("-")[1]  # 20261017T190000123456Z
+        hour, day = stamp[:11], stamp[:8]
+        if hour not in hours and len(hours) < SNAPSHOT_KEEP_HOURLY:
+            hours.add(hour)
+            keep.add(name)
+        if day not in days and len(days) < SNAPSHOT_KEEP_DAILY:
+            days.add(day)
+            keep.add(name)
+    removed = 0
+    for name in set(snapshots) - keep:
+        try:
+            os.unlink(os.path.join(SNAPSHOT_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def create_snapshot(quiet=False):
+    """Write a compressed snapshot of the database unless nothing has changed."""
+    import hashlib
+    import tempfile
+
+    if not os.path.exists(DB_PATH):
+        if not quiet:
+            print("❌ Nothing to snapshot yet.")
+        return 1
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    suffix, compress = _snapshot_codec()
+
+    fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        src = _connect_ro()
+        dst = sqlite3.connect(tmp)
+        try:
+            # A consistent copy that doesn't block writers under WAL
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        with open(tmp, "rb") as f:
+            data = f.read()
+    finally:
+        os.unlink(tmp)
+
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    snapshots = _list_snapshots()
+    if snapshots and snapshots[0].split("-")[2].split(".")[0] == digest:
+        # Unchanged: just mark the newest snapshot as current
+        os.utime(os.path.join(SNAPSHOT_DIR, snapshots[0]))
+        if not quiet:
+            print(f"✅ No changes since {snapshots[0]}")
+        return 0
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")  # sorts by time
+    name = f"hop2-{stamp}-{digest}.db{suffix}"
+    path = os.path.join(SNAPSHOT_DIR, name)
+    with open(path + ".tmp", "wb") as f:
+        f.write(compress(data))
+    os.replace(path + ".tmp", path)
+    removed = _prune_snapshots()
+    if not quiet:
+        print(f"✅ Snapshot saved: {name} ({os.path.getsize(path) // 1024 + 1} KB)")
+        if removed:
+            print(f"   • pruned {removed} old snapshot(s)")
+    return 0
+
+
+def list_snapshots():
+    snapshots = _list_snapshots()
+    if not snapshots:
+        print("No snapshots yet. Take one with `hop2 snapshot`.")
+        return 0
+    print("\n🗄️  Snapshots (newest first)")
+    print("─" * 70)
+    for name in snapshots:
+        size = os.path.getsize(os.path.join(SNAPSHOT_DIR, name))
+        print(f"  {name:<55} {size // 1024 + 1:>6} KB")
+    print()
+    return 0
+
+
+def restore_snapshot(name, assume_yes=False):
+    """Replace the database contents with a snapshot (via the backup API)."""
+    import tempfile
+
+    matches = [n for n in _list_snapshots() if n == name or n.startswith(name)]
+    if len(matches) != 1:
+        print(f"❌ {'No' if not matches else 'More than one'} snapshot matches '{name}'. Try 'hop2 snapshot list'.")
+        return 1
+    name = matches[0]
+    if name.endswith(".xz"):
+        import lzma
+        decompress = lzma.decompress
+    else:
+        import gzip
+        decompress = gzip.decompress
+
+    if not assume_yes:
+        print(f"\n⚠️  This will replace ALL current shortcuts with {name}.")
+        try:
+            ans = input("Continue? [y/N]: ")
+        except EOFError:
+            ans = ""
+        if ans.lower() != 'y':
+            print("❌ Restore cancelled.")
+            return 1
+
+    with open(os.path.join(SNAPSHOT_DIR, name), "rb") as f:
+        data = decompress(f.read())
+    fd, tmp = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        src = sqlite3.connect(tmp)
+        try:
+            if src.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                print(f"❌ {name} is corrupt; not restoring it.")
+                return 1
+            # Keep a way back before overwriting
+            create_snapshot(quiet=True)
+            dst = _connect()
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    finally:
+        os.unlink(tmp)
+
+    init_db()  # the snapshot may predate newer migrations
+    _on_db_change()
+    print(f"✅ Restored {name}")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Importers
+#
+# Each parser reads its file as a stream and yields ("d", path, uses,
+# last_used) for directories or ("c", alias, command, None) for commands.
+# ---------------------------------------------------------------------------
+
+def _parse_zoxide(f):
+    """Output of `zoxide query --list --score`: "<score> <path>"."""
+    for line in f:
+        score, _, path = line.strip().partition(" ")
+        try:
+            yield "d", path.strip(), float(score), None
+        except ValueError:
+            continue
+
+
+def _parse_autojump(f):
+    """autojump.txt: "<weight>\t<path>"."""
+    for line in f:
+        weight, _, path = line.rstrip("\n").partition("\t")
+        try:
+            yield "d", path, float(weight), None
+        except ValueError:
+            continue
+
+
+def _parse_z(f):
+    """~/.z (also z.lua, zsh-z): "<path>|<rank>|<epoch>"."""
+    for line in f:
+        path, rank, stamp = (line.rstrip("\n").rsplit("|", 2) + ["", ""])[:3]
+        try:
+            yield "d", path, float(rank), int(stamp) if stamp.isdigit() else None
+        except ValueError:
+            continue
+
+
+def _parse_bash_aliases(f):
+    """Shell alias definitions: "alias name='command'"."""
+    import shlex
+    for line in f:
+        line = line.strip()
+        if not line.startswith("alias "):
+            continue
+        name, sep, value = line[len("alias "):].lstrip("- ").partition("=")
+        if not sep or not name:
+            continue
+        try:
+            words = shlex.split(value, comments=True)
+        except ValueError:
+            continue
+        if words:
+            yield "c", name.strip(), " ".join(words), None
+
+
+IMPORTERS = {
+    "zoxide": _parse_zoxide,
+    "autojump": _parse_autojump,
+    "z": _parse_z,
+    "bash-aliases": _parse_bash_aliases,
+}
+
+
+def _alias_for_path(path):
+    """Suggested alias for a directory: its basename with spaces dashed."""
+    name = os.path.basename(os.path.normpath(path)) or "root"
+    return "-".join(name.split())
+
+
+def _unique_alias(alias, taken):
+    n = 2
+    while f"{alias}-{n}" in taken:
+        n += 1
+    return f"{alias}-{n}"
+
+
+def import_shortcuts(source, filename, on_conflict="skip", keep_missing=False):
+    """Bulk-import shortcuts from another tool in a single transaction."""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = time.perf_counter()
+    try:
+        f = open(os.path.expanduser(filename), encoding="utf-8", errors="replace")
+    except OSError as e:
+        print(f"❌ Cannot read {filename}: {e}")
+        return 1
+
+    init_db()
+    with get_conn() as conn:
+        c = conn.cursor()
+        taken = {r[0] for r in c.execute("SELECT alias FROM directories UNION SELECT alias FROM commands")}
+        known_paths = {r[0] for r in c.execute("SELECT path FROM directories")}
+        taken.update(RESERVED_ALIASES)
+        taken.update(SUBCOMMANDS)
+        created = datetime.now(timezone.utc).isoformat()
+        stats = {"dirs": 0, "cmds": 0, "missing": 0, "conflicts": 0, "renamed": 0}
+
+        dir_entries, cmd_rows = {}, []
+        with f:
+            for kind, key, value, last_used in IMPORTERS[source](f):
+                if kind == "d":
+                    path = os.path.abspath(os.path.expanduser(key))
+                    if path in known_paths:
+                        continue
+                    uses, last = dir_entries.get(path, (0, None))
+                    dir_entries[path] = (max(uses, int(round(value))), last_used or last)
+                else:
+                    cmd_rows.append((key, value))
+
+        # Check every directory concurrently; slow mounts don't serialise the import
+        paths = list(dir_entries)
+        if not keep_missing:
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                exists = list(pool.map(os.path.isdir, paths, chunksize=256))
+            stats["missing"] = exists.count(False)
+            paths = [p for p, ok in zip(paths, exists) if ok]
+
+        def place(alias):
+            """Apply the conflict policy. Returns the alias to write, or None to skip."""
+            if alias not in taken:
+                taken.add(alias)
+                return alias
+            if on_conflict == "overwrite" and alias not in RESERVED_ALIASES and alias not in SUBCOMMANDS:
+                return alias
+            if on_conflict == "rename":
+                stats["renamed"] += 1
+                alias = _unique_alias(alias, taken)
+                taken.add(alias)
+                return alias
+            stats["conflicts"] += 1
+            return None
+
+        dir_rows = []
+        for path in paths:
+            alias = place(_alias_for_path(path))
+            if alias:
+                uses, last_used = dir_entries[path]
+                dir_rows.append((alias, path, created, uses, last_used))
+        cmd_rows = [(alias, command, created) for alias, command in
+                    ((place(a), cmd) for a, cmd in cmd_rows) if alias]
+
+        c.executemany("""
+            INSERT INTO directories (alias, path, created_at, uses, last_used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(alias) DO UPDATE SET path = excluded.path,
+                uses = MAX(uses, excluded.uses), last_used = excluded.last_used
+        """, dir_rows)
+        c.executemany("""
+            INSERT INTO commands (alias, command, created_at) VALUES (?, ?, ?)
+            ON CONFLICT(alias) DO UPDATE SET command = excluded.command
+        """, cmd_rows)
+        stats["dirs"], stats["cmds"] = len(dir_rows), len(cmd_rows)
+
+    _on_db_change()
+    print(f"✅ Imported from {source} in {time.perf_counter() - started:.2f}s")
+    print(f"   • {stats['dirs']} directories")
+    print(f"   • {stats['cmds']} commands")
+    if stats["renamed"]:
+        print(f"   • {stats['renamed']} renamed to avoid existing aliases")
+    if stats["conflicts"]:
+        print(f"   • {stats['conflicts']} skipped (alias already exists; see --on-conflict)")
+    if stats["missing"]:
+        print(f"   • {stats['missing']} skipped (directory no longer exists; see --keep-missing)")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Doctor
+#
+# `hop2 doctor` stats every stored directory on a pool of daemon threads. A
+# path that does not answer within DOCTOR_TIMEOUT is reported as unresponsive
+# and its worker is written off (a hung NFS/SSHFS stat cannot be interrupted);
+# other paths on the same mount are then skipped instead of hanging more
+# workers. Daemon threads never delay exit, unlike ThreadPoolExecutor's.
+# ---------------------------------------------------------------------------
+
+DOCTOR_THREADS = 16
+DOCTOR_MAX_THREADS = 64  # including replacements for hung workers
+DOCTOR_TIMEOUT = 1.0  # seconds per path
+DOCTOR_SEARCH_DEPTH = 2  # levels below the nearest surviving ancestor
+DOCTOR_SEARCH_WIDTH = 500  # directories scanned per level
+
+
+def _mount_points():
+    """Mount points, longest first, from /proc/self/mounts (empty elsewhere)."""
+    try:
+        with open("/proc/self/mounts", encoding="utf-8", errors="replace") as f:
+            points = {line.split()[1].replace("\\040", " ") for line in f if line.strip()}
+    except OSError:
+        return []
+    return sorted(points, key=len, reverse=True)
+
+
+def _mount_of(path, mounts):
+    """The mount holding *path*, or its first two components without a mount table."""
+    for point in mounts:
+        if path == point or path.startswith(point.rstrip(os.sep) + os.sep):
+            return point
+    return os.sep.join(path.split(os.sep)[:3])
+
+
+def _subdirs(path, cache):
+    """Visible subdirectories of *path*, memoised in *cache* for the whole run."""
+    if path not in cache:
+        found = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False):
+                        found.append((entry.name.lower(), entry.path))
+        except OSError:
+            pass
+        cache[path] = found
+    return cache[path]
+
+
+def _move_candidates(path, cache):
+    """Directories named like *path*'s last component near where it used to be."""
+    name = os.path.basename(path).lower()
+    ancestor = os.path.dirname(path)
+    while ancestor != os.path.dirname(ancestor) and not os.path.isdir(ancestor):
+        ancestor = os.path.dirname(ancestor)
+
+    found, frontier = [], [ancestor]
+    for _ in range(DOCTOR_SEARCH_DEPTH):
+        below = []
+        for d in frontier:
+            for lower, sub in _subdirs(d, cache):
+                if lower == name and sub != path:
+                    found.append(sub)
+                below.append(sub)
+        frontier = below[:DOCTOR_SEARCH_WIDTH]
+    return found
+
+
+def _check_directory(path, cache):
+    """(status, candidates) for one stored path; *cache* is shared by the workers."""
+    import stat
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        candidates = _move_candidates(path, cache)
+        return ("moved" if candidates else "missing"), candidates
+    except PermissionError:
+        return "unreadable", []
+    except OSError:
+        return "error", []
+    if not stat.S_ISDIR(st.st_mode):
+        return "missing", _move_candidates(path, cache)
+    if not os.access(path, os.R_OK | os.X_OK):
+        return "unreadable", []
+    return "ok", []
+
+
+def _check_directories(paths, timeout=DOCTOR_TIMEOUT):
+    """Check *paths* concurrently. Returns {path: (status, candidates)}."""
+    import queue
+    import threading
+    import time
+
+    mounts = _mount_points()
+    todo = queue.Queue()
+    for path in paths:
+        todo.put(path)
+    done = queue.Queue()
+    running = {}  # path -> start time, shared with the workers
+    hung_mounts = set()
+    scanned = {}  # directory -> subdirectories, for _move_candidates
+
+    def worker():
+        while True:
+            try:
+                path = todo.get_nowait()
+            except queue.Empty:
+                return
+            if _mount_of(path, mounts) in hung_mounts:
+                done.put((path, ("unresponsive", [])))
+                continue
+            running[path] = time.monotonic()
+            try:
+                result = _check_directory(path, scanned)
+            except Exception:
+                result = ("error", [])
+            running.pop(path, None)
+            done.put((path, result))
+
+    def spawn():
+        threading.Thread(target=worker, daemon=True).start()
+
+    results = {}
+    spawned = min(DOCTOR_THREADS, len(paths))
+    for _ in range(spawned):
+        spawn()
+    while len(results) < len(paths):
+        try:
+            path, result = done.get(timeout=0.05)
+            results.setdefault(path, result)
+            continue
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        stuck = 0
+        for path, started in list(running.items()):
+            if now - started < timeout:
+                continue
+            stuck += 1
+            if path not in results:
+                results[path] = ("unresponsive", [])
+                hung_mounts.add(_mount_of(path, mounts))
+                if spawned < DOCTOR_MAX_THREADS:
+                    spawn()
+                    spawned += 1
+        if stuck >= spawned and not todo.empty():
+            # Every worker is stuck: give up on what is left
+            while True:
+                try:
+                    results.setdefault(todo.get_nowait(), ("unresponsive", []))
+                except queue.Empty:
+                    break
+    return results
+
+
+def doctor(prune=False, fix=False, timeout=DOCTOR_TIMEOUT):
+    """`hop2 doctor`: report broken directory shortcuts, optionally fixing them.
+
+    --fix points moved aliases at their only candidate; --prune removes the
+    missing ones. Both are applied in one transaction. Returns 1 if any
+    shortcut is still broken afterwards.
+    """
+    import time
+
+    started = time.perf_counter()
+    conn = _connect_ro()
+    try:
+        rows = conn.execute("SELECT alias, path FROM directories ORDER BY alias").fetchall()
+    finally:
+        conn.close()
+    results = _check_directories(sorted({path for _, path in rows}), timeout)
+    print(f"🩺 Checked {len(rows)} directories in {time.perf_counter() - started:.2f}s")
+
+    labels = {
+        "missing": "❌ missing",
+        "moved": "🔀 moved",
+        "unreadable": "🔒 unreadable",
+        "unresponsive": "⏳ no reply",
+        "error": "⚠️  error",
+    }
+    removals, updates = [], []
+    problems = 0
+    for alias, path in rows:
+        status, candidates = results[path]
+        if status == "ok":
+            continue
+        problems += 1
+        print(f"  {labels[status]:<14} {alias:<15} → {path}")
+        for candidate in candidates[:3]:
+            print(f"  {'':<14} {'':<15}   maybe {candidate}")
+        if status == "moved" and len(candidates) > 3:
+            print(f"  {'':<14} {'':<15}   … {len(candidates) - 3} more")
+        if fix and status == "moved" and len(candidates) == 1:
+            updates.append((candidates[0], alias, path))
+        elif prune and status in ("missing", "moved"):
+            removals.append((alias, path))
+
+    if not problems:
+        print("✅ All directory shortcuts are healthy.")
+        return 0
+    if updates or removals:
+        with get_conn() as conn:
+            # Matching on the old path leaves aliases changed meanwhile alone
+            conn.executemany("UPDATE directories SET path = ? WHERE alias = ? AND path = ?", updates)
+            conn.executemany("DELETE FROM directories WHERE alias = ? AND path = ?", removals)
+        _on_db_change()
+        if updates:
+            print(f"✅ Fixed {len(updates)} moved shortcut{'s' if len(updates) != 1 else ''}")
+        if removals:
+            print(f"🗑️  Removed {len(removals)} shortcut{'s' if len(removals) != 1 else ''}")
+    elif not (prune or fix):
+        print("\nRun 'hop2 doctor --fix' to follow moved directories, '--prune' to drop missing ones.")
+    # 1 only while something is still broken, so scripts can tell "fixed" apart
+    return 1 if problems > len(updates) + len(removals) else 0
+
+
+# ---------------------------------------------------------------------------
+# Directory learning
+#
+# With HOP2_LEARN=1, init.sh appends "epoch<TAB>path" to
+# ~/.hop2/visits.d/<shell pid>.log whenever the working directory changes.
+# _ingest_visits folds those files into the visits table, which ages scores
+# the way zoxide does: once they add up to more than VISITS_MAX_SCORE, all
+# are scaled down and the ones falling below 1 are forgotten.
+# ---------------------------------------------------------------------------
+
+VISITS_MAX_SCORE = 10000
+VISITS_INGEST_SECONDS = 300  # how often the daemon ingests
+
+
+def _ingest_visits(conn):
+    """Stream every visits.d file into the visits table. Returns the lines read.
+
+    Files are renamed before reading, so shells start a new one with their
+    next visit, and removed before the commit: a crash loses visits rather
+    than counting them twice.
+    """
+    try:
+        names = os.listdir(VISITS_DIR)
+    except OSError:
+        return 0
+    from collections import Counter
+
+    conn.execute("BEGIN IMMEDIATE")  # one ingest at a time
+    try:
+        counts = {}
+        lines = 0
+        for name in names:
+            if not name.endswith(".log"):
+                continue
+            log = os.path.join(VISITS_DIR, name)
+            claimed = f"{log}.{os.getpid()}.ingesting"
+            try:
+                os.replace(log, claimed)
+                f = open(claimed, encoding="utf-8", errors="replace")
+            except OSError:
+                continue  # another ingest got there first
+            # Count whole "<path>\n" tails a megabyte at a time so the per-line
+            # work stays in C; lines are in time order, so the last one seen
+            # for a path has its newest stamp. Parsing waits for the distinct paths.
+            seen, newest = Counter(), {}
+            with f:
+                for chunk in iter(lambda: f.readlines(1 << 20), []):
+                    tails = [line[line.find("\t") + 1:] for line in chunk]
+                    seen.update(tails)
+                    newest.update(zip(tails, chunk))
+            os.unlink(claimed)
+            for tail, n in seen.items():
+                path, stamp = tail.rstrip("\n"), newest[tail].partition("\t")[0]
+                if not path.startswith("/") or not stamp.isdigit():
+                    continue
+                lines += n
+                total, last = counts.get(path, (0, 0))
+                counts[path] = (total + n, max(last, int(stamp)))
+        conn.executemany("""
+            INSERT INTO visits (path, score, last_visit) VALUES (?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET score = score + excluded.score,
+                last_visit = MAX(last_visit, excluded.last_visit)
+        """, ((p, n, t) for p, (n, t) in counts.items()))
+        total = conn.execute("SELECT SUM(score) FROM visits").fetchone()[0] or 0
+        if total > VISITS_MAX_SCORE:
+            conn.execute("UPDATE visits SET score = score * ?", (0.9 * VISITS_MAX_SCORE / total,))
+            conn.execute("DELETE FROM visits WHERE score < 1")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return lines
+
+
+def suggest_aliases(limit=10):
+    """`hop2 suggest`: the most frecent visited directories that have no alias yet."""
+    import shlex
+    import time
+
+    with get_conn() as conn:
+        _ingest_visits(conn)
+        rows = conn.execute("""
+            SELECT path, score, last_visit FROM visits v
+             WHERE NOT EXISTS (SELECT 1 FROM directories d WHERE d.path = v.path)
+             ORDER BY score DESC LIMIT ?
+        """, (limit * 5,)).fetchall()
+        taken = {r[0] for r in conn.execute("SELECT alias FROM directories UNION SELECT alias FROM commands")}
+    taken.update(RESERVED_ALIASES)
+    taken.update(SUBCOMMANDS)
+
+    if not os.environ.get("HOP2_LEARN") and not rows:
+        print("No visits recorded. Set HOP2_LEARN=1 before sourcing init.sh to learn directories.")
+        return 1
+    now = time.time()
+    home = os.path.expanduser("~")
+    rows.sort(key=lambda r: -_frecency(r[1], r[2], now))
+    picked = [r for r in rows if r[0] not in (home, os.sep) and os.path.isdir(r[0])][:limit]
+    if not picked:
+        print("No suggestions: the directories you visit most already have aliases (or are gone).")
+        return 0
+
+    print("\n💡 Often visited, no alias yet")
+    print("─" * 70)
+    for path, score, _ in picked:
+        alias = _alias_for_path(path)
+        alias = _unique_alias(alias, taken) if alias in taken else alias
+        taken.add(alias)
+        shown = f"~{path[len(home):]}" if path.startswith(home + os.sep) else path
+        print(f"  {alias:<15} → {shown:<45} (score {score:.0f})")
+        print(f"  {'':<15}   hop2 add {shlex.quote(alias)} {shlex.quote(path)}")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Project files
+#
+# A .hop2.toml or .hop2.json in the working directory or any parent adds
+# aliases on top of the global database (the nearest file wins):
+#
+#     [dirs]                        {"dirs": {"api": "services/api"},
+#     api = "services/api"           "cmds": {"build": "make -j8"}}
+#     [cmds]
+#     build = "make -j8"
+#
+# Relative paths are relative to the file. PROJECT_CACHE (marshal, so no
+# json or tomllib import on a hop) remembers which project files each
+# directory holds, keyed by the directory's mtime, and each file's parsed
+# aliases and SHA-256, keyed by its mtime and size.
+#
+# A cloned repository could otherwise redefine `gs` to run anything, so a
+# file is only used once `hop2 allow` has recorded its path and SHA-256 in
+# PROJECT_TRUST ("sha256<TAB>path" lines). Any edit needs a new allow.
+# ---------------------------------------------------------------------------
+
+PROJECT_FILES = (".hop2.toml", ".hop2.json")
+PROJECT_CACHE = os.path.join(DB_DIR, "projects.cache")
+PROJECT_TRUST = os.path.join(DB_DIR, "trusted")
+PROJECT_CACHE_DIRS = 5000  # directories remembered before the cache starts over
+
+
+def _parse_project_file(path, raw):
+    """{"d": {alias: path}, "c": {alias: command}} from *raw*, the bytes of
+    the project file *path*.
+
+    Returns None when it is TOML and tomllib (Python 3.11+) is unavailable.
+    """
+    try:
+        if path.endswith(".toml"):
+            try:
+                import tomllib
+            except ImportError:
+                return None
+            data = tomllib.loads(raw.decode("utf-8"))
+        else:
+            import json
+            data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("expected a table/object at the top level")
+        base = os.path.dirname(path)
+        dirs = {str(a): os.path.normpath(os.path.join(base, os.path.expanduser(str(p))))
+                for a, p in (data.get("dirs") or {}).items()}
+        cmds = {str(a): str(c) for a, c in (data.get("cmds") or {}).items()}
+    except (ValueError, AttributeError) as e:
+        print(f"⚠️  Ignoring {path}: {e}", file=sys.stderr)
+        return {"d": {}, "c": {}}
+    return {"d": dirs, "c": cmds}
+
+
+def _read_trust():
+    """{project file: SHA-256} of the files `hop2 allow` approved."""
+    trusted = {}
+    try:
+        with open(PROJECT_TRUST, encoding="utf-8") as f:
+            for line in f:
+                digest, _, path = line.rstrip("\n").partition("\t")
+                if path:
+                    trusted[path] = digest
+    except OSError:
+        pass
+    return trusted
+
+
+def _project_aliases(start=None):
+    """({alias: (kind, target, source file)}, [(file, reason, its aliases)]) for
+    *start* (the cwd). The second list holds the files that were not used:
+    reason "toml" (no tomllib) or "untrusted" (not allowed, or changed since).
+
+    Files nearer to *start* override farther ones.
+    """
+    import marshal
+
+    try:
+        start = os.path.abspath(start or os.getcwd())
+    except OSError:
+        return {}, []  # the working directory was deleted
+    try:
+        with open(PROJECT_CACHE, "rb") as f:
+            cache = marshal.load(f)
+    except (OSError, ValueError, EOFError, TypeError):
+        cache = {"dirs": {}, "files": {}}
+    dirty = False
+
+    found = []  # nearest first
+    d = start
+    while True:
+        try:
+            mtime = os.stat(d).st_mtime_ns
+        except OSError:
+            mtime = None
+        cached = cache["dirs"].get(d)
+        if cached and cached[0] == mtime:
+            names = cached[1]
+        else:
+            names = tuple(n for n in PROJECT_FILES if os.path.isfile(os.path.join(d, n)))
+            cache["dirs"][d] = (mtime, names)
+            dirty = True
+        found.extend(os.path.join(d, n) for n in reversed(names))
+        parent = os.path.dirname(d)
+        if parent == d:
+            break
+        d = parent
+
+    aliases, skipped = {}, []
+    trusted = _read_trust() if found else {}
+    for path in reversed(found):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = (st.st_mtime_ns, st.st_size)
+        cached = cache["files"].get(path)
+        if cached and cached[0] == key and len(cached) == 3:
+            parsed, digest = cached[1], cached[2]
+        else:
+            import hashlib
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+            except OSError:
+                continue
+            parsed = _parse_project_file(path, raw)
+            if parsed is None:
+                skipped.append((path, "toml", set()))
+                continue
+            digest = hashlib.sha256(raw).hexdigest()
+            cache["files"][path] = (key, parsed, digest)
+            dirty = True
+        if trusted.get(path) != digest:
+            skipped.append((path, "untrusted", set(parsed["d"]) | set(parsed["c"])))
+            continue
+        for kind in ("d", "c"):
+            for alias, target in parsed[kind].items():
+                if alias not in SUBCOMMANDS and alias not in RESERVED_ALIASES:
+                    aliases[alias] = (kind, target, path)
+
+    if dirty:
+        if len(cache["dirs"]) > PROJECT_CACHE_DIRS:
+            cache = {"dirs": {}, "files": {}}
+        if os.path.isdir(DB_DIR):
+            _write_atomic(PROJECT_CACHE, marshal.dumps(cache))
+    return aliases, skipped
+
+
+def allow_project(filename=None, deny=False):
+    """`hop2 allow|deny [FILE]`: trust a project file as it is now, or stop
+    trusting it. Without FILE, every project file that applies here."""
+    import hashlib
+
+    if filename:
+        paths = [os.path.abspath(filename)]
+        if os.path.basename(paths[0]) not in PROJECT_FILES or not os.path.isfile(paths[0]):
+            print(f"❌ Not a project file: {filename} (expected {' or '.join(PROJECT_FILES)})")
+            return 1
+    else:
+        paths, d = [], os.getcwd()
+        while True:
+            paths.extend(os.path.join(d, n) for n in PROJECT_FILES if os.path.isfile(os.path.join(d, n)))
+            if os.path.dirname(d) == d:
+                break
+            d = os.path.dirname(d)
+        if not paths:
+            print("❌ No .hop2.toml or .hop2.json here or in any parent directory.")
+            return 1
+
+    trusted = _read_trust()
+    if deny:
+        for path in paths:
+            if trusted.pop(path, None):
+                print(f"🚫 Denied {path}")
+            else:
+                print(f"   {path} was not allowed")
+    else:
+        conn = _connect_ro()
+        try:
+            mine = {r[0]: r[1] for r in conn.execute(
+                "SELECT alias, 'directory' FROM directories UNION ALL SELECT alias, 'command' FROM commands")}
+        finally:
+            conn.close()
+        for path in paths:
+            with open(path, "rb") as f:
+                raw = f.read()
+            parsed = _parse_project_file(path, raw)
+            if parsed is None:
+                print(f"⚠️  Skipped {path}: reading TOML needs Python 3.11+ (or use .hop2.json)")
+                continue
+            trusted[path] = hashlib.sha256(raw).hexdigest()
+            print(f"✅ Allowed {path}")
+            for kind, icon in (("d", "📁"), ("c", "⚡")):
+                for alias, target in sorted(parsed[kind].items()):
+                    note = f"  ⤴ overrides your {mine[alias]} '{alias}'" if alias in mine else ""
+                    print(f"   {icon} {alias:<13} → {target}{note}")
+    os.makedirs(DB_DIR, exist_ok=True)
+    _write_atomic(PROJECT_TRUST, "".join(f"{d}\t{p}\n" for p, d in sorted(trusted.items())))
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Subdirectory index
+#
+# `hop2 api/src/services` hops below the directory alias `api`, and Tab
+# completes such paths from the subdirs table (one row per directory,
+# relative to the alias target) instead of walking the tree on a keystroke.
+# A root is indexed in a background `hop2 __index` the first time something
+# below it is completed; later refreshes (from completion once the index is
+# TREE_REFRESH_SECONDS old, or from the daemon) stat() every known directory
+# and list only those whose mtime changed, since creating, removing or
+# renaming a subdirectory always touches its parent.
+# ---------------------------------------------------------------------------
+
+TREE_IGNORE = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+               ".mypy_cache", ".pytest_cache", ".gradle", ".next", "bazel-out"}
+TREE_MAX_DEPTH = 8  # levels below the alias target
+TREE_MAX_DIRS = 100000  # per alias target
+TREE_REFRESH_SECONDS = 60
+TREE_LOCK = os.path.join(DB_DIR, "index.lock")
+
+
+def _tree_ignored():
+    """Directory names never indexed: TREE_IGNORE plus $HOP2_TREE_IGNORE (colon-separated)."""
+    extra = os.environ.get("HOP2_TREE_IGNORE", "")
+    return TREE_IGNORE.union(name for name in extra.split(":") if name)
+
+
+def _scan_subdirs(path, ignored):
+    """[(name, mtime_ns)] of the subdirectories of *path*, symlinks excluded."""
+    found = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name in ignored:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        found.append((entry.name, entry.stat(follow_symlinks=False).st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return found
+
+
+def _index_tree(root, known):
+    """Changes that bring the index of *root* up to date.
+
+    *known* maps each indexed rel path ("" for the root) to its mtime.
+    Returns ([(rel, mtime)] to upsert, [rel] whose subtrees are gone), or
+    None when the root itself is gone.
+    """
+    ignored = _tree_ignored()
+    try:
+        root_mtime = os.stat(root).st_mtime_ns
+    except OSError:
+        return None
+
+    children = {}
+    for rel in known:
+        if rel:
+            parent, _, name = rel.rpartition("/")
+            children.setdefault(parent, set()).add(name)
+    upserts, removed = [], []
+    gone = set()
+    count = len(known)
+
+    def below_gone(rel):
+        while rel:
+            if rel in gone:
+                return True
+            rel = rel.rpartition("/")[0]
+        return False
+
+    def relist(rel, depth):
+        """List *rel* again: index new subtrees and drop vanished ones."""
+        nonlocal count
+        if depth >= TREE_MAX_DEPTH:
+            return
+        pending = [(rel, depth)]
+        while pending:
+            current, level = pending.pop()
+            listed = _scan_subdirs(os.path.join(root, current), ignored)
+            names = {name for name, _ in listed}
+            for name in children.get(current, ()):
+                if name not in names:
+                    child = f"{current}/{name}" if current else name
+                    gone.add(child)
+                    removed.append(child)
+            for name, mtime in listed:
+                child = f"{current}/{name}" if current else name
+                if child in known:
+                    continue
+                if count >= TREE_MAX_DIRS:
+                    return
+                count += 1
+                upserts.append((child, mtime))
+                if level + 1 < TREE_MAX_DEPTH:
+                    pending.append((child, level + 1))
+
+    if known.get("") != root_mtime:
+        upserts.append(("", root_mtime))
+        relist("", 0)
+    for rel in sorted(known):
+        if not rel or below_gone(rel):
+            continue
+        try:
+            mtime = os.stat(os.path.join(root, rel)).st_mtime_ns
+        except OSError:
+            gone.add(rel)
+            removed.append(rel)
+            continue
+        if mtime != known[rel]:
+            upserts.append((rel, mtime))
+            relist(rel, rel.count("/") + 1)
+    return upserts, removed
+
+
+def _refresh_tree(root):
+    """Update the index of one root. Returns the number of rows changed."""
+    import time
+    conn = _connect_ro()
+    try:
+        known = dict(conn.execute("SELECT rel, mtime FROM subdirs WHERE root = ?", (root,)))
+    finally:
+        conn.close()
+    changes = _index_tree(root, known)
+    with get_conn() as conn:
+        if changes is None:
+            conn.execute("DELETE FROM subdirs WHERE root = ?", (root,))
+            conn.execute("DELETE FROM subdir_roots WHERE root = ?", (root,))
+            return len(known)
+        upserts, removed = changes
+        for rel in removed:
+            # rel itself and everything below it ("/" + 1 == "0")
+            conn.execute("DELETE FROM subdirs WHERE root = ? AND (rel = ? OR (rel >= ? AND rel < ?))",
+                         (root, rel, rel + "/", rel + "0"))
+        conn.executemany("INSERT INTO subdirs (root, rel, mtime) VALUES (?, ?, ?) "
+                         "ON CONFLICT(root, rel) DO UPDATE SET mtime = excluded.mtime",
+                         ((root, rel, mtime) for rel, mtime in upserts))
+        conn.execute("INSERT INTO subdir_roots (root, indexed_at) VALUES (?, ?) "
+                     "ON CONFLICT(root) DO UPDATE SET indexed_at = excluded.indexed_at",
+                     (root, int(time.time())))
+    return len(upserts) + len(removed)
+
+
+def index_trees(roots=()):
+    """`hop2 __index [ROOT ...]`: index ROOTs, or refresh every indexed root.
+
+    Runs in the background. One indexer works at a time; the others wait
+    and then skip roots that were refreshed in the meantime.
+    """
+    import time
+    init_db()
+    try:
+        import fcntl
+        lock = open(TREE_LOCK, "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    except ImportError:
+        lock = None  # Windows: no flock, indexers may overlap
+    try:
+        conn = _connect_ro()
+        try:
+            indexed = dict(conn.execute("SELECT root, indexed_at FROM subdir_roots"))
+        finally:
+            conn.close()
+        if roots:
+            now = time.time()
+            todo = [r for r in roots if now - indexed.get(r, 0) >= TREE_REFRESH_SECONDS]
+        else:
+            # Forget roots no directory alias points at any more
+            with get_conn() as conn:
+                conn.execute("DELETE FROM subdirs WHERE root NOT IN (SELECT path FROM directories)")
+                conn.execute("DELETE FROM subdir_roots WHERE root NOT IN (SELECT path FROM directories)")
+                todo = [r[0] for r in conn.execute("SELECT root FROM subdir_roots")]
+        for root in dict.fromkeys(todo):
+            try:
+                _refresh_tree(root)
+            except sqlite3.Error:
+                pass  # retried on the next refresh
+    finally:
+        if lock:
+            lock.close()
+    return 0
+
+
+def _spawn_indexer(*roots):
+    """Index *roots* (refresh every indexed root when none) in a detached
+    background process. Returns the process, or None if it did not start."""
+    import subprocess
+    try:
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), "__index", *roots],
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        return None
+
+
+def _subpath_root(head):
+    """Target of the directory alias *head* (project files first), or None."""
+    project = _project_aliases()[0]
+    if head in project:
+        kind, target, _ = project[head]
+        return target if kind == "d" else None
+    conn = _connect_ro()
+    try:
+        row = conn.execute("SELECT path FROM directories WHERE alias = ?", (head,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def _complete_subpath(word):
+    """Completions for "alias/partial/path": "alias/<subdirectory>/" entries."""
+    import time
+    head, _, rest = word.partition("/")
+    try:
+        root = _subpath_root(head)
+    except sqlite3.Error:
+        return []
+    if not root:
+        return []
+    parent, _, partial = rest.rpartition("/")
+    prefix = f"{parent}/{partial}" if parent else partial
+    indexed = None
+    try:
+        conn = _connect_ro()
+        try:
+            indexed = conn.execute("SELECT indexed_at FROM subdir_roots WHERE root = ?", (root,)).fetchone()
+            if indexed:
+                # Direct children of parent only: no "/" after the parent's prefix
+                rels = [r[0] for r in conn.execute(
+                    "SELECT rel FROM subdirs WHERE root = ? AND rel >= ? AND rel < ? AND rel != '' "
+                    "AND instr(substr(rel, ?), '/') = 0",
+                    (root, prefix, prefix + "\U0010ffff", len(parent) + 2 if parent else 1))]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        indexed = None
+    if not indexed:
+        # Not indexed yet: list just this one directory
+        rels = [f"{parent}/{name}" if parent else name
+                for name, _ in _scan_subdirs(os.path.join(root, parent), _tree_ignored())
+                if name.startswith(partial)]
+    if not indexed or time.time() - indexed[0] >= TREE_REFRESH_SECONDS:
+        _spawn_indexer(root)
+    return sorted(f"{head}/{rel}/" for rel in rels)
+
+
+# ---------------------------------------------------------------------------
+# Sync
+#
+# `hop2 sync <dir>` merges shortcuts between devices through any shared
+# directory. Each device appends its operations to
+# <dir>/hop2-sync/<device>.ndjson, one JSON object per line after an
+# {"o": "hdr", "id": random} header:
+#   {"t": ms, "o": "set", "k": "d"|"c", "a": alias, "v": path or command, "s": seq}
+#   {"t": ms, "o": "rm",  "k": "d"|"c", "a": alias, "s": seq}
+#   {"t": ms, "o": "use", "k": "d"|"c", "a": alias, "n": hops, "s": seq}
+# and reads only what the other devices appended since its last sync
+# (sync_peers holds the header id and byte offset of each file). set/rm
+# are last-writer-wins on (t, device), remembered per alias in sync_clock;
+# use adds n to uses.
+#
+# Once a directory has been synced, triggers on the alias tables log every
+# change to sync_ops until it has been written to every sync directory.
+# The first sync to a directory writes the full state instead.
+# ---------------------------------------------------------------------------
+
+SYNC_SUBDIR = "hop2-sync"
+SYNC_DEVICE_FILE = os.path.join(DB_DIR, "device")
+
+# Milliseconds since the epoch, in SQL
+_SQL_NOW_MS = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+
+def _create_sync_triggers(conn):
+    """Log changes to the alias tables to sync_ops once `hop2 sync` has been used."""
+    # An upsert, not INSERT OR REPLACE: an outer statement's conflict
+    # clause (such as restore's ON CONFLICT) overrides a trigger's
+    touch = "ON CONFLICT(kind, alias) DO UPDATE SET ts = excluded.ts, device = excluded.device"
+    for table, column, kind in (("directories", "path", "d"), ("commands", "command", "c")):
+        enabled = "EXISTS (SELECT 1 FROM sync_dirs)"
+        log_set = f"""INSERT INTO sync_ops (ts, op, kind, alias, value) VALUES ({_SQL_NOW_MS}, 'set', '{kind}', new.alias, new.{column});
+                      INSERT INTO sync_clock VALUES ('{kind}', new.alias, {_SQL_NOW_MS}, '') {touch};"""
+        log_use = f"""INSERT INTO sync_ops (ts, op, kind, alias, n)
+                      SELECT COALESCE(new.last_used * 1000, {_SQL_NOW_MS}), 'use', '{kind}', new.alias,
+                             COALESCE(new.uses, 0) - {{old_uses}}
+                       WHERE COALESCE(new.uses, 0) <> {{old_uses}};"""
+        log_rm = f"""INSERT INTO sync_ops (ts, op, kind, alias) VALUES ({_SQL_NOW_MS}, 'rm', '{kind}', old.alias);
+                     INSERT INTO sync_clock VALUES ('{kind}', old.alias, {_SQL_NOW_MS}, '') {touch};"""
+        conn.execute(f"""CREATE TRIGGER {table}_sync_ai AFTER INSERT ON {table} WHEN {enabled} BEGIN
+                           {log_set}
+                           {log_use.format(old_uses="0")}
+                         END""")
+        conn.execute(f"""CREATE TRIGGER {table}_sync_au AFTER UPDATE OF alias, {column} ON {table}
+                         WHEN (old.alias IS NOT new.alias OR old.{column} IS NOT new.{column}) AND {enabled} BEGIN
+                           {log_set}
+                         END""")
+        conn.execute(f"""CREATE TRIGGER {table}_sync_au_alias AFTER UPDATE OF alias ON {table}
+                         WHEN old.alias IS NOT new.alias AND {enabled} BEGIN
+                           {log_rm}
+                         END""")
+        conn.execute(f"""CREATE TRIGGER {table}_sync_au_uses AFTER UPDATE OF uses ON {table}
+                         WHEN old.uses IS NOT new.uses AND {enabled} BEGIN
+                           {log_use.format(old_uses="COALESCE(old.uses, 0)")}
+                         END""")
+        conn.execute(f"""CREATE TRIGGER {table}_sync_ad AFTER DELETE ON {table} WHEN {enabled} BEGIN
+                           {log_rm}
+                         END""")
+
+
+def _sync_device():
+    """This device's name in sync directories, created on first use."""
+    try:
+        with open(SYNC_DEVICE_FILE, encoding="utf-8") as f:
+            device = f.read().strip()
+        if device:
+            return device
+    except OSError:
+        pass
+    import secrets
+    import socket
+    host = "".join(ch if ch.isalnum() or ch in "-_" else "-" for ch in socket.gethostname()) or "host"
+    device = f"{host}-{secrets.token_hex(3)}"
+    os.makedirs(DB_DIR, exist_ok=True)
+    _write_atomic(SYNC_DEVICE_FILE, device + "\n")
+    return device
+
+
+def _sync_export(conn, sent, bootstrap=None):
+    """NDJSON lines for the operations after seq *sent*. Returns (lines, last seq).
+
+    *bootstrap* "full" describes every alias and its uses instead; "sets"
+    leaves the uses out, for peers that may have counted them already.
+    """
+    import json
+
+    home = os.path.expanduser("~")
+    last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_ops").fetchone()[0]
+    if bootstrap:
+        # Aliases changed before syncing started are as old as their created_at
+        for table, kind in (("directories", "d"), ("commands", "c")):
+            conn.execute(f"""INSERT OR IGNORE INTO sync_clock
+                             SELECT '{kind}', alias, COALESCE(CAST((julianday(created_at) - 2440587.5)
+                                                                   * 86400000 AS INTEGER), 0), ''
+                               FROM {table}""")
+        query = """
+            SELECT k.ts, 'set', 'd', d.alias, d.path, NULL, NULL FROM directories d
+              JOIN sync_clock k ON k.kind = 'd' AND k.alias = d.alias
+            UNION ALL
+            SELECT k.ts, 'set', 'c', c.alias, c.command, NULL, NULL FROM commands c
+              JOIN sync_clock k ON k.kind = 'c' AND k.alias = c.alias"""
+        if bootstrap == "full":
+            query += """
+            UNION ALL
+            SELECT COALESCE(last_used, 0) * 1000, 'use', 'd', alias, NULL, uses, NULL FROM directories WHERE uses > 0
+            UNION ALL
+            SELECT COALESCE(last_used, 0) * 1000, 'use', 'c', alias, NULL, uses, NULL FROM commands WHERE uses > 0"""
+        ops = conn.execute(query)
+    else:
+        ops = conn.execute("SELECT ts, op, kind, alias, value, n, seq FROM sync_ops WHERE seq > ? AND seq <= ? "
+                           "ORDER BY seq", (sent, last))
+    lines = []
+    for ts, op, kind, alias, value, n, seq in ops:
+        rec = {"t": ts, "o": op, "k": kind, "a": alias}
+        if op == "set":
+            if kind == "d" and value.startswith(home + os.sep):
+                value = "~" + value[len(home):]  # home directories differ between machines
+            rec["v"] = value
+        elif op == "use":
+            rec["n"] = n
+        if seq:
+            rec["s"] = seq
+        lines.append(json.dumps(rec, separators=(",", ":")) + "\n")
+    return lines, last
+
+
+def _sync_read_peers(conn, directory, folder, device):
+    """Operations the other devices appended since the last sync.
+
+    Returns ([(ts, device, op, kind, alias, value, n)], {device: (file id, new offset)}, bad lines).
+    """
+    import json
+
+    offsets = {device: (file_id, pos) for device, file_id, pos in conn.execute(
+        "SELECT device, file_id, pos FROM sync_peers WHERE dir = ?", (directory,))}
+    ops, positions, bad = [], {}, 0
+    for name in sorted(os.listdir(folder)):
+        peer = name[:-len(".ndjson")]
+        if not name.endswith(".ndjson") or peer == device:
+            continue
+        known_id, pos = offsets.get(peer, (None, 0))
+        try:
+            with open(os.path.join(folder, name), "rb") as f:
+                header = f.readline()
+                if not header.endswith(b"\n"):
+                    continue  # still being created
+                try:
+                    file_id = str(json.loads(header)["id"])
+                except (ValueError, KeyError, TypeError):
+                    file_id = ""
+                size = os.fstat(f.fileno()).st_size
+                if file_id != known_id or size < pos:
+                    if known_id is not None:
+                        print(f"⚠️  {name} was replaced; reading it again from the start")
+                    pos = len(header)
+                f.seek(pos)
+                data = f.read()
+        except OSError as e:
+            print(f"⚠️  Skipping {name}: {e}")
+            continue
+        # A line still being written (or synced) has no newline yet
+        data = data[:data.rfind(b"\n") + 1]
+        positions[peer] = (file_id, pos + len(data))
+        for line in data.decode("utf-8", "replace").splitlines():
+            try:
+                rec = json.loads(line)
+                op, kind, alias = rec["o"], rec["k"], str(rec["a"])
+                if op not in ("set", "rm", "use") or kind not in ("d", "c"):
+                    raise ValueError(op)
+                value = str(rec["v"]) if op == "set" else None
+                ops.append((int(rec["t"]), peer, op, kind, alias, value, int(rec.get("n") or 0)))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                bad += 1
+    return ops, positions, bad
+
+
+def _sync_apply(conn, ops, device):
+    """Merge peer operations. Returns (applied, superseded)."""
+    applied = superseded = 0
+    clocks = {}
+    for kind, alias, ts, dev in conn.execute("SELECT kind, alias, ts, device FROM sync_clock"):
+        clocks[kind, alias] = (ts, dev or device)
+    tables = {"d": ("directories", "path"), "c": ("commands", "command")}
+
+    # Adds and removals first, oldest first, so uses find the aliases they count
+    for ts, peer, op, kind, alias, value, _ in sorted((o for o in ops if o[2] != "use"), key=lambda o: o[:2]):
+        if alias in RESERVED_ALIASES:
+            continue
+        if (ts, peer) <= clocks.get((kind, alias), (0, device)):
+            superseded += 1
+            continue
+        table, column = tables[kind]
+        if op == "set":
+            if kind == "d":
+                value = os.path.expanduser(value)
+            created = datetime.fromtimestamp(ts / 1000, timezone.utc).isoformat()
+            conn.execute(f"INSERT INTO {table} (alias, {column}, created_at) VALUES (?, ?, ?) "
+                         f"ON CONFLICT(alias) DO UPDATE SET {column} = excluded.{column}",
+                         (alias, value, created))
+        else:
+            conn.execute(f"DELETE FROM {table} WHERE alias = ?", (alias,))
+        conn.execute("INSERT OR REPLACE INTO sync_clock VALUES (?, ?, ?, ?)", (kind, alias, ts, peer))
+        clocks[kind, alias] = (ts, peer)
+        applied += 1
+
+    uses = {}
+    for ts, _, op, kind, alias, _, n in ops:
+        if op == "use":
+            total, last = uses.get((kind, alias), (0, 0))
+            uses[kind, alias] = (total + n, max(last, ts // 1000))
+    for kind, (table, _) in tables.items():
+        rows = [(n, last or None, a) for (k, a), (n, last) in uses.items() if k == kind]
+        conn.executemany(f"UPDATE {table} SET uses = MAX(0, COALESCE(uses, 0) + ?), "
+                         f"last_used = MAX(COALESCE(last_used, 0), COALESCE(?, 0)) WHERE alias = ?", rows)
+    applied += sum(1 for o in ops if o[2] == "use")
+    return applied, superseded
+
+
+def _sync_recover(path, committed, sent):
+    """The last seq in *path* past byte *committed*, dropping a partly written line."""
+    import json
+
+    with open(path, "rb+") as f:
+        f.seek(committed)
+        tail = f.read()
+        end = tail.rfind(b"\n") + 1
+        f.truncate(committed + end)
+    for line in tail[:end].splitlines():
+        try:
+            sent = max(sent, int(json.loads(line).get("s", 0)))
+        except (ValueError, TypeError, AttributeError):
+            pass
+    return sent
+
+
+def _sync_dir(conn, directory, device):
+    """Exchange operations with one sync directory, in one transaction.
+
+    Returns (sent, received, applied, superseded, peers).
+    """
+    folder = os.path.join(directory, SYNC_SUBDIR)
+    os.makedirs(folder, exist_ok=True)
+    mine = os.path.join(folder, f"{device}.ndjson")
+
+    conn.execute("BEGIN IMMEDIATE")  # one sync at a time
+    try:
+        row = conn.execute("SELECT sent, size FROM sync_dirs WHERE dir = ?", (directory,)).fetchone()
+        sent, bootstrap = (row[0], None) if row else (0, "full")
+        try:
+            size = os.path.getsize(mine)
+        except OSError:
+            size = -1
+        if row is None:
+            if size > 0:
+                os.truncate(mine, 0)  # left by an interrupted first sync
+        elif size < row[1]:
+            print(f"⚠️  {mine} is missing or shorter than expected; writing every shortcut again")
+            bootstrap = "sets"
+            if size > 0:
+                os.truncate(mine, 0)
+        elif size > row[1]:
+            # The last sync was interrupted after writing; peers may have read
+            # those operations, so they count as sent
+            sent = _sync_recover(mine, row[1], sent)
+        lines, last = _sync_export(conn, sent, bootstrap)
+
+        ops, positions, bad = _sync_read_peers(conn, directory, folder, device)
+        # Applying logs the merged changes to sync_ops like any other
+        # change; drop them, the devices they came from already have them
+        before = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_ops").fetchone()[0]
+        applied, superseded = _sync_apply(conn, ops, device)
+        conn.execute("DELETE FROM sync_ops WHERE seq > ?", (before,))
+
+        if bootstrap:
+            # A new id tells peers to read this file from the start again
+            import secrets
+            lines.insert(0, f'{{"o":"hdr","id":"{secrets.token_hex(8)}"}}\n')
+        with open(mine, "ab") as f:
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        conn.execute("INSERT OR REPLACE INTO sync_dirs (dir, sent, size) VALUES (?, ?, ?)",
+                     (directory, last, size))
+        conn.executemany("INSERT OR REPLACE INTO sync_peers (dir, device, file_id, pos) VALUES (?, ?, ?, ?)",
+                         ((directory, peer, file_id, pos) for peer, (file_id, pos) in positions.items()))
+        # Operations every sync directory has are no longer needed
+        conn.execute("DELETE FROM sync_ops WHERE seq <= (SELECT MIN(sent) FROM sync_dirs)")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if bad:
+        print(f"⚠️  Ignored {bad} unreadable line{'s' if bad != 1 else ''}")
+    return len(lines) - (1 if bootstrap else 0), len(ops), applied, superseded, len(positions)
+
+
+def sync(directory=None):
+    """`hop2 sync [dir]`: exchange changes with other devices through a shared directory.
+
+    Without *dir*, syncs with every directory used before.
+    """
+    with get_conn() as conn:
+        if directory:
+            directories = [os.path.abspath(os.path.expanduser(directory))]
+            if not os.path.isdir(directories[0]):
+                print(f"❌ Not a directory: {directories[0]}")
+                return 1
+        else:
+            directories = [r[0] for r in conn.execute("SELECT dir FROM sync_dirs ORDER BY dir")]
+            if not directories:
+                print("❌ No sync directory yet. Usage: hop2 sync <shared dir>")
+                return 1
+        _fold_usage(conn)  # hops still in usage.log are sent too
+        device = _sync_device()
+        changed = False
+        for d in directories:
+            try:
+                sent, received, applied, superseded, peers = _sync_dir(conn, d, device)
+            except OSError as e:
+                print(f"❌ Could not sync with {d}: {e}")
+                continue
+            changed = changed or applied > 0
+            print(f"🔄 {d}  (this device: {device})")
+            print(f"   ↑ {sent} operation{'s' if sent != 1 else ''} sent")
+            print(f"   ↓ {received} from {peers} other device{'s' if peers != 1 else ''}: "
+                  f"{applied} applied, {superseded} superseded by newer changes")
+    if changed:
+        _on_db_change()
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Fan-out
+#
+# `hop2 each <cmd-alias> <dir aliases or patterns> [--under PATH]` runs a
+# command alias in many saved directories, at most -j at a time. _run_jobs
+# is the process pool: every job gets its own process group, so a fail-fast
+# stop or Ctrl-C takes down whole pipelines rather than just the shell.
+# ---------------------------------------------------------------------------
+
+def _stop_process(proc):
+    import signal
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGTERM)
+        else:
+            proc.terminate()
+    except OSError:
+        pass  # already gone
+
+
+def _run_jobs(jobs, parallel, buffered=False, fail_fast=False, deps=None):
+    """Run [(name, command, cwd)] with at most *parallel* running at once.
+
+    Output lines are printed as they arrive, prefixed with the job name, or
+    all at once when the job ends if *buffered*. With *fail_fast* the first
+    failure stops the running jobs and skips the rest. *deps* maps a job
+    name to the jobs that must succeed before it starts; it is skipped if
+    one of them does not.
+    Returns {name: (status, exit code, seconds)}, status being "ok",
+    "failed", "stopped" or "skipped".
+    """
+    import queue
+    import subprocess
+    import threading
+    import time
+
+    deps = deps or {}
+    width = max(len(name) for name, _, _ in jobs)
+    lock = threading.Lock()
+    finished = queue.Queue()
+    pending = list(jobs)
+    running, stopped, results = {}, set(), {}
+
+    def pump(name, proc, started):
+        lines = []
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            if buffered:
+                lines.append(line)
+            else:
+                with lock:
+                    print(f"{name:<{width}} │ {line}", flush=True)
+        code = proc.wait()
+        seconds = time.perf_counter() - started
+        if buffered:
+            with lock:
+                print(f"── {name} (exit {code}, {seconds:.1f}s) " + "─" * max(0, 40 - len(name)))
+                for line in lines:
+                    print(line)
+                sys.stdout.flush()
+        finished.put((name, code, seconds))
+
+    def blocked(name):
+        return any(d in results and results[d][0] != "ok" for d in deps.get(name, ()))
+
+    def ready(name):
+        return all(d in results for d in deps.get(name, ()))
+
+    try:
+        while pending or running:
+            for job in [j for j in pending if blocked(j[0])]:
+                pending.remove(job)
+                results[job[0]] = ("skipped", None, 0.0)
+            while len(running) < parallel and not (fail_fast and stopped):
+                job = next((j for j in pending if ready(j[0])), None)
+                if job is None:
+                    break
+                pending.remove(job)
+                name, command, cwd = job
+                started = time.perf_counter()
+                try:
+                    proc = subprocess.Popen(command, shell=True, cwd=cwd, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            start_new_session=os.name == "posix")
+                except OSError as e:
+                    with lock:
+                        print(f"{name:<{width}} │ ❌ {e}", flush=True)
+                    finished.put((name, 127, 0.0))
+                    running[name] = None
+                    continue
+                running[name] = proc
+                threading.Thread(target=pump, args=(name, proc, started), daemon=True).start()
+            if not running:
+                break
+            name, code, seconds = finished.get()
+            del running[name]
+            if name in stopped:
+                results[name] = ("stopped", code, seconds)
+            else:
+                results[name] = ("ok" if code == 0 else "failed", code, seconds)
+                if code != 0 and fail_fast and not stopped:
+                    stopped.update(running)
+                    stopped.add(name)  # nothing new starts from here on
+                    for proc in running.values():
+                        if proc:
+                            _stop_process(proc)
+    except KeyboardInterrupt:
+        for proc in running.values():
+            if proc:
+                _stop_process(proc)
+        raise
+    for name, _, _ in pending:
+        results[name] = ("skipped", None, 0.0)
+    return results
+
+
+def _print_job_results(names, results, notes=None):
+    """Print _run_jobs *results* as a table, one row per name (*notes* adds a
+    column). Returns (every job succeeded, summary of the counts)."""
+    icons = {"ok": "✅", "failed": "❌", "stopped": "⏹ ", "skipped": "⏭ "}
+    width = max(len(n) for n in names)
+    print("\n" + "─" * (width + 26))
+    for n in names:
+        status, code, seconds = results[n]
+        detail = f"exit {code:<4} {seconds:>7.1f}s" if status in ("ok", "failed") else status
+        if notes and notes.get(n):
+            detail = f"{detail:<18}  {notes[n]}"
+        print(f"  {icons[status]} {n:<{width}}  {detail}")
+    counts = {s: sum(1 for r in results.values() if r[0] == s) for s in icons}
+    summary = f"{counts['ok']} succeeded, {counts['failed']} failed"
+    if counts["stopped"] or counts["skipped"]:
+        summary += f", {counts['stopped']} stopped, {counts['skipped']} skipped"
+    return counts["ok"] == len(names), summary
+
+
+def _each_targets(names, under):
+    """[(alias, path)] of the directory aliases named by *names* (aliases or
+    shell-style patterns) and/or below *under*, in alias order."""
+    where, params = [], []
+    if names:
+        where.append("(" + " OR ".join("alias GLOB ?" for _ in names) + ")")
+        params.extend(names)
+    if under:
+        clause, under_params = _under_clause(under)
+        where.append(clause)
+        params.extend(under_params)
+    conn = _connect_ro()
+    try:
+        rows = conn.execute(f"SELECT alias, path FROM directories WHERE {' AND '.join(where)} ORDER BY alias",
+                            params).fetchall()
+    finally:
+        conn.close()
+    found = {alias for alias, _ in rows}
+    for name in names:
+        if not any(ch in name for ch in "*?[") and name not in found:
+            print(f"⚠️  No directory shortcut '{name}'")
+    return rows
+
+
+def run_each(alias, names=(), under=None, parallel=None, buffered=False, fail_fast=False):
+    """`hop2 each`: run a command alias in every selected directory."""
+    import time
+
+    project, _ = _project_aliases()
+    if alias in project and project[alias][0] == "c":
+        command = project[alias][1]
+    else:
+        command = get_command(alias)
+    if not command:
+        print(f"❌ No command shortcut '{alias}'. Try 'hop2 list --cmds'.")
+        return 1
+    if not names and not under:
+        print("❌ Name the directories: aliases, patterns such as 'svc-*', or --under PATH.")
+        return 1
+    targets = _each_targets(list(names), under)
+    if not targets:
+        print("❌ No directory shortcuts matched.")
+        return 1
+    missing = [a for a, p in targets if not os.path.isdir(p)]
+    for a in missing:
+        print(f"⚠️  Skipping {a}: {dict(targets)[a]} does not exist (see 'hop2 doctor')")
+    targets = [(a, p) for a, p in targets if a not in missing]
+
+    parallel = max(1, parallel or os.cpu_count() or 1)
+    print(f"→ Running '{command}' in {len(targets)} director{'ies' if len(targets) != 1 else 'y'} "
+          f"({min(parallel, len(targets))} at a time)")
+    sys.stdout.flush()
+    started, wall = time.perf_counter(), time.time()
+    try:
+        results = _run_jobs([(a, command, p) for a, p in targets], parallel, buffered, fail_fast)
+    except KeyboardInterrupt:
+        print("\n❌ Interrupted")
+        return 130
+    elapsed = time.perf_counter() - started
+    end = wall + elapsed
+    _record_runs([(alias, end - results[a][2], end, results[a][1], p) for a, p in targets
+                  if results[a][0] in ("ok", "failed")])
+
+    ok, summary = _print_job_results([a for a, _ in targets], results)
+    ok = ok and not missing
+    print(f"{'✅' if ok else '❌'} {summary} in {elapsed:.1f}s")
+    return 0 if ok else 1
+
+
+# ---------------------------------------------------------------------------
+# Composite commands
+#
+# `hop2 cmd ci --step lint --step test --step build:lint,test` saves a
+# command alias whose steps are other command aliases. NAME:DEP,... makes a
+# step wait for its dependencies. The steps column stores one spec per line,
+# and the command column holds a serial equivalent ("hop2 lint && ...") for
+# anything that doesn't know about steps. Running the alias runs the
+# graph with _run_jobs: independent steps run concurrently up to -j, and
+# the first failure stops the running steps and skips the rest.
+# ---------------------------------------------------------------------------
+
+def _parse_steps(specs):
+    """{step: [dependencies]} from NAME[:DEP,...] specs; raises ValueError."""
+    graph = {}
+    for spec in specs:
+        name, _, deps = spec.partition(":")
+        name = name.strip()
+        if not name:
+            raise ValueError(f"Invalid step '{spec}'. Use NAME or NAME:DEP,DEP.")
+        if name in graph:
+            raise ValueError(f"Step '{name}' is listed twice.")
+        graph[name] = [d.strip() for d in deps.split(",") if d.strip()]
+    for name, deps in graph.items():
+        for dep in deps:
+            if dep not in graph:
+                raise ValueError(f"Step '{name}' depends on '{dep}', which is not one of the steps.")
+    return graph
+
+
+def _format_steps(graph):
+    return "\n".join(f"{name}:{','.join(deps)}" if deps else name for name, deps in graph.items())
+
+
+def _describe_steps(graph):
+    return ", ".join(f"{name} (after {', '.join(deps)})" if deps else name for name, deps in graph.items())
+
+
+def _step_order(graph):
+    """The steps of *graph* in an order that respects every dependency.
+
+    Raises ValueError naming a cycle if there is one.
+    """
+    waiting = {name: set(deps) for name, deps in graph.items()}
+    order = []
+    while waiting:
+        ready = [name for name, deps in waiting.items() if not deps]
+        if not ready:
+            # Every step left waits on another one left: walk until one repeats
+            name, seen = next(iter(waiting)), []
+            while name not in seen:
+                seen.append(name)
+                name = min(waiting[name])
+            cycle = seen[seen.index(name):] + [name]
+            raise ValueError(f"Steps depend on each other in a cycle: {' → '.join(cycle)}")
+        for name in ready:
+            del waiting[name]
+        for deps in waiting.values():
+            deps.difference_update(ready)
+        order.extend(ready)
+    return order
+
+
+def _check_steps(c, alias, graph):
+    """Raise ValueError unless every step is an existing command alias and
+    none of them runs *alias* again through steps of its own."""
+    project = {a for a, (kind, _, _) in _project_aliases()[0].items() if kind == "c"}
+    for name in graph:
+        if name == alias:
+            raise ValueError(f"'{alias}' cannot be a step of itself.")
+        if name not in project and not c.execute("SELECT 1 FROM commands WHERE alias = ?", (name,)).fetchone():
+            raise ValueError(f"Step '{name}' is not a command alias. Add it first with 'hop2 cmd {name} ...'.")
+    seen, todo = set(), list(graph)
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        row = c.execute("SELECT steps FROM commands WHERE alias = ?", (name,)).fetchone()
+        for sub in _parse_steps(row[0].split("\n")) if row and row[0] else ():
+            if sub == alias:
+                raise ValueError(f"'{alias}' would run itself again through the steps of '{name}'.")
+            todo.append(sub)
+
+
+def _run_steps(alias, steps, extra_args):
+    """Run a composite command alias. Returns an exit code."""
+    import time
+
+    if os.environ.get("HOP2_SHELL") == "1":
+        # Live, prefixed output: the shell reruns us without capturing
+        print("__HOP2_DIRECT")
+        return 0
+    parallel, args = None, list(extra_args or [])
+    while args:
+        flag = args.pop(0)
+        if flag in ("-j", "--jobs") and args:
+            value = args.pop(0)
+        elif flag.startswith("--jobs="):
+            value = flag[len("--jobs="):]
+        else:
+            value = flag[2:] if flag.startswith("-j") else ""
+        if not value.isdigit():
+            print(f"❌ '{alias}' runs steps; the only option it takes is -j N.")
+            return 1
+        parallel = int(value)
+
+    graph = _parse_steps(steps.split("\n"))
+    chain = os.environ.get("HOP2_STEPS_OF", "").split()
+    if alias in chain:
+        print(f"❌ '{alias}' runs itself through its steps: {' → '.join(chain + [alias])}")
+        return 1
+    project = _project_aliases()[0]
+    jobs, via_hop2 = [], set()
+    conn = _connect_ro()
     try:
-        yield conn
+        for name in graph:
+            if name in project and project[name][0] == "c":
+                command = project[name][1]
+            else:
+                row = conn.execute("SELECT command, cache_ttl, steps FROM commands WHERE alias = ?",
+                                   (name,)).fetchone()
+                if not row:
+                    print(f"❌ Step '{name}' of '{alias}' is not a command alias any more.")
+                    return 1
+                command = row[0]
+                if row[1] or row[2]:
+                    # Cached or composite itself: let hop2 run it
+                    command = " ".join(_sh_quote(a) for a in (sys.executable, os.path.abspath(__file__), name))
+                    via_hop2.add(name)  # which records its runs itself
+            jobs.append((name, command, os.getcwd()))
     finally:
-        conn.commit()
         conn.close()
 
+    parallel = max(1, parallel or os.cpu_count() or 1)
+    print(f"→ Running {alias}: {len(jobs)} step{'s' if len(jobs) != 1 else ''} "
+          f"({min(parallel, len(jobs))} at a time)")
+    sys.stdout.flush()
+    os.environ["HOP2_STEPS_OF"] = " ".join(chain + [alias])
+    started, wall = time.perf_counter(), time.time()
+    try:
+        results = _run_jobs(jobs, parallel, fail_fast=True, deps=graph)
+    except KeyboardInterrupt:
+        print("\n❌ Interrupted")
+        return 130
+    elapsed = time.perf_counter() - started
 
-def init_db():
-    """Initialize the database"""
-    os.makedirs(DB_DIR, exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS directories
-                     (
-                         alias
-                         TEXT
-                         PRIMARY
-                         KEY,
-                         path
-                         TEXT
-                         NOT
-                         NULL,
-                         created_at
-                         TEXT,
-                         uses
-                         INTEGER
-                         DEFAULT
-                         0
-                     )''')
-        c.execute('''CREATE TABLE IF NOT EXISTS commands
-                     (
-                         alias
-                         TEXT
-                         PRIMARY
-                         KEY,
-                         command
-                         TEXT
-                         NOT
-                         NULL,
-                         created_at
-                         TEXT,
-                         uses
-                         INTEGER
-                         DEFAULT
-                         0
-                     )''')
+    order = _step_order(graph)
+    notes = {name: f"after {', '.join(deps)}" for name, deps in graph.items() if deps}
+    ok, summary = _print_job_results(order, results, notes)
+    total = sum(seconds for _, _, seconds in results.values())
+    print(f"{'✅' if ok else '❌'} {summary} in {elapsed:.1f}s (steps took {total:.1f}s in all)")
+    code = 0 if ok else next((results[n][1] for n in order if results[n][0] == "failed" and results[n][1] > 0), 1)
+    # Steps finished (not stopped or skipped) count as runs of their own aliases
+    end, cwd = wall + elapsed, os.getcwd()
+    _record_runs([(n, end - s, end, c, cwd) for n, (status, c, s) in results.items()
+                  if status in ("ok", "failed") and n not in via_hop2] + [(alias, wall, end, code, cwd)])
+    return code
 
 
-def add_directory(alias, path=None):
-    """Add a directory shortcut"""
-    if alias in RESERVED_ALIASES:
-        print(f"❌ '{alias}' is a reserved keyword and cannot be used.")
-        return 1
+# ---------------------------------------------------------------------------
+# Run history
+#
+# Each run of a command alias appends "alias<TAB>start<TAB>end<TAB>exit
+# code<TAB>cwd" to runs.log (times in epoch seconds, with a fraction when
+# the clock has one): init.sh around the commands it runs itself, hop2
+# around the ones it waits for anyway (cache misses, steps, each) and,
+# with HOP2_RUNS=1, around plain commands it would otherwise exec.
+# _fold_runs moves the lines into the runs table that `hop2 stats` reads,
+# and keeps that table small: past RUNS_DETAIL_DAYS each alias keeps
+# RUNS_PER_DAY rows per day and outcome, spread over the durations, each
+# counting (n) the runs it stands for, plus the slowest; past
+# RUNS_KEEP_DAYS, or beyond RUNS_MAX_ROWS, the oldest rows go.
+# HOP2_RUNS=0 records nothing.
+# ---------------------------------------------------------------------------
 
-    if path is None:
-        path = os.getcwd()
-    else:
-        path = os.path.abspath(os.path.expanduser(path))
+RUNS_FOLD_BYTES = 256 * 1024  # fold runs.log into the database past this size
+RUNS_DETAIL_DAYS = 7
+RUNS_PER_DAY = 20
+RUNS_KEEP_DAYS = 90
+RUNS_MAX_ROWS = 50000
+STATS_DAYS = 30
+DAY_MS = 86400 * 1000
 
-    if not os.path.exists(path):
-        print(f"❌ Path does not exist: {path}")
-        return 1
 
-    created = datetime.now(timezone.utc).isoformat()
-    with get_conn() as conn:
-        c = conn.cursor()
+def _record_runs(runs):
+    """Append [(alias, start, end, exit code, cwd)] to runs.log; folded into runs later."""
+    if not runs or os.environ.get("HOP2_RUNS") == "0":
+        return
+    try:
+        size = _append_log(RUNS_LOG, "".join(f"{a}\t{start:.6f}\t{end:.6f}\t{code}\t{cwd}\n"
+                                             for a, start, end, code, cwd in runs))
+    except OSError:
+        return
+    if size >= RUNS_FOLD_BYTES:
         try:
-            c.execute(
-                "INSERT INTO directories (alias, path, created_at) VALUES (?, ?, ?)",
-                (alias, path, created)
-            )
-            print(f"✅ Created: {alias} → {path}")
-        except sqlite3.IntegrityError:
-            c.execute(
-                "UPDATE directories SET path = ? WHERE alias = ?", (path, alias)
-            )
-            print(f"✅ Updated: {alias} → {path}")
-    return 0
-
-
-def add_command(alias, cmd_parts):
-    """Add a command shortcut"""
-    if alias in RESERVED_ALIASES:
-        print(f"❌ '{alias}' is a reserved keyword and cannot be used.")
-        return 1
+            with get_conn() as conn:
+                _fold_runs(conn)
+        except (sqlite3.Error, OSError):
+            pass  # Another process holds the lock; the log is folded next time
 
-    command = ' '.join(cmd_parts)
-    created = datetime.now(timezone.utc).isoformat()
-    with get_conn() as conn:
-        c = conn.cursor()
-        try:
-            c.execute(
-                "INSERT INTO commands (alias, command, created_at) VALUES (?, ?, ?)",
-                (alias, command, created)
-            )
-            print(f"✅ Created command: {alias} → {command}")
-        except sqlite3.IntegrityError:
-            c.execute(
-                "UPDATE commands SET command = ? WHERE alias = ?", (command, alias)
-            )
-            print(f"✅ Updated command: {alias} → {command}")
-    return 0
 
+def _run_recorded(alias, argv, full):
+    """_run_command_line without the exec: spawn the command (argv, else
+    /bin/sh -c *full*), wait for it and record the run. Returns its exit code."""
+    import signal
+    from time import time
 
-def get_directory(alias):
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT path FROM directories WHERE alias = ?", (alias,))
-        row = c.fetchone()
-        if row:
-            c.execute("UPDATE directories SET uses = uses + 1 WHERE alias = ?", (alias,))
-            return row[0]
-    return None
+    # Like system(3): the command gets ^C and ^\, hop2 waits for it to end
+    signals = (signal.SIGINT, signal.SIGQUIT)
+    saved = [signal.signal(s, signal.SIG_IGN) for s in signals]
+    started = time()
+    try:
+        pid = None
+        if argv:
+            try:
+                pid = os.posix_spawnp(argv[0], argv, os.environ, setsigdef=signals)
+            except FileNotFoundError:
+                pass  # Probably a shell builtin such as `exit` or `export`
+        if pid is None:
+            pid = os.posix_spawn("/bin/sh", ["sh", "-c", full], os.environ, setsigdef=signals)
+        status = os.waitpid(pid, 0)[1]
+    except OSError as e:
+        print(f"❌ Could not run '{full}': {e}")
+        return 126 if isinstance(e, PermissionError) else 127
+    finally:
+        for s, handler in zip(signals, saved):
+            signal.signal(s, handler)
+    code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+    _record_runs([(alias, started, time(), code, os.getcwd())])
+    return code
 
 
-def get_command(alias):
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT command FROM commands WHERE alias = ?", (alias,))
-        row = c.fetchone()
-        if row:
-            c.execute("UPDATE commands SET uses = uses + 1 WHERE alias = ?", (alias,))
-            return row[0]
-    return None
+def _fold_runs(conn):
+    """Fold runs.log into the runs table, then thin and trim the table.
 
+    The log is renamed before it is read so shells can keep appending.
+    """
+    import time
 
-def list_all(_=None):
-    """Lists all shortcuts, visualizing directory paths from a common root."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row  # Make sure we can access columns by name
-        c = conn.cursor()
-        c.execute("SELECT alias, path, uses FROM directories ORDER BY path")
-        dirs = c.fetchall()
-        c.execute("SELECT alias, command, uses FROM commands ORDER BY uses DESC, alias")
-        cmds = c.fetchall()
+    # Folds take turns under the write lock; two at once would both insert
+    # the same .folding file
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    pending = RUNS_LOG + ".folding"
+    if not os.path.exists(pending):
+        try:
+            os.replace(RUNS_LOG, pending)
+        except OSError:
+            pending = None
+    if pending:
+        for lines in _drain_log(pending):
+            rows = []
+            for line in lines:
+                fields = line.rstrip("\n").split("\t", 4)
+                if len(fields) < 4 or not fields[0]:
+                    continue
+                try:
+                    # EPOCHREALTIME uses the locale's decimal separator
+                    start, end = (float(x.replace(",", ".")) for x in fields[1:3])
+                    code = int(fields[3])
+                except ValueError:
+                    continue
+                rows.append((fields[0], int(start * 1000), max(0, round((end - start) * 1000)), code,
+                             fields[4] if len(fields) > 4 and fields[4] else None))
+            conn.executemany("INSERT INTO runs (alias, started, duration, code, cwd) VALUES (?, ?, ?, ?, ?)", rows)
 
-    if dirs:
-        print("\n📁 Directory Shortcuts (Hopper is ready to jump!)")
-        print("─" * 70)
+    now_ms = int(time.time() * 1000)
+    conn.execute("DELETE FROM runs WHERE started < ?", (now_ms - RUNS_KEEP_DAYS * DAY_MS,))
+    groups = {}
+    for rowid, alias, day, failed, duration, n in conn.execute(
+            "SELECT rowid, alias, started / ?, code != 0, duration, n FROM runs WHERE started < ?",
+            (DAY_MS, now_ms - RUNS_DETAIL_DAYS * DAY_MS)):
+        groups.setdefault((alias, day, failed), []).append((duration, n, rowid))
+    drop, weights = [], []
+    for rows in groups.values():
+        if len(rows) <= RUNS_PER_DAY + 1:
+            continue
+        # Cut the runs, by duration, into RUNS_PER_DAY slices and keep the
+        # median of each for all of its runs, plus the slowest run as itself
+        rows.sort()
+        _, n, slowest = rows.pop()
+        weights.append((n, slowest))
+        for i in range(RUNS_PER_DAY):
+            part = rows[i * len(rows) // RUNS_PER_DAY:(i + 1) * len(rows) // RUNS_PER_DAY]
+            keep = part[len(part) // 2][2]
+            weights.append((sum(n for _, n, _ in part), keep))
+            drop.extend((rowid,) for _, _, rowid in part if rowid != keep)
+    conn.executemany("UPDATE runs SET n = ? WHERE rowid = ?", weights)
+    conn.executemany("DELETE FROM runs WHERE rowid = ?", drop)
+    excess = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] - RUNS_MAX_ROWS
+    if excess > 0:
+        conn.execute("DELETE FROM runs WHERE rowid IN (SELECT rowid FROM runs ORDER BY started LIMIT ?)",
+                     (excess,))
+    conn.commit()
+    _mark("fold_runs")
 
-        dir_paths = [d['path'] for d in dirs]
-        # Find the longest common starting path
-        # os.path.commonpath raises ValueError on Windows when paths span drives
-        try:
-            common_base = os.path.commonpath(dir_paths) if len(dir_paths) > 1 else os.path.dirname(dir_paths[0])
-        except ValueError:
-            common_base = None
 
-        home_dir = os.path.expanduser("~")
+def _percentile(rows, p):
+    """Duration below which a fraction *p* of the runs fall, from
+    [(duration, n)] sorted by duration."""
+    target = p * sum(n for _, n in rows)
+    seen = 0
+    for duration, n in rows:
+        seen += n
+        if seen >= target:
+            return duration
+    return rows[-1][0]
 
-        if common_base:
-            # Use normcase for case-insensitive comparison on Windows
-            if os.path.normcase(common_base).startswith(os.path.normcase(home_dir)):
-                display_base = f"~{common_base[len(home_dir):]}"
-            else:
-                display_base = common_base
-            print(f"🌲 Common Root: {display_base}/\n")
 
-            for d in dirs:
-                relative_path = os.path.relpath(d['path'], common_base)
-                print(f"  {d['alias']:<15} → ./{relative_path:<40} ({d['uses']} uses)")
-        else:
-            # Paths span multiple drives — show full paths
-            print()
-            for d in dirs:
-                print(f"  {d['alias']:<15} → {d['path']:<45} ({d['uses']} uses)")
+def _format_ms(ms):
+    if ms < 1000:
+        return f"{ms}ms"
+    if ms < 60000:
+        return f"{ms / 1000:.1f}s"
+    return f"{ms // 60000}m{ms // 1000 % 60:02d}s"
 
-        # The 'r' before the """ fixes the SyntaxWarning
-        print(r"""
-                     .--.
-                    |o_o |
-                    |:_/ |
-                   //   \ \
-                  (|     | )
-                 /'\_   _/`\
-                 \___)=(___/
-        """)
 
-    if cmds:
-        print("\n⚡ Command Shortcuts")
-        print("─" * 70)
-        for alias, command, uses in cmds:
-            display_cmd = command if len(command) <= 45 else f"{command[:42]}..."
-            print(f"  {alias:<15} → {display_cmd:<45} ({uses} uses)")
+def _trend(rows, middle):
+    """("▲ 35%"-style p50 change of the runs from *middle* on against those
+    before, (p50 before, p50 after)), or ("", None) without both halves.
+    *rows* are (started, duration, n)."""
+    older = sorted((d, n) for t, d, n in rows if t < middle)
+    newer = sorted((d, n) for t, d, n in rows if t >= middle)
+    if not older or not newer:
+        return "", None
+    before, after = _percentile(older, 0.5), _percentile(newer, 0.5)
+    change = (after - before) / before if before else 0.0
+    if abs(change) < 0.1:
+        return "≈", (before, after)
+    return f"{'▲' if change > 0 else '▼'} {abs(change):.0%}", (before, after)
 
-    if not dirs and not cmds:
-        print("No shortcuts yet. Go add some! `hop2 add <alias>`")
 
+def run_stats(alias=None, days=STATS_DAYS):
+    """`hop2 stats [alias]`: duration percentiles, failure rate and trend of
+    the runs of command aliases over the last *days* days."""
+    import time
 
-def remove_shortcut(alias):
-    """Remove a directory or command shortcut."""
-    with get_conn() as conn:
-        c = conn.cursor()
-        # Try to delete from directories
-        c.execute("DELETE FROM directories WHERE alias = ?", (alias,))
-        if c.rowcount:
-            print(f"✅ Removed directory shortcut: {alias}")
-            return 0
-        # If not found, try to delete from commands
-        c.execute("DELETE FROM commands WHERE alias = ?", (alias,))
-        if c.rowcount:
-            print(f"✅ Removed command shortcut: {alias}")
-            return 0
-    # If not found in either table
-    print(f"❌ No shortcut found with the alias: {alias}")
-    return 1
+    try:
+        with get_conn() as conn:
+            _fold_runs(conn)
+    except (sqlite3.Error, OSError):
+        pass  # Show what is folded already
+    now_ms = int(time.time() * 1000)
+    since = now_ms - days * DAY_MS
+    conn = _connect_ro()
+    try:
+        query = "SELECT alias, started, duration, code, n, cwd FROM runs WHERE started >= ?"
+        params = [since]
+        if alias:
+            query += " AND alias = ?"
+            params.append(alias)
+        runs = {}
+        for row in conn.execute(query + " ORDER BY started", params):
+            runs.setdefault(row[0], []).append(row[1:])
+    finally:
+        conn.close()
+    if not runs:
+        which = f"'{alias}'" if alias else "command aliases"
+        print(f"No runs of {which} in the last {days} days.")
+        return 1 if alias else 0
 
+    middle = since + days * DAY_MS // 2
+    if not alias:
+        print(f"\n📊 Runs in the last {days} days (trend: p50, second half of the window against the first)")
+        print("─" * 76)
+        print(f"{'alias':<20}{'runs':>7}{'failed':>8}{'p50':>9}{'p95':>9}{'max':>9}   trend")
+        for name, rows in sorted(runs.items()):
+            durations = sorted((d, n) for _, d, _, n, _ in rows)
+            total = sum(n for _, n in durations)
+            failed = sum(n for _, _, code, n, _ in rows if code != 0)
+            trend, _ = _trend([(t, d, n) for t, d, _, n, _ in rows], middle)
+            print(f"{name:<20}{total:>7}{failed / total:>8.0%}{_format_ms(_percentile(durations, 0.5)):>9}"
+                  f"{_format_ms(_percentile(durations, 0.95)):>9}{_format_ms(durations[-1][0]):>9}   {trend}")
+        return 0
 
-def generate_cd_command(alias):
-    path = get_directory(alias)
-    if path:
-        print(f"__HOP2_CD:{path}")
-        return True
-    return False
+    rows = runs[alias]
+    durations = sorted((d, n) for _, d, _, n, _ in rows)
+    total = sum(n for _, n in durations)
+    codes = {}
+    for _, _, code, n, _ in rows:
+        if code != 0:
+            codes[code] = codes.get(code, 0) + n
+    failed = sum(codes.values())
+    trend, p50s = _trend([(t, d, n) for t, d, _, n, _ in rows], middle)
+    print(f"\n📊 {alias}: last {days} days")
+    print("─" * 50)
+    print(f"  runs      {total} ({failed} failed, {failed / total:.0%})")
+    print(f"  duration  p50 {_format_ms(_percentile(durations, 0.5))} · p95 "
+          f"{_format_ms(_percentile(durations, 0.95))} · max {_format_ms(durations[-1][0])}")
+    if trend:
+        print(f"  trend     p50 {trend} ({_format_ms(p50s[0])} → {_format_ms(p50s[1])})")
+    if codes:
+        print("  failures  " + ", ".join(f"exit {c} ×{n}" for c, n in sorted(codes.items(), key=lambda kv: -kv[1])))
 
+    # Median duration per day, oldest first ("·": no runs that day)
+    bars = " ▁▂▃▄▅▆▇█"
+    daily = {}
+    for started, duration, _, n, _ in rows:
+        daily.setdefault((started - since) // DAY_MS, []).append((duration, n))
+    p50 = {day: _percentile(sorted(values), 0.5) for day, values in daily.items()}
+    peak = max(p50.values()) or 1
+    line = "".join(bars[max(1, -(-p50[d] * (len(bars) - 1) // peak))] if d in p50 else "·"
+                   for d in range(days))
+    print(f"  daily p50 {line}")
+    started, duration, code, _, cwd = rows[-1]
+    ago = (now_ms - started) // 1000
+    when = f"{ago}s" if ago < 60 else f"{ago // 60}m" if ago < 3600 else \
+        f"{ago // 3600}h" if ago < 86400 else f"{ago // 86400}d"
+    print(f"  last run  {when} ago, exit {code}, {_format_ms(duration)}" + (f", in {cwd}" if cwd else ""))
+    return 0
 
-def run_command(alias, extra_args=None):
-    cmd = get_command(alias)
-    if cmd:
-        full = f"{cmd} {' '.join(extra_args)}" if extra_args else cmd
-        print(f"→ Running: {full}")
-        subprocess.run(full, shell=True)
-        return True
-    return False
 
+# ---------------------------------------------------------------------------
+# Resolver daemon
+#
+# `hop2 --daemon` keeps both alias tables in memory and answers one-line
+# requests on a per-user Unix socket, so init.sh can resolve directory hops
+# without starting Python. Requests:
+#   resolve <alias>   -> "__HOP2_CD:<path>", or an empty line (ask hop2)
+#   complete <prefix> -> matching aliases, one per line
+#   list              -> "<alias>\t<dir|cmd>\t<target>" lines
+#   invalidate        -> reload the tables from the database
+#   ping / stop
+# ---------------------------------------------------------------------------
 
-def backup_data(filename=None):
-    """Backup hop2 data to a JSON file"""
-    if filename is None:
-        # Default filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"hop2_backup_{timestamp}.json"
+def _daemon_request(request, timeout=0.5):
+    """Send a request to a running daemon. Returns the reply, or None if it is not up."""
+    if not os.path.exists(DAEMON_SOCK):
+        return None
+    import socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(DAEMON_SOCK)
+            s.sendall(request.encode() + b"\n")
+            chunks = []
+            while True:
+                data = s.recv(65536)
+                if not data:
+                    break
+                chunks.append(data)
+        return b"".join(chunks).decode()
+    except OSError:
+        return None
 
-    backup_data = {
-        "version": "2.0",
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "database": {
-            "directories": [],
-            "commands": []
-        }
-    }
 
-    with get_conn() as conn:
-        c = conn.cursor()
+class _ResolverDaemon:
+    FLUSH_SECONDS = 10
 
-        # Get directories
-        c.execute("SELECT alias, path, created_at, uses FROM directories")
-        for row in c.fetchall():
-            backup_data["database"]["directories"].append({
-                "alias": row[0],
-                "path": row[1],
-                "created_at": row[2],
-                "uses": row[3]
-            })
+    def __init__(self):
+        self.dirs = {}
+        self.cmds = {}
+        self.pending_uses = {}
+        self.reload()
 
-        # Get commands
-        c.execute("SELECT alias, command, created_at, uses FROM commands")
-        for row in c.fetchall():
-            backup_data["database"]["commands"].append({
-                "alias": row[0],
-                "command": row[1],
-                "created_at": row[2],
-                "uses": row[3]
-            })
+    def flush_uses(self):
+        """Write the hop counters batched in memory to the database."""
+        if not self.pending_uses:
+            return
+        try:
+            with get_conn() as conn:
+                conn.executemany("UPDATE directories SET uses = uses + ?, "
+                                 "last_used = MAX(COALESCE(last_used, 0), ?) WHERE alias = ?",
+                                 [(n, t, a) for a, (n, t) in self.pending_uses.items()])
+            self.pending_uses.clear()
+        except sqlite3.Error:
+            pass  # Keep counting in memory and retry on the next flush
 
-    # Write to file
-    with open(filename, 'w') as f:
-        json.dump(backup_data, f, indent=2)
+    def reload(self):
+        conn = _connect_ro()
+        try:
+            self.dirs = dict(conn.execute("SELECT alias, path FROM directories"))
+            self.cmds = dict(conn.execute("SELECT alias, command FROM commands"))
+        finally:
+            conn.close()
+        self.sorted_aliases = sorted(set(self.dirs) | set(self.cmds))
 
-    total_dirs = len(backup_data["database"]["directories"])
-    total_cmds = len(backup_data["database"]["commands"])
+    def handle(self, line):
+        verb, _, arg = line.partition(" ")
+        if verb == "resolve":
+            path = self.dirs.get(arg) if arg not in SUBCOMMANDS else None
+            if path is None:
+                return "\n", None
+            return f"__HOP2_CD:{path}\n", arg
+        if verb == "complete":
+            import bisect
+            i = bisect.bisect_left(self.sorted_aliases, arg)
+            out = []
+            for alias in self.sorted_aliases[i:]:
+                if not alias.startswith(arg):
+                    break
+                out.append(alias + "\n")
+            return "".join(out), None
+        if verb == "list":
+            rows = [f"{a}\tdir\t{p}\n" for a, p in sorted(self.dirs.items())]
+            rows += [f"{a}\tcmd\t{c}\n" for a, c in sorted(self.cmds.items())]
+            return "".join(rows), None
+        if verb == "invalidate":
+            self.flush_uses()
+            self.reload()
+            return "ok\n", None
+        if verb == "ping":
+            return f"pong {os.getpid()}\n", None
+        return "error unknown request\n", None
 
-    print(f"✅ Backup saved to: {filename}")
-    print(f"   • {total_dirs} directories")
-    print(f"   • {total_cmds} commands")
-    return 0
+    def serve(self):
+        import socket
+        import time
+        if os.path.exists(DAEMON_SOCK):
+            os.unlink(DAEMON_SOCK)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            server.bind(DAEMON_SOCK)
+        finally:
+            os.umask(old_umask)
+        server.listen(64)
+        server.settimeout(self.FLUSH_SECONDS)
+        next_ingest = next_index = time.monotonic()
+        indexer = None
+        next_flush = next_ingest + self.FLUSH_SECONDS
+        try:
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    next_flush = time.monotonic() + self.FLUSH_SECONDS
+                    self.flush_uses()
+                    if time.monotonic() >= next_ingest:
+                        next_ingest = time.monotonic() + VISITS_INGEST_SECONDS
+                        try:
+                            with get_conn() as db:
+                                _ingest_visits(db)
+                                _fold_runs(db)
+                        except (sqlite3.Error, OSError):
+                            pass  # retried on the next interval
+                    # In another process: a big tree would stall every request,
+                    # and index_trees waits for any `__index` already running
+                    if time.monotonic() >= next_index and (indexer is None or indexer.poll() is not None):
+                        next_index = time.monotonic() + TREE_REFRESH_SECONDS
+                        indexer = _spawn_indexer()
+                    continue
+                with conn:
+                    conn.settimeout(1.0)
+                    try:
+                        line = conn.makefile("r").readline().rstrip("\n")
+                    except OSError:
+                        continue
+                    if line == "stop":
+                        conn.sendall(b"ok\n")
+                        break
+                    try:
+                        reply, used = self.handle(line)
+                    except sqlite3.Error:
+                        reply, used = "\n", None
+                    try:
+                        conn.sendall(reply.encode())
+                    except OSError:
+                        pass
+                if used:
+                    n, _ = self.pending_uses.get(used, (0, 0))
+                    self.pending_uses[used] = (n + 1, int(time.time()))
+                # Busy: accept() may never time out, so flush on the clock too
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + self.FLUSH_SECONDS
+                    self.flush_uses()
+        finally:
+            self.flush_uses()
+            server.close()
+            if os.path.exists(DAEMON_SOCK):
+                os.unlink(DAEMON_SOCK)
 
 
-def restore_data(filename):
-    """Restore hop2 data from a JSON file"""
-    if not os.path.exists(filename):
-        print(f"❌ Backup file not found: {filename}")
+def daemon_control(action="start"):
+    """Start, stop or report on the resolver daemon."""
+    import socket
+    if not hasattr(socket, "AF_UNIX"):
+        print("❌ The hop2 daemon needs Unix domain sockets, which this platform lacks.")
         return 1
 
-    try:
-        with open(filename, 'r') as f:
-            backup_data = json.load(f)
-    except Exception as e:
-        print(f"❌ Error reading backup file: {e}")
+    reply = _daemon_request("ping")
+    if action == "status":
+        if reply:
+            print(f"✅ hop2 daemon is running (pid {reply.split()[-1]}) on {DAEMON_SOCK}")
+            return 0
+        print("💤 hop2 daemon is not running.")
         return 1
 
-    # Initialize database if it doesn't exist
-    init_db()
-
-    # Handle both v1.0 (flat) and v2.0 (database) backup formats
-    version = backup_data.get("version", "1.0")
+    if action == "stop":
+        if not reply:
+            print("💤 hop2 daemon is not running.")
+            return 1
+        _daemon_request("stop")
+        print("✅ hop2 daemon stopped.")
+        return 0
 
-    if version == "2.0" and "database" in backup_data:
-        # New format with database structure
-        directories = backup_data["database"].get("directories", [])
-        commands = backup_data["database"].get("commands", [])
-    else:
-        # Old format (v1.0) - flat structure
-        directories = backup_data.get("directories", [])
-        commands = backup_data.get("commands", [])
+    if reply:
+        print(f"✅ hop2 daemon is already running (pid {reply.split()[-1]}).")
+        return 0
 
-    # Ask for confirmation
-    print(f"\n📦 Restore from: {filename}")
-    print(f"   • Format version: {version}")
-    print(f"   • {len(directories)} directories")
-    print(f"   • {len(commands)} commands")
-    print("\n⚠️  This will merge with existing shortcuts.")
-    ans = input("Continue? [y/N]: ")
-    if ans.lower() != 'y':
-        print("❌ Restore cancelled.")
+    init_db()
+    # Double fork so the daemon is not tied to the invoking shell
+    if os.fork():
+        import time
+        for _ in range(50):
+            if _daemon_request("ping"):
+                print(f"✅ hop2 daemon started on {DAEMON_SOCK}")
+                return 0
+            time.sleep(0.02)
+        print("❌ hop2 daemon failed to start.")
         return 1
-
-    restored = {"dirs": 0, "cmds": 0}
-
-    with get_conn() as conn:
-        c = conn.cursor()
-
-        # Restore directories
-        for d in directories:
-            try:
-                c.execute("""
-                    INSERT OR REPLACE INTO directories (alias, path, created_at, uses) 
-                    VALUES (?, ?, ?, ?)
-                """, (d['alias'], d['path'], d.get('created_at'), d.get('uses', 0)))
-                restored["dirs"] += 1
-            except Exception as e:
-                print(f"⚠️  Skipped directory {d['alias']}: {e}")
-
-        # Restore commands
-        for cmd in commands:
-            try:
-                c.execute("""
-                    INSERT OR REPLACE INTO commands (alias, command, created_at, uses) 
-                    VALUES (?, ?, ?, ?)
-                """, (cmd['alias'], cmd['command'], cmd.get('created_at'), cmd.get('uses', 0)))
-                restored["cmds"] += 1
-            except Exception as e:
-                print(f"⚠️  Skipped command {cmd['alias']}: {e}")
-
-    print(f"\n✅ Restore complete!")
-    print(f"   • Restored {restored['dirs']} directories")
-    print(f"   • Restored {restored['cmds']} commands")
-    return 0
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.chdir("/")
+    try:
+        _ResolverDaemon().serve()
+    finally:
+        os._exit(0)
 
 
 def update_me(_=None):
+    import subprocess
+    import tempfile
+    import urllib.request
+
     print("Updating hop2...")
     tmp = None
     try:
@@ -445,6 +4215,7 @@ def _get_windows_documents():
             docs_raw, _ = winreg.QueryValueEx(key, 'Personal')
             return os.path.expandvars(docs_raw)
     except Exception:
+        from pathlib import Path
         return str(Path.home() / 'Documents')
 
 
@@ -548,6 +4319,9 @@ def _clean_unix_rc(rc_filename, errors):
 
 def uninstall_me(_=None):
     """A comprehensive uninstaller that removes files and cleans up shell configs."""
+    import shutil
+    from pathlib import Path
+
     print("\n🗑️  Are you sure you want to uninstall hop2?\n")
     ans = input("This will remove the executable, data, and the source line from your shell config.\n"
                 "Type 'yes' to confirm: ")
@@ -642,8 +4416,253 @@ def uninstall_me(_=None):
     return 0
 
 
+def _cached_aliases():
+    """Sorted alias list from the completion cache, rebuilt if it is missing."""
+    if not os.path.exists(COMPLETION_CACHE):
+        if not os.path.exists(DB_PATH):
+            return []
+        _write_alias_files()
+    try:
+        with open(COMPLETION_CACHE, encoding="utf-8") as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+def _prefix_matches(words, prefix):
+    """Entries of the sorted list *words* that start with *prefix* (binary search)."""
+    import bisect
+    start = bisect.bisect_left(words, prefix)
+    end = bisect.bisect_left(words, prefix + "\U0010ffff", start)
+    return words[start:end]
+
+
+def complete(args):
+    """`hop2 __complete [--after WORD] [PREFIX]`: print completion candidates.
+
+    Without --after, completes the first word (sub-commands and aliases).
+    With it, completes the argument following WORD. "__files__" and
+    "__dirs__" tell the caller to fall back to filename completion.
+    """
+    after = None
+    if len(args) >= 2 and args[0] == "--after":
+        after, args = args[1], args[2:]
+    prefix = args[0] if args else ""
+
+    if after in (None, "go") and "/" in prefix:
+        candidates = _complete_subpath(prefix)
+    elif after is None:
+        candidates = sorted(set(_prefix_matches(_cached_aliases(), prefix))
+                            | {a for a in _project_aliases()[0] if a.startswith(prefix)}
+                            | {w for w in COMPLETION_WORDS if w.startswith(prefix)})
+    elif after == "go":
+        # Everything hop2 <alias> can reach here, project files included
+        candidates = sorted(set(_prefix_matches(_cached_aliases(), prefix))
+                            | {a for a in _project_aliases()[0] if a.startswith(prefix)})
+    elif after == "rm":
+        candidates = _prefix_matches(_cached_aliases(), prefix)
+    elif after in ("each", "stats"):
+        # Command aliases only
+        conn = _connect_ro()
+        try:
+            candidates = [r[0] for r in conn.execute(
+                "SELECT alias FROM commands WHERE alias >= ? AND alias < ? ORDER BY alias",
+                (prefix, prefix + "\U0010ffff"))]
+        finally:
+            conn.close()
+        candidates = sorted(set(candidates) | {a for a, (kind, _, _) in _project_aliases()[0].items()
+                                               if kind == "c" and a.startswith(prefix)})
+    elif after in ("--restore", "--backup", "--batch", "allow", "deny"):
+        candidates = ["__files__"]
+    elif after == "--daemon":
+        candidates = [w for w in ("start", "stop", "status") if w.startswith(prefix)]
+    elif after == "--from":
+        candidates = [w for w in sorted(IMPORTERS) if w.startswith(prefix)]
+    elif after == "--on-conflict":
+        candidates = [w for w in ("skip", "overwrite", "rename") if w.startswith(prefix)]
+    elif after in ("list", "ls"):
+        candidates = [w for w in ("--dirs", "--cmds", "--under", "--top", "--limit",
+                                  "--offset", "--json", "--tsv") if w.startswith(prefix)]
+    elif after == "profile":
+        candidates = [w for w in ("report", "clear") if w.startswith(prefix)]
+    elif after == "doctor":
+        candidates = [w for w in ("--fix", "--prune", "--timeout") if w.startswith(prefix)]
+    elif after in ("--under", "sync"):
+        candidates = ["__dirs__"]
+    elif after == "--format":
+        candidates = [w for w in ("json", "ndjson") if w.startswith(prefix)]
+    elif after == "snapshot":
+        candidates = [w for w in ("create", "list", "restore", "prune") if w.startswith(prefix)]
+    elif after == "restore":
+        candidates = [n for n in reversed(_list_snapshots()) if n.startswith(prefix)]
+    else:
+        candidates = []
+    if candidates:
+        sys.stdout.write("\n".join(candidates) + "\n")
+    return 0
+
+
+def _frecency(uses, last_used, now):
+    """Score an alias by use count, weighted by how recently it was used."""
+    age = now - (last_used or 0)
+    if age < 3600:
+        weight = 4.0
+    elif age < 86400:
+        weight = 2.0
+    elif age < 7 * 86400:
+        weight = 0.5
+    else:
+        weight = 0.25
+    return (uses or 0) * weight
+
+
+def resolve_prefix(prefix):
+    """Best alias starting with *prefix*, as (kind, alias, target, candidates).
+
+    A range scan on the alias primary keys finds the candidates; a unique hit
+    wins outright, otherwise the highest frecency wins, ties broken by name.
+    """
+    import time
+
+    end = prefix + "\U0010ffff"
+    conn = _connect_ro()
+    try:
+        rows = conn.execute(
+            "SELECT 'd', alias, path, uses, last_used FROM directories WHERE alias >= ? AND alias < ? "
+            "UNION ALL "
+            "SELECT 'c', alias, command, uses, last_used FROM commands WHERE alias >= ? AND alias < ?",
+            (prefix, end, prefix, end)).fetchall()
+    finally:
+        conn.close()
+    rows = [r for r in rows if r[1] not in SUBCOMMANDS]
+    if not rows:
+        return None
+    now = time.time()
+    kind, alias, target, _, _ = min(rows, key=lambda r: (-_frecency(r[3], r[4], now), r[1], r[0]))
+    return kind, alias, target, len(rows)
+
+
+def resolve_alias(alias, extra_args):
+    """Jump to a directory alias or run a command alias. Returns an exit code."""
+    if not os.path.exists(DB_PATH):
+        init_db()
+    if not os.path.exists(COMPLETION_CACHE):
+        # First run after an upgrade: give the shell integration its files
+        init_db()
+        _write_alias_files()
+
+    # Aliases from .hop2.toml/.hop2.json files above the cwd win
+    project, skipped = _project_aliases()
+    _mark("project")
+    for path, reason, names in skipped:
+        if reason == "untrusted" and alias in names and alias not in project:
+            print(f"⚠️  Ignoring '{alias}' from {path}: not allowed, or changed since (review it, then 'hop2 allow')",
+                  file=sys.stderr)
+    if alias in project:
+        kind, target, _ = project[alias]
+        if kind == "c":
+            return _run_command_line(target, extra_args, alias)
+        if extra_args:
+            print(f"❌ Directory shortcuts do not accept arguments. Did you mean 'cd {target}'?")
+            return 1
+        print(f"__HOP2_CD:{target}")
+        return 0
+
+    # hop2.idx answers without SQLite while it is fresh
+    hit = _index_lookup(alias)
+    if hit is None:
+        path = get_directory(alias)
+    elif hit[0] == "d":
+        _record_use("d", alias)
+        path = hit[1]
+    else:
+        path = None
+    if path:
+        if extra_args:
+            # New emoji for this error
+            print(f"❌ Directory shortcuts do not accept arguments. Did you mean 'cd {path}'?")
+            return 1
+        print(f"__HOP2_CD:{path}")
+        return 0
+
+    if hit and hit[0] == "c":
+        _record_use("c", alias)
+        return _run_command_line(hit[1], extra_args, alias)
+    if hit is None or hit[0] == "x":
+        code = run_command(alias, extra_args)
+        if code is not None:
+            return code
+
+    # alias/sub/path: a directory below a directory alias
+    if "/" in alias:
+        head, _, rest = alias.partition("/")
+        root = _subpath_root(head)
+        target = os.path.normpath(os.path.join(root, rest)) if root else None
+        if target and os.path.isdir(target):
+            if extra_args:
+                print(f"❌ Directory shortcuts do not accept arguments. Did you mean 'cd {target}'?")
+                return 1
+            if head not in project:
+                _record_use("d", head)
+            print(f"__HOP2_CD:{target}")
+            return 0
+
+    # Opt-in: an unambiguous or best-ranked prefix of an alias
+    if os.environ.get("HOP2_PREFIX") == "1":
+        match = resolve_prefix(alias)
+        if match:
+            _, full, _, candidates = match
+            if candidates > 1:
+                print(f"↪ '{alias}' → {full} (best of {candidates} matches)", file=sys.stderr)
+            return resolve_alias(full, extra_args)
+
+    # New emoji for the final "not found" error
+    print(f"❌ No shortcut '{alias}' found. Try 'hop2 list'.")
+    return 1
+
+
+def snapshot_command(a, assume_yes=False):
+    if a.action == 'list':
+        return list_snapshots()
+    if a.action == 'prune':
+        print(f"✅ Pruned {_prune_snapshots()} snapshot(s)")
+        return 0
+    if a.action == 'restore':
+        if not a.name:
+            print("❌ Which snapshot? Try 'hop2 snapshot list'.")
+            return 1
+        return restore_snapshot(a.name, assume_yes)
+    return create_snapshot(a.quiet)
+
+
 def main():
-    # Use argparse from the start to handle flags like --uninstall and --help
+    # Hot path: a bare alias is resolved before argparse (or anything else
+    # outside os/sys/sqlite3) is imported.
+    global _PROFILE, _FRESH
+    argv = sys.argv[1:]
+    while argv and argv[0] in ('--profile', '--fresh'):
+        if argv[0] == '--profile':
+            _PROFILE = _PROFILE or "1"
+        else:
+            _FRESH = True
+        del sys.argv[1]
+        argv = argv[1:]
+    if _PROFILE:
+        import atexit
+        atexit.register(_profile_flush)
+        _mark("import")
+    if argv and argv[0] == '__complete':
+        sys.exit(complete(argv[1:]))
+    if argv and argv[0] == '__index':
+        sys.exit(index_trees(argv[1:]))
+    if argv and argv[0] == '__reindex':
+        sys.exit(reindex())
+    if argv and argv[0] not in SUBCOMMANDS and not argv[0].startswith('-'):
+        sys.exit(resolve_alias(argv[0], argv[1:]))
+
+    import argparse
+
+    # Use argparse to handle flags like --uninstall and --help
     parser = argparse.ArgumentParser(
         description="hop2 - Quick directory jumping and command aliasing",
         add_help=False  # We use a custom help function
@@ -653,10 +4672,28 @@ def main():
     parser.add_argument('--update', action='store_true', help="Update hop2 to the latest version.")
     parser.add_argument('--backup', nargs='?', const=True, metavar='FILE',
                         help="Backup hop2 data to JSON file (default: hop2_backup_TIMESTAMP.json)")
-    parser.add_argument('--restore', metavar='FILE', help="Restore hop2 data from JSON backup file")
+    parser.add_argument('--restore', metavar='FILE', help="Restore hop2 data from a JSON/NDJSON backup file")
+    parser.add_argument('--format', choices=['json', 'ndjson'],
+                        help="Backup format (default: from the file extension, else json)")
+    parser.add_argument('--batch', nargs='?', const='-', metavar='FILE',
+                        help="Apply add/cmd/rm lines from FILE (default: stdin) in one transaction")
+    parser.add_argument('--dry-run', action='store_true', help="With --batch: check and report, change nothing")
+    parser.add_argument('-y', '--yes', action='store_true', help="Don't ask for confirmation")
+    parser.add_argument('--daemon', nargs='?', const='start', choices=['start', 'stop', 'status'],
+                        help="Run the resolver daemon in the background")
 
-    # Parse only the known flags, leave the rest for sub-command/alias handling
-    args, remainder = parser.parse_known_args()
+    # Parse only the known flags, leave the rest for sub-command/alias handling.
+    # A sub-command's arguments are its own: `hop2 cmd up apt-get upgrade -y`
+    # must not lose its -y to the top-level --yes.
+    if argv and argv[0] in SUBCOMMANDS:
+        args, remainder = parser.parse_args([]), argv
+    else:
+        args, remainder = parser.parse_known_args()
+    _mark("argparse")
+    if args.dry_run and not args.batch:
+        # Only --batch has a dry run; `--restore F --dry-run` would restore for real
+        print("❌ --dry-run only works with --batch", file=sys.stderr)
+        sys.exit(2)
 
     # Handle top-level flags immediately
     if args.help:
@@ -673,14 +4710,19 @@ def main():
 
     if args.backup:
         if args.backup is True:
-            backup_data()
+            backup_data(fmt=args.format)
         else:
-            backup_data(args.backup)
+            backup_data(args.backup, args.format)
         sys.exit(0)
 
     if args.restore:
-        restore_data(args.restore)
-        sys.exit(0)
+        sys.exit(restore_data(args.restore, args.yes))
+
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.dry_run))
+
+    if args.daemon:
+        sys.exit(daemon_control(args.daemon))
 
     # If no remaining args, show help
     if not remainder:
@@ -696,31 +4738,11 @@ def main():
         sys.argv[1] = 'list'
         command_to_run = 'list'
 
-    known_subcommands = {'add', 'cmd', 'list', 'rm'}
     init_db()
 
-    # If it's NOT a known subcommand, treat it as a custom alias
-    # In your main() function, update the alias-handling block:
-    # If it's NOT a known subcommand, treat it as a custom alias
-    if command_to_run not in known_subcommands:
-        alias = command_to_run
-        extra_args = sys.argv[2:]
-
-        path = get_directory(alias)
-        if path:
-            if extra_args:
-                # New emoji for this error
-                print(f"❌ Directory shortcuts do not accept arguments. Did you mean 'cd {path}'?")
-                sys.exit(1)
-            print(f"__HOP2_CD:{path}")
-            sys.exit(0)
-
-        if run_command(alias, extra_args):
-            sys.exit(0)
-
-        # New emoji for the final "not found" error
-        print(f"❌ No shortcut '{alias}' found. Try 'hop2 list'.")
-        sys.exit(1)
+    # Anything else is an alias (e.g. reached after an unrecognised flag)
+    if command_to_run not in SUBCOMMANDS:
+        sys.exit(resolve_alias(command_to_run, sys.argv[2:]))
 
     # If we are here, it IS a known subcommand, so use a new parser
     sub_parser = argparse.ArgumentParser(add_help=False)
@@ -734,23 +4756,98 @@ def main():
 
     p_cmd = sp.add_parser('cmd')
     p_cmd.add_argument('alias')
-    p_cmd.add_argument('cmd_str', nargs='+')
-    p_cmd.set_defaults(func=lambda a: add_command(a.alias, a.cmd_str))
+    p_cmd.add_argument('cmd_str', nargs='*')
+    p_cmd.add_argument('--cache', metavar='TTL')
+    p_cmd.add_argument('--watch', action='append', default=[], metavar='FILE')
+    p_cmd.add_argument('--step', action='append', default=[], metavar='NAME[:DEP,...]')
+    p_cmd.set_defaults(func=lambda a: add_command(a.alias, a.cmd_str, a.cache, a.watch, a.step))
 
     p_list = sp.add_parser('list')
-    p_list.set_defaults(func=lambda a: list_all())
+    kind = p_list.add_mutually_exclusive_group()
+    kind.add_argument('--dirs', dest='kind', action='store_const', const='d')
+    kind.add_argument('--cmds', dest='kind', action='store_const', const='c')
+    p_list.add_argument('--under', metavar='PATH')
+    p_list.add_argument('--top', type=int, metavar='N')
+    p_list.add_argument('--limit', type=int, metavar='N')
+    p_list.add_argument('--offset', type=int, default=0, metavar='N')
+    fmt = p_list.add_mutually_exclusive_group()
+    fmt.add_argument('--json', dest='fmt', action='store_const', const='json', default='human')
+    fmt.add_argument('--tsv', dest='fmt', action='store_const', const='tsv')
+    p_list.set_defaults(func=lambda a: list_all(a.kind, a.under, a.top, a.limit, a.offset, a.fmt))
+
+    p_find = sp.add_parser('find')
+    p_find.add_argument('text')
+    p_find.add_argument('--limit', type=int, default=20, metavar='N')
+    fmt = p_find.add_mutually_exclusive_group()
+    fmt.add_argument('--json', dest='fmt', action='store_const', const='json', default='human')
+    fmt.add_argument('--tsv', dest='fmt', action='store_const', const='tsv')
+    p_find.set_defaults(func=lambda a: find_shortcuts(a.text, a.limit, a.fmt))
 
     p_rm = sp.add_parser('rm')
     p_rm.add_argument('alias')
     p_rm.set_defaults(func=lambda a: remove_shortcut(a.alias))
 
+    p_each = sp.add_parser('each')
+    p_each.add_argument('alias')
+    p_each.add_argument('targets', nargs='*')
+    p_each.add_argument('--under', metavar='PATH')
+    p_each.add_argument('-j', '--jobs', type=int, metavar='N')
+    p_each.add_argument('--buffer', action='store_true')
+    p_each.add_argument('--fail-fast', action='store_true')
+    p_each.set_defaults(func=lambda a: run_each(a.alias, a.targets, a.under, a.jobs, a.buffer, a.fail_fast))
+
+    p_doctor = sp.add_parser('doctor')
+    p_doctor.add_argument('--prune', action='store_true')
+    p_doctor.add_argument('--fix', action='store_true')
+    p_doctor.add_argument('--timeout', type=float, default=DOCTOR_TIMEOUT, metavar='SECONDS')
+    p_doctor.set_defaults(func=lambda a: doctor(a.prune, a.fix, a.timeout))
+
+    p_suggest = sp.add_parser('suggest')
+    p_suggest.add_argument('--limit', type=int, default=10, metavar='N')
+    p_suggest.set_defaults(func=lambda a: suggest_aliases(a.limit))
+
+    p_profile = sp.add_parser('profile')
+    p_profile.add_argument('action', nargs='?', default='report', choices=['report', 'clear'])
+    p_profile.add_argument('--file', metavar='FILE')
+    p_profile.set_defaults(func=lambda a: profile_report(a.action, a.file))
+
+    for verb in ('allow', 'deny'):
+        p_allow = sp.add_parser(verb)
+        p_allow.add_argument('file', nargs='?')
+        p_allow.set_defaults(func=lambda a: allow_project(a.file, a.command == 'deny'))
+
+    p_stats = sp.add_parser('stats')
+    p_stats.add_argument('alias', nargs='?')
+    p_stats.add_argument('--days', type=int, default=STATS_DAYS, metavar='N')
+    p_stats.set_defaults(func=lambda a: run_stats(a.alias, max(1, a.days)))
+
+    p_import = sp.add_parser('import')
+    p_import.add_argument('--from', dest='source', required=True, choices=sorted(IMPORTERS))
+    p_import.add_argument('--on-conflict', choices=['skip', 'overwrite', 'rename'], default='skip')
+    p_import.add_argument('--keep-missing', action='store_true')
+    p_import.add_argument('file')
+    p_import.set_defaults(func=lambda a: import_shortcuts(a.source, a.file, a.on_conflict, a.keep_missing))
+
+    p_snap = sp.add_parser('snapshot')
+    p_snap.add_argument('action', nargs='?', default='create', choices=['create', 'list', 'restore', 'prune'])
+    p_snap.add_argument('name', nargs='?')
+    p_snap.add_argument('-q', '--quiet', action='store_true')
+    p_snap.add_argument('-y', '--yes', action='store_true')
+    p_snap.set_defaults(func=lambda a: snapshot_command(a, a.yes or args.yes))
+
+    p_sync = sp.add_parser('sync')
+    p_sync.add_argument('directory', nargs='?')
+    p_sync.set_defaults(func=lambda a: sync(a.directory))
+
     p = sp.add_parser('update', help='Alias for update')
     p.set_defaults(func=lambda a: update_me())
 
     try:
         parsed_args = sub_parser.parse_args()
+        _mark("parse")
         if hasattr(parsed_args, 'func'):
             code = parsed_args.func(parsed_args)
+            _mark("command")
             sys.exit(code if isinstance(code, int) else 0)
     except SystemExit as e:
         sys.exit(e.code)
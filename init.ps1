@@ -81,10 +81,14 @@ Register-ArgumentCompleter -CommandName @('hop2', 'h') -ScriptBlock {
         '--backup', '--restore', '--update', '--uninstall', '--help'
     )
 
+    $cachePath = Join-Path $HOME '.hop2\completions'
     $dbPath = Join-Path $HOME '.hop2\hop2.db'
     $userAliases = @()
 
-    if (Test-Path $dbPath) {
+    if (Test-Path $cachePath) {
+        # Sorted alias list that hop2 rewrites whenever shortcuts change
+        $userAliases = @(Get-Content -LiteralPath $cachePath | Where-Object { $_ -ne '' })
+    } elseif (Test-Path $dbPath) {
         try {
             # Detect Python (can't rely on module-scope variable inside ScriptBlock)
             $pyExe = @('python', 'python3', 'py') |
@@ -92,9 +96,8 @@ Register-ArgumentCompleter -CommandName @('hop2', 'h') -ScriptBlock {
                      Select-Object -First 1
 
             if ($pyExe) {
-                # Pass the DB path as sys.argv[1] to avoid quoting/injection issues
-                $pyCode = "import sqlite3,sys; conn = sqlite3.connect(sys.argv[1]); c = conn.cursor(); c.execute('SELECT alias FROM directories UNION SELECT alias FROM commands'); [print(r[0]) for r in c.fetchall()]; conn.close()"
-                $result = & $pyExe -c $pyCode $dbPath 2>$null
+                # hop2 builds the completion cache and prints the aliases
+                $result = & $pyExe (Join-Path $HOME '.hop2\hop2.py') __complete --after rm 2>$null
                 if ($result) {
                     # .Trim() strips any trailing \r left over from Python's \r\n on Windows
                     $userAliases = @($result | ForEach-Object { $_.Trim() } | Where-Object { $_ -ne '' })
@@ -3,6 +3,102 @@
 # Add this to your ~/.bashrc or ~/.zshrc:
 # source ~/.hop2/init.sh
 
+# Talk to the resolver daemon (`hop2 --daemon`) without starting Python.
+# zsh has native Unix sockets; bash needs socat. The reply ends up in
+# __HOP2_REPLY so no command substitution (and no fork) is needed in zsh.
+__HOP2_SOCK="$HOME/.hop2/hop2.sock"
+__HOP2_REPLY=""
+if [ -n "$ZSH_VERSION" ] && zmodload zsh/net/socket 2>/dev/null; then
+    __hop2_daemon_query() {
+        __HOP2_REPLY=""
+        [ -S "$__HOP2_SOCK" ] || return 1
+        zsocket "$__HOP2_SOCK" 2>/dev/null || return 1
+        local fd=$REPLY
+        print -r -u $fd -- "$1"
+        IFS= read -r -u $fd __HOP2_REPLY
+        exec {fd}>&-
+    }
+elif command -v socat >/dev/null 2>&1; then
+    __hop2_daemon_query() {
+        __HOP2_REPLY=""
+        [ -S "$__HOP2_SOCK" ] || return 1
+        __HOP2_REPLY=$(printf '%s\n' "$1" | socat -t 1 - "UNIX-CONNECT:$__HOP2_SOCK" 2>/dev/null)
+    }
+else
+    __hop2_daemon_query() { __HOP2_REPLY=""; return 1; }
+fi
+
+# Compiled alias table. hop2 rewrites ~/.hop2/aliases.sh whenever shortcuts
+# change; its first line carries a generation stamp, and we re-source it only
+# when that stamp changes. Needs associative arrays (zsh, or bash >= 4.2).
+__HOP2_TABLE="$HOME/.hop2/aliases.sh"
+__HOP2_USAGE_LOG="$HOME/.hop2/usage.log"
+__HOP2_RUNS_LOG="$HOME/.hop2/runs.log"
+__HOP2_TABLE_GEN=""
+[ -n "$ZSH_VERSION" ] && zmodload zsh/datetime 2>/dev/null  # for EPOCHSECONDS
+
+# Record a hop as "d|c<TAB>alias<TAB>epoch-seconds" for hop2 to fold in later
+__hop2_log_use() {
+    local now="$EPOCHSECONDS"
+    if [ -z "$now" ] && [ -n "$BASH_VERSION" ]; then
+        printf -v now '%(%s)T' -1
+    fi
+    printf '%s\t%s\t%s\n' "$1" "$2" "$now" >> "$__HOP2_USAGE_LOG"
+}
+if [ -n "$ZSH_VERSION" ] || { [ -n "$BASH_VERSION" ] && \
+    { [ "${BASH_VERSINFO[0]}" -gt 4 ] || { [ "${BASH_VERSINFO[0]}" -eq 4 ] && [ "${BASH_VERSINFO[1]}" -ge 2 ]; }; }; }; then
+    __hop2_load_table() {
+        [ -r "$__HOP2_TABLE" ] || return 1
+        local _hash _name _alias _table gen
+        read -r _hash _name _alias _table gen < "$__HOP2_TABLE" || return 1
+        if [ "$gen" != "$__HOP2_TABLE_GEN" ]; then
+            . "$__HOP2_TABLE" || return 1
+            __HOP2_TABLE_GEN=$gen
+        fi
+    }
+else
+    __hop2_load_table() { return 1; }
+fi
+
+# Is there a .hop2.toml/.hop2.json in $PWD or above? Builtins only. When
+# there is, hops go to hop2, which layers those project aliases on top.
+__hop2_in_project() {
+    local d="$PWD"
+    while :; do
+        [ -f "$d/.hop2.toml" ] || [ -f "$d/.hop2.json" ] && return 0
+        [ -z "$d" ] || [ "$d" = "/" ] && return 1
+        d="${d%/*}"
+    done
+}
+
+# The time in __HOP2_NOW: epoch seconds, with microseconds where the shell
+# has EPOCHREALTIME (bash 5, zsh). Builtins only.
+__hop2_now() {
+    __HOP2_NOW="${EPOCHREALTIME:-$EPOCHSECONDS}"
+    if [ -z "$__HOP2_NOW" ] && [ -n "$BASH_VERSION" ]; then
+        printf -v __HOP2_NOW '%(%s)T' -1
+    fi
+}
+
+# Run a command alias in a subshell of the user's own shell, so output
+# streams live, interactive commands work and nothing else stays resident.
+# With an alias name, the run is appended to runs.log for `hop2 stats`:
+# "alias<TAB>start<TAB>end<TAB>exit code<TAB>cwd".
+__hop2_exec() {
+    echo "→ Running: $1"
+    if [ -z "$2" ] || [ "$HOP2_RUNS" = 0 ]; then
+        ( eval "$1" )
+        return
+    fi
+    local start code
+    __hop2_now; start=$__HOP2_NOW
+    ( eval "$1" )
+    code=$?
+    __hop2_now
+    printf '%s\t%s\t%s\t%s\t%s\n' "$2" "$start" "$__HOP2_NOW" "$code" "$PWD" >> "$__HOP2_RUNS_LOG"
+    return $code
+}
+
 # Main hop2 function that handles directory changes and command shortcuts
 hop2() {
     # Don't do anything if no arguments are provided
@@ -11,30 +107,87 @@ hop2() {
         return
     fi
 
-    local output
-    # If the user asked to uninstall, update, backup, or restore, run hop2 directly (no capture),
-    # so prompts and input() work as expected:
-    if [ "$1" = "--uninstall" ] || [ "$1" = "--update" ] || [ "$1" = "--backup" ] || [ "$1" = "--restore" ]; then
-        command hop2 "$@"
-        return $?
+    local output target exit_code trace="" profile="$HOP2_PROFILE"
+    # --profile: time hop2's phases. Skips the in-shell table and the daemon
+    # so the hop goes through Python; HOP2_T0 lets it time its own startup.
+    if [ "$1" = "--profile" ] && [ "$#" -gt 1 ]; then
+        shift
+        trace=1
+        profile="${HOP2_PROFILE:-1}"
     fi
 
-    # Otherwise capture output so we can intercept __HOP2_CD:… sequences
-    output=$(command hop2 "$@")
+    # Sub-commands and flags never hand back a directory or a command, so run
+    # hop2 directly (no capture): prompts, input() and live output just work.
+    case "$1" in
+        add|cmd|list|ls|rm|find|doctor|suggest|profile|import|snapshot|sync|each|stats|allow|deny|-*)
+            HOP2_PROFILE="$profile" HOP2_T0="${EPOCHREALTIME:-}" command hop2 "$@"
+            return $?;;
+    esac
+
+    # Project files can override any global alias, so let hop2 decide
+    __hop2_in_project && trace=1
+
+    # Resolve from the compiled table without starting Python. Usage is
+    # appended to a log that hop2 folds into the database later.
+    if [ -z "$trace" ] && __hop2_load_table; then
+        target="${__HOP2_DIRS[$1]}"
+        if [ -n "$target" ] && [ "$#" -eq 1 ]; then
+            __hop2_log_use d "$1"
+            cd "$target" || return 1
+            return 0
+        fi
+        # alias/sub/path below a directory alias
+        if [[ $1 == ?*/* ]] && [ "$#" -eq 1 ]; then
+            target="${__HOP2_DIRS[${1%%/*}]}"
+            if [ -n "$target" ] && [ -d "$target/${1#*/}" ]; then
+                __hop2_log_use d "${1%%/*}"
+                cd "$target/${1#*/}" || return 1
+                return 0
+            fi
+        fi
+        target="${__HOP2_CMDS[$1]}"
+        if [ -n "$target" ]; then
+            __hop2_log_use c "$1"
+            local name="$1"
+            shift
+            [ "$#" -gt 0 ] && target="$target $*"
+            __hop2_exec "$target" "$name"
+            return $?
+        fi
+        # Cacheable commands: hop2 replays or records their output itself
+        if [ -n "${__HOP2_DIRECT[$1]}" ]; then
+            command hop2 "$@"
+            return $?
+        fi
+    fi
+
+    # A single alias may be a directory the daemon can resolve on its own
+    if [ -z "$trace" ] && [ "$#" -eq 1 ] && __hop2_daemon_query "resolve $1" \
+        && [[ $__HOP2_REPLY == __HOP2_CD:* ]]; then
+        cd "${__HOP2_REPLY#__HOP2_CD:}" || return 1
+        return 0
+    fi
+
+    # Otherwise ask hop2, which only resolves the alias and hands back either
+    # __HOP2_CD:<dir> or __HOP2_EXEC:<command> for us to carry out.
+    output=$(HOP2_SHELL=1 HOP2_PROFILE="$profile" HOP2_T0="${EPOCHREALTIME:-}" command hop2 "$@")
     exit_code=$?
 
-    # Check if the python script gave us the magic string to change directory
     if [[ $output == __HOP2_CD:* ]]; then
-        local path="${output#__HOP2_CD:}"
-        cd "$path" || return 1
+        target="${output#__HOP2_CD:}"
+        cd "$target" || return 1
+    elif [[ $output == __HOP2_EXEC:* ]]; then
+        __hop2_exec "${output#__HOP2_EXEC:}" "$1"
+        return $?
+    elif [ "$output" = "__HOP2_DIRECT" ]; then
+        HOP2_PROFILE="$profile" command hop2 "$@"
+        return $?
     elif [ $exit_code -ne 0 ]; then
         # If the script failed, print its output (which is the error message)
         # to stderr and preserve the exit code.
         echo "$output" >&2
         return $exit_code
-    elif [ -n "$output" ];then
-        # If the script succeeded and printed something, show it.
-        # This is for commands like 'hop2 gs' which print "→ Running...".
+    elif [ -n "$output" ]; then
         echo "$output"
     fi
 }
@@ -50,32 +203,111 @@ h() {
     fi
 }
 
+# Directory learning (opt-in: export HOP2_LEARN=1 before sourcing this file).
+# Each change of directory appends "epoch<TAB>path" to a per-session file
+# with shell builtins only; `hop2 suggest` (or the daemon) folds them in.
+if [ "${HOP2_LEARN:-0}" = 1 ]; then
+    __HOP2_VISITS="$HOME/.hop2/visits.d/$$.log"
+    [ -d "$HOME/.hop2/visits.d" ] || mkdir -p "$HOME/.hop2/visits.d"
+    __HOP2_LAST_PWD=""
+    __hop2_learn() {
+        [ "$PWD" = "$__HOP2_LAST_PWD" ] && return 0
+        __HOP2_LAST_PWD=$PWD
+        local now="$EPOCHSECONDS"
+        if [ -z "$now" ] && [ -n "$BASH_VERSION" ]; then
+            printf -v now '%(%s)T' -1
+        fi
+        printf '%s\t%s\n' "$now" "$PWD" >> "$__HOP2_VISITS"
+    }
+    if [ -n "$ZSH_VERSION" ]; then
+        (( ${chpwd_functions[(I)__hop2_learn]} )) || chpwd_functions+=(__hop2_learn)
+    else
+        case ";${PROMPT_COMMAND:-};" in
+            *";__hop2_learn;"*) ;;
+            *) PROMPT_COMMAND="__hop2_learn${PROMPT_COMMAND:+;$PROMPT_COMMAND}" ;;
+        esac
+    fi
+fi
+
+# Completion reads ~/.hop2/completions, the sorted alias list hop2 rewrites
+# whenever shortcuts change, so pressing Tab never starts Python or sqlite3.
+# `hop2 __complete` is only used when that cache does not exist yet.
+__HOP2_COMPLETIONS="$HOME/.hop2/completions"
+__HOP2_COMMANDS="add cmd list ls rm go find doctor suggest profile import snapshot sync each stats allow deny --profile --fresh --backup --restore --batch --daemon --update --uninstall --help"
+
 # Bash completion with ALL commands
 if [ -n "$BASH_VERSION" ]; then
+    __hop2_read_aliases() {
+      __HOP2_ALIASES=()
+      if __hop2_in_project; then
+        IFS=$'\n' read -r -d '' -a __HOP2_ALIASES < <(command hop2 __complete --after go 2>/dev/null)
+      elif [ -r "$__HOP2_COMPLETIONS" ]; then
+        IFS=$'\n' read -r -d '' -a __HOP2_ALIASES < "$__HOP2_COMPLETIONS"
+      else
+        IFS=$'\n' read -r -d '' -a __HOP2_ALIASES < <(command hop2 __complete --after rm 2>/dev/null)
+      fi
+      return 0
+    }
+
     _hop2_completion() {
-      local cur prev commands aliases
+      local cur prev
       cur="${COMP_WORDS[COMP_CWORD]}"
       prev="${COMP_WORDS[COMP_CWORD-1]}"
 
-      if (( COMP_CWORD == 1 )); then
-        commands="add cmd list ls rm go --update --uninstall --backup --restore --help"
+      # alias/sub/path: subdirectories come from hop2's background index
+      if [[ $cur == */* ]] && { (( COMP_CWORD == 1 )) || [ "$prev" = "go" ]; }; then
+        IFS=$'\n' read -r -d '' -a COMPREPLY < <(command hop2 __complete "$cur" 2>/dev/null)
+        compopt -o nospace 2>/dev/null
+        return
+      fi
 
-        aliases=$(sqlite3 ~/.hop2/hop2.db \
-          "SELECT alias FROM directories UNION SELECT alias FROM commands" 2>/dev/null \
-           | tr '\n' ' ')
-        COMPREPLY=( $(compgen -W "$commands $aliases" -- "$cur") )
+      if (( COMP_CWORD == 1 )); then
+        __hop2_read_aliases
+        COMPREPLY=( $(compgen -W "$__HOP2_COMMANDS ${__HOP2_ALIASES[*]}" -- "$cur") )
         return
       fi
 
       case "$prev" in
         rm|go)
-          aliases=$(sqlite3 ~/.hop2/hop2.db \
-            "SELECT alias FROM directories UNION SELECT alias FROM commands" 2>/dev/null \
-             | tr '\n' ' ')
-          COMPREPLY=( $(compgen -W "$aliases" -- "$cur") );;
-        --restore)
+          __hop2_read_aliases
+          COMPREPLY=( $(compgen -W "${__HOP2_ALIASES[*]}" -- "$cur") );;
+        --restore|--backup|--batch|allow|deny)
           COMPREPLY=( $(compgen -f -- "$cur") );;
-
+        --daemon)
+          COMPREPLY=( $(compgen -W "start stop status" -- "$cur") );;
+        --from)
+          COMPREPLY=( $(compgen -W "zoxide autojump z bash-aliases" -- "$cur") );;
+        --on-conflict)
+          COMPREPLY=( $(compgen -W "skip overwrite rename" -- "$cur") );;
+        --format)
+          COMPREPLY=( $(compgen -W "json ndjson" -- "$cur") );;
+        list|ls)
+          COMPREPLY=( $(compgen -W "--dirs --cmds --under --top --limit --offset --json --tsv" -- "$cur") );;
+        --under|sync)
+          COMPREPLY=( $(compgen -d -- "$cur") );;
+        doctor)
+          COMPREPLY=( $(compgen -W "--fix --prune --timeout" -- "$cur") );;
+        profile)
+          COMPREPLY=( $(compgen -W "report clear" -- "$cur") );;
+        snapshot)
+          COMPREPLY=( $(compgen -W "create list restore prune" -- "$cur") );;
+        each)
+          COMPREPLY=( $(compgen -W "$(command hop2 __complete --after each 2>/dev/null)" -- "$cur") );;
+        stats)
+          COMPREPLY=( $(compgen -W "--days $(command hop2 __complete --after stats 2>/dev/null)" -- "$cur") );;
+        restore)
+          [ "${COMP_WORDS[1]}" = "snapshot" ] && \
+            COMPREPLY=( $(compgen -W "$(command ls "$HOME/.hop2/snapshots" 2>/dev/null)" -- "$cur") );;
+        *)
+          # hop2 add <alias> <path>, hop2 import ... <file>
+          if [ "${COMP_WORDS[1]}" = "add" ] && (( COMP_CWORD == 3 )); then
+            COMPREPLY=( $(compgen -d -- "$cur") )
+          elif [ "${COMP_WORDS[1]}" = "each" ]; then
+            __hop2_read_aliases
+            COMPREPLY=( $(compgen -W "--under -j --buffer --fail-fast ${__HOP2_ALIASES[*]}" -- "$cur") )
+          elif [ "${COMP_WORDS[1]}" = "import" ]; then
+            COMPREPLY=( $(compgen -W "--from --on-conflict --keep-missing" -- "$cur") $(compgen -f -- "$cur") )
+          fi;;
       esac
     }
 
@@ -92,9 +324,54 @@ if [ -n "$ZSH_VERSION" ]; then
     fi
 
     _hop2() {
+        # alias/sub/path: subdirectories come from hop2's background index
+        if [[ $words[CURRENT] == */* ]] && { (( CURRENT == 2 )) || [[ $words[CURRENT-1] == go ]]; }; then
+            compadd -S '' -- ${(f)"$(command hop2 __complete "$words[CURRENT]" 2>/dev/null)"}
+            return
+        fi
+
         local -a all_aliases
-        all_aliases=(${(f)"$(sqlite3 ~/.hop2/hop2.db 'SELECT alias FROM directories UNION SELECT alias FROM commands' 2>/dev/null)"})
-        _arguments "1:command:(add cmd list ls rm --backup --restore --update --uninstall $all_aliases)"
+        if __hop2_in_project; then
+            all_aliases=(${(f)"$(command hop2 __complete --after go 2>/dev/null)"})
+        elif [[ -r $__HOP2_COMPLETIONS ]]; then
+            all_aliases=(${(f)"$(<$__HOP2_COMPLETIONS)"})
+        else
+            all_aliases=(${(f)"$(command hop2 __complete --after rm 2>/dev/null)"})
+        fi
+
+        if (( CURRENT == 2 )); then
+            compadd -- ${=__HOP2_COMMANDS} $all_aliases
+            return
+        fi
+
+        case $words[CURRENT-1] in
+            rm|go) compadd -a all_aliases ;;
+            --restore|--backup|--batch|allow|deny) _files ;;
+            --daemon) compadd start stop status ;;
+            --from) compadd zoxide autojump z bash-aliases ;;
+            --on-conflict) compadd skip overwrite rename ;;
+            --format) compadd json ndjson ;;
+            list|ls) compadd -- --dirs --cmds --under --top --limit --offset --json --tsv ;;
+            --under|sync) _files -/ ;;
+            doctor) compadd -- --fix --prune --timeout ;;
+            profile) compadd report clear ;;
+            snapshot) compadd create list restore prune ;;
+            each) compadd -- ${(f)"$(command hop2 __complete --after each 2>/dev/null)"} ;;
+            stats) compadd -- --days ${(f)"$(command hop2 __complete --after stats 2>/dev/null)"} ;;
+            restore)
+                [[ $words[2] == snapshot ]] && \
+                    compadd -- ${(f)"$(command ls "$HOME/.hop2/snapshots" 2>/dev/null)"} ;;
+            *)
+                # hop2 add <alias> <path>, hop2 import ... <file>
+                if [[ $words[2] == add ]] && (( CURRENT == 4 )); then
+                    _files -/
+                elif [[ $words[2] == each ]]; then
+                    compadd -- --under -j --buffer --fail-fast $all_aliases
+                elif [[ $words[2] == import ]]; then
+                    compadd -- --from --on-conflict --keep-missing
+                    _files
+                fi ;;
+        esac
     }
 
     # Only set up completion if compdef is available
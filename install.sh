@@ -63,10 +63,21 @@ else
     exit 1
 fi
 
-# 5) Install the hop2 binary and init script
-chmod +x "$TMP_HOP2"
-mv "$TMP_HOP2" "$INSTALL_DIR/hop2"
+# 5) Install the hop2 module, a thin launcher and the init script.
+# The module lives in ~/.hop2 and is imported by the launcher, so Python
+# caches its bytecode instead of recompiling the whole script on every hop.
+mv "$TMP_HOP2" "$HOME/.hop2/hop2.py"
 mv "$TMP_INIT" "$HOME/.hop2/init.sh"
+python3 -m compileall -q "$HOME/.hop2/hop2.py" || true
+cat > "$INSTALL_DIR/hop2" <<'EOF'
+#!/usr/bin/env python3
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.expanduser("~"), ".hop2"))
+from hop2 import main
+main()
+EOF
+chmod +x "$INSTALL_DIR/hop2"
 echo "✅  hop2 installed successfully to $INSTALL_DIR/hop2"
 
 # 6) Ensure shell integration is sourced in the correct file
@@ -0,0 +1,35 @@
+"""Fixtures: run hop2.py in a subprocess against a throwaway HOME."""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+HOP2 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hop2.py")
+
+
+class Hop2:
+    """Runs hop2 with HOME set to *home*; `hop2("list")` returns the CompletedProcess."""
+
+    def __init__(self, home):
+        self.home = home
+        self.env = {k: v for k, v in os.environ.items() if not k.startswith("HOP2_")}
+        self.env["HOME"] = str(home)
+
+    def __call__(self, *args, input=None, cwd=None):
+        return subprocess.run([sys.executable, HOP2, *args], env=self.env, input=input, cwd=cwd or self.home,
+                              capture_output=True, text=True, timeout=60)
+
+    def rows(self, query, params=()):
+        conn = sqlite3.connect(os.path.join(self.home, ".hop2", "hop2.db"))
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def hop2(tmp_path):
+    return Hop2(tmp_path)
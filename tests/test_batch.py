@@ -0,0 +1,45 @@
+"""`hop2 --batch`: NDJSON lines with wrongly typed fields are reported, not raised."""
+
+import json
+
+import pytest
+
+BAD_LINES = [
+    ({"op": "cmd", "alias": "b", "command": "true", "cache": [300]}, '"cache" must be'),
+    ({"op": "add", "alias": "c", "path": 5}, '"path" must be a string'),
+    ({"op": "cmd", "alias": "d", "command": "true", "watch": 5}, '"watch" must be'),
+    ({"op": "cmd", "alias": "e", "steps": [1]}, '"steps" must be'),
+    ({"op": "cmd", "alias": "f", "command": 5}, '"command" must be a string'),
+]
+
+
+def batch(*records):
+    return "".join(json.dumps(r) + "\n" for r in records)
+
+
+def test_bad_fields_are_reported_and_roll_back(hop2):
+    good = {"op": "add", "alias": "ok", "path": str(hop2.home)}
+    result = hop2("--batch", input=batch(good, *(r for r, _ in BAD_LINES)))
+    assert result.returncode == 1
+    assert "Traceback" not in result.stdout + result.stderr
+    assert f"{len(BAD_LINES)} of {len(BAD_LINES) + 1} operations failed" in result.stdout
+    for number, (_, message) in enumerate(BAD_LINES, 2):
+        assert f"line {number}: {message}" in result.stdout
+    assert hop2.rows("SELECT alias FROM directories") == []
+    assert hop2.rows("SELECT alias FROM commands") == []
+
+
+@pytest.mark.parametrize("record, message", BAD_LINES)
+def test_each_bad_field(hop2, record, message):
+    result = hop2("--batch", input=batch(record))
+    assert result.returncode == 1
+    assert f"line 1: {message}" in result.stdout
+
+
+def test_numeric_cache_is_seconds(hop2):
+    (hop2.home / "a.txt").write_text("")
+    result = hop2("--batch", input=batch({"op": "cmd", "alias": "a", "command": "true", "cache": 300},
+                                         {"op": "cmd", "alias": "w", "command": "true", "cache": "1m",
+                                          "watch": "a.txt"}))
+    assert result.returncode == 0, result.stdout
+    assert hop2.rows("SELECT alias, cache_ttl FROM commands ORDER BY alias") == [("a", 300), ("w", 60)]
@@ -0,0 +1,28 @@
+"""`hop2 doctor`: the exit status says whether anything is still broken."""
+
+
+def test_exit_status_follows_what_is_left(hop2):
+    (hop2.home / "here").mkdir()
+    (hop2.home / "gone").mkdir()
+    hop2("add", "here", str(hop2.home / "here"))
+    hop2("add", "gone", str(hop2.home / "gone"))
+    assert hop2("doctor").returncode == 0
+
+    (hop2.home / "gone").rmdir()
+    assert hop2("doctor").returncode == 1
+    assert hop2("doctor", "--fix").returncode == 1  # nothing to follow it to
+    result = hop2("doctor", "--prune")
+    assert result.returncode == 0, result.stdout
+    assert "Removed 1 shortcut" in result.stdout
+    assert hop2("doctor").returncode == 0
+    assert hop2.rows("SELECT alias FROM directories") == [("here",)]
+
+
+def test_fix_that_follows_every_move_exits_0(hop2):
+    (hop2.home / "a" / "proj").mkdir(parents=True)
+    hop2("add", "proj", str(hop2.home / "a" / "proj"))
+    (hop2.home / "a" / "sub").mkdir()
+    (hop2.home / "a" / "proj").rename(hop2.home / "a" / "sub" / "proj")
+    result = hop2("doctor", "--fix")
+    assert result.returncode == 0, result.stdout
+    assert hop2.rows("SELECT path FROM directories") == [(str(hop2.home / "a" / "sub" / "proj"),)]
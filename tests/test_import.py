@@ -0,0 +1,91 @@
+"""`hop2 import`: the sample files in data/import, conflicts and missing directories."""
+
+import os
+
+import pytest
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "import")
+DIR_SOURCES = {"zoxide": "zoxide.txt", "autojump": "autojump.txt", "z": "z.txt"}
+
+
+@pytest.fixture
+def sample(hop2):
+    """Copy a sample into HOME with /home/user pointing there; code/api and code/web exist."""
+    for name in ("api", "web"):
+        (hop2.home / "code" / name).mkdir(parents=True)
+
+    def copy(name):
+        with open(os.path.join(DATA, name), encoding="utf-8") as f:
+            text = f.read().replace("/home/user", str(hop2.home))
+        (hop2.home / name).write_text(text)
+        return str(hop2.home / name)
+    return copy
+
+
+def imported(hop2, source, path, *flags):
+    result = hop2("import", "--from", source, *flags, path)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def directories(hop2):
+    return dict(hop2.rows("SELECT alias, path FROM directories"))
+
+
+@pytest.mark.parametrize("source", sorted(DIR_SOURCES))
+def test_directories(hop2, sample, source):
+    out = imported(hop2, source, sample(DIR_SOURCES[source]))
+    assert directories(hop2) == {"api": str(hop2.home / "code" / "api"), "web": str(hop2.home / "code" / "web")}
+    assert hop2.rows("SELECT uses FROM directories WHERE alias = 'api'") == [(12,)]
+    assert "2 directories" in out and "1 skipped (directory no longer exists" in out
+
+
+@pytest.mark.parametrize("source", sorted(DIR_SOURCES))
+def test_keep_missing(hop2, sample, source):
+    imported(hop2, source, sample(DIR_SOURCES[source]), "--keep-missing")
+    assert directories(hop2)["old-project"] == str(hop2.home / "old project")
+
+
+def test_z_keeps_last_used(hop2, sample):
+    imported(hop2, "z", sample("z.txt"))
+    assert hop2.rows("SELECT last_used FROM directories WHERE alias = 'api'") == [(1700000300,)]
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("skip", {"api": "elsewhere"}),
+    ("overwrite", {"api": "code/api"}),
+    ("rename", {"api": "elsewhere", "api-2": "code/api"}),
+])
+def test_directory_conflicts(hop2, sample, mode, expected):
+    (hop2.home / "elsewhere").mkdir()
+    hop2("add", "api", str(hop2.home / "elsewhere"))
+    out = imported(hop2, "zoxide", sample("zoxide.txt"), "--on-conflict", mode)
+    found = directories(hop2)
+    assert {a: found[a] for a in expected} == {a: str(hop2.home / p) for a, p in expected.items()}
+    if mode == "skip":
+        assert "1 skipped" in out
+
+
+def test_importing_a_known_path_again_changes_nothing(hop2, sample):
+    path = sample("zoxide.txt")
+    imported(hop2, "zoxide", path)
+    out = imported(hop2, "zoxide", path, "--on-conflict", "rename")
+    assert "0 directories" in out
+    assert sorted(directories(hop2)) == ["api", "web"]
+
+
+def test_bash_aliases(hop2, sample):
+    out = imported(hop2, "bash-aliases", sample("bash_aliases"))
+    assert dict(hop2.rows("SELECT alias, command FROM commands")) == {
+        "gs": "git status",
+        "ll": "ls -alF",
+        "serve": "python3 -m http.server 8000",
+    }
+    assert "3 commands" in out
+
+
+@pytest.mark.parametrize("mode, expected", [("skip", "git status -s"), ("overwrite", "git status")])
+def test_command_conflicts(hop2, sample, mode, expected):
+    hop2("cmd", "gs", "git status -s")
+    imported(hop2, "bash-aliases", sample("bash_aliases"), "--on-conflict", mode)
+    assert hop2.rows("SELECT command FROM commands WHERE alias = 'gs'") == [(expected,)]
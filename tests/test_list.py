@@ -0,0 +1,43 @@
+"""`hop2 list`: one page over directories and commands together."""
+
+import pytest
+
+
+@pytest.fixture
+def listed(hop2):
+    for name in ("a", "b", "c"):
+        (hop2.home / name).mkdir()
+        hop2("add", name, str(hop2.home / name))
+        hop2("cmd", f"c{name}", "echo", name)
+    return hop2
+
+
+def aliases(result):
+    assert result.returncode == 0, result.stdout + result.stderr
+    return [line.split("\t")[0] for line in result.stdout.splitlines()]
+
+
+def test_limit_counts_both_kinds(listed):
+    assert aliases(listed("list", "--limit", "2", "--tsv")) == ["a", "b"]
+    assert aliases(listed("list", "--top", "2", "--tsv")) == ["a", "b"]
+
+
+def test_offset_pages_through_everything_once(listed):
+    everything = aliases(listed("list", "--tsv"))
+    pages = [aliases(listed("list", "--limit", "4", "--offset", str(o), "--tsv")) for o in (0, 4, 8)]
+    assert pages[0] + pages[1] == everything
+    assert len(everything) == 6 and pages[2] == []
+
+
+def test_top_ranks_both_kinds_by_uses(listed):
+    for _ in range(3):
+        listed("cb")
+    listed("b")
+    assert aliases(listed("list", "--top", "2", "--tsv")) == ["cb", "b"]
+
+
+def test_under_with_cmds_is_an_error(listed):
+    result = listed("list", "--cmds", "--under", str(listed.home))
+    assert result.returncode == 1
+    assert "--under" in result.stdout
+    assert aliases(listed("list", "--under", str(listed.home), "--tsv")) == ["a", "b", "c"]
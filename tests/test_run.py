@@ -0,0 +1,30 @@
+"""Running command aliases outside the shell integration."""
+
+import pytest
+
+
+@pytest.mark.parametrize("runs", ["0", "1"])
+def test_target_without_execute_bit_exits_126(hop2, runs):
+    script = hop2.home / "noexec"
+    script.write_text("#!/bin/sh\necho hi\n")
+    hop2("cmd", "nx", str(script))
+    hop2.env["HOP2_RUNS"] = runs
+    result = hop2("nx")
+    assert result.returncode == 126
+    assert "Permission denied" in result.stdout
+    assert "Traceback" not in result.stderr
+
+
+def recorded(hop2):
+    log = hop2.home / ".hop2" / "runs.log"
+    return log.read_text().splitlines() if log.exists() else []
+
+
+@pytest.mark.parametrize("runs, expected", [(None, 0), ("1", 1), ("0", 0)])
+def test_plain_runs_are_recorded_only_with_hop2_runs_1(hop2, runs, expected):
+    hop2("cmd", "hi", "echo", "hi")
+    if runs is not None:
+        hop2.env["HOP2_RUNS"] = runs
+    result = hop2("hi")
+    assert result.returncode == 0 and "hi" in result.stdout
+    assert len(recorded(hop2)) == expected